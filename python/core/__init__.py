@@ -32,6 +32,7 @@ For more information, please refer to the project documentation.
 from .roll import Roll
 from .frame import Frame
 from .recipe import TechnicalRecipe, CreativeRecipe
-from .calibration import RollCalibrationProfile
+from .calibration import RollCalibrationProfile, FrameStatistics, RollAnalysisState
 
-__all__ = ['Roll', 'Frame', 'TechnicalRecipe', 'CreativeRecipe', 'RollCalibrationProfile']
+__all__ = ['Roll', 'Frame', 'TechnicalRecipe', 'CreativeRecipe', 'RollCalibrationProfile', 'FrameStatistics',
+           'RollAnalysisState']
@@ -48,3 +48,30 @@ class RollCalibrationProfile:
 
     extrema_high_density_net: float
     clip_threshold: float
+
+
+@dataclass
+class FrameStatistics:
+    """存储单帧缩略图密度的归约结果。
+
+    每帧解码后立即归约为逐通道密度直方图、极值和一个小的降采样样本，
+    Dmin/Dmax、聚合直方图和k值三个分析阶段都由它完成，整幅密度随即释放。
+    """
+    histogram: np.ndarray        # (3, bins) 绝对密度在histogram_range上均分的逐通道计数
+    histogram_range: np.ndarray  # (2,) 直方图覆盖的密度范围，由该帧的有限密度值决定
+    density_low: np.ndarray      # 各通道最小有限密度，无有限值时为NaN
+    density_high: np.ndarray     # 各通道最大有限密度，无有限值时为NaN
+    k_sample: np.ndarray         # 长边不超过k值样本尺寸的降采样密度 (float64)，用于k值
+
+
+@dataclass
+class RollAnalysisState:
+    """记录一次分析中每帧对聚合结果的贡献，用于帧增删后的增量重新分析。
+
+    两组贡献分别附带计算它们时所用输入的键：Dmin/Dmax或相关配方改变后，
+    键不再匹配，对应的贡献即失效。
+    """
+    histogram_key: str
+    k_key: str
+    frame_histograms: dict[str, np.ndarray]   # 帧缓存键 -> (3, bins) 直方图计数
+    frame_k_values: dict[str, np.ndarray]     # 帧缓存键 -> k值
@@ -106,12 +106,57 @@ class ExportFormat(Enum):
     TIF_16_BIT = "tif16"
 
 
+EXPORT_EXTENSIONS = {
+    ExportFormat.JPG: "jpg",
+    ExportFormat.PNG: "png",
+    ExportFormat.TIF_8_BIT: "tif",
+    ExportFormat.TIF_16_BIT: "tif",
+}
+
+
+@dataclass
+class ExportOutput:
+    """一次导出中的一个输出文件。位深由格式决定（TIF_8_BIT / TIF_16_BIT）。"""
+    export_format: ExportFormat = ExportFormat.JPG
+    quality: int = 90  # 仅用于JPG格式 (1-100)
+    filename_suffix: str = "exported"
+    icc_bytes: bytes | None = None   # 输出色彩配置
+    max_size: int | None = None      # 长边像素上限，None表示保持全尺寸
+    dither: str | None = None        # 8位输出的抖动："ordered"、"blue_noise"，None表示不抖动
+    compression: str | None = None   # TIFF压缩："zlib"、"lzma"等，None表示不压缩
+
+    @property
+    def extension(self) -> str:
+        return EXPORT_EXTENSIONS[self.export_format]
+
+
 @dataclass
 class ExportRecipe:
-    """定义一次导出任务的所有参数。"""
+    """
+    定义一次导出任务的所有参数。
+
+    outputs为空时使用下面的单个输出设置；非空时每帧只渲染一次，
+    同时写出outputs中的所有文件（例如JPEG小样加16位TIFF母版）。
+    """
     export_format: ExportFormat = ExportFormat.JPG
     quality: int = 90  # 仅用于JPG格式 (1-100)
 
     output_directory: Path | None = None
     filename_suffix: str = "exported"
     icc_bytes: bytes | None = None   # 输出色彩配置
+    compression: str | None = None   # TIFF压缩："zlib"、"lzma"等，None表示不压缩
+    outputs: list[ExportOutput] = field(default_factory=list)
+
+    def resolved_outputs(self) -> list[ExportOutput]:
+        """返回本次导出的所有输出，并检查它们不会写到同一个文件。"""
+        outputs = self.outputs or [ExportOutput(
+            export_format=self.export_format,
+            quality=self.quality,
+            filename_suffix=self.filename_suffix,
+            icc_bytes=self.icc_bytes,
+            compression=self.compression,
+        )]
+        names = [(output.filename_suffix, output.extension) for output in outputs]
+        if len(set(names)) != len(names):
+            raise ValueError("Export outputs must differ in filename suffix or extension.")
+        return outputs
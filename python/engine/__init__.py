@@ -30,6 +30,7 @@ For more information, please refer to the project documentation.
 
 from .analyzer import Analyzer
 from .renderer import Renderer
+from .pipeline import RenderPipeline
 from .coordinator import AnalysisCoordinator
 
-__all__ = ['Analyzer', 'Renderer', 'AnalysisCoordinator']
+__all__ = ['Analyzer', 'Renderer', 'RenderPipeline', 'AnalysisCoordinator']
@@ -28,18 +28,31 @@ For more information, please refer to the project documentation.
 
 
 
+import os
+import hashlib
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
 import numpy as np
 import gc
 from tqdm import tqdm
 
 from core.roll import Roll
-from core.calibration import RollCalibrationProfile
+from core.frame import Frame
+from core.recipe import TechnicalRecipe
+from core.calibration import RollCalibrationProfile, FrameStatistics, RollAnalysisState
 from core.memory_manager import MemoryMonitor, force_memory_cleanup
 
 from processing import density as density_proc
 from processing import histogram as hist_proc
 from processing import alignment as align_proc
 from processing import image_loader as loader_proc
+from processing.pyramid_cache import ThumbnailPyramid
+
+from . import pipeline
 
 
 class Analyzer:
@@ -47,56 +60,69 @@ class Analyzer:
     负责分析一整卷胶卷，并生成校准配置文件。
     """
 
-    def __init__(self, memory_limit_mb: float = 800):
+    def __init__(
+        self,
+        memory_limit_mb: float = 800,
+        max_workers: int | None = 1,
+        thumbnail_pyramid: bool = False
+    ):
         """
         初始化分析器
         
         Args:
             memory_limit_mb: 内存使用限制（MB）
+            max_workers: 单次解码分析使用的进程数，None表示使用全部CPU核心
+            thumbnail_pyramid: 是否从胶卷目录下的缩略图金字塔读取缩略图（首次使用时建立）
         """
+        if max_workers is not None and max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+
         self.memory_monitor = MemoryMonitor(warning_threshold_mb=memory_limit_mb * 0.8)
         self.memory_limit_mb = memory_limit_mb
+        self.max_workers = max_workers
+        self.thumbnail_pyramid = thumbnail_pyramid
 
     def analyze_roll(self, roll: Roll) -> RollCalibrationProfile:
         """
         执行完整的胶卷分析流程。
         这是这个类的主要入口点。
+
+        每个阶段都重新解码每一帧并在整幅密度上逐像素计算，不保留任何逐帧数据。
+        max_workers不为1时解码和计算在进程池中执行，子进程只返回该阶段的小结果
+        （极值、直方图计数或k值）。
         """
         print(f"开始分析胶卷: {roll.name}...")
         self.memory_monitor.log_usage("分析开始")
 
         try:
-            # 1. 计算Dmin和Dmax
-            d_min, d_max = self._find_dmin_dmax(roll)
-            print(f"计算完成 Dmin: {d_min}, Dmax: {d_max}")
-            
-            # 强制清理内存
-            force_memory_cleanup(self.memory_limit_mb)
-
-            # 2. 计算整卷的聚合直方图
-            hist_values, hist_bins = self._calculate_roll_histogram(roll, d_min, d_max)
-            print("计算完成: 聚合直方图")
-            
-            # 强制清理内存
-            force_memory_cleanup(self.memory_limit_mb)
-
-            # 3. 计算高密度点和裁切阈值
-            extrema_high_density_net = hist_proc.find_percentile_from_histogram(
-                hist_values, hist_bins,
-                roll.technical_recipe.extrema_high_density_percentile
-            )
-            high_density_net = hist_proc.find_percentile_from_histogram(
-                hist_values, hist_bins,
-                roll.technical_recipe.high_density_percentile
-            )
-            clip_threshold = (
-                extrema_high_density_net - high_density_net
-            ) / roll.technical_recipe.interpolation_factor + high_density_net
-            print(f"计算完成: 高密度点={extrema_high_density_net:.4f}, 裁切阈值={clip_threshold:.4f}")
+            with self._frame_executor(len(roll.frames)) as executor:
+                # 1. 计算Dmin和Dmax
+                d_min, d_max = self._find_dmin_dmax(roll, executor=executor)
+                print(f"计算完成 Dmin: {d_min}, Dmax: {d_max}")
+
+                # 强制清理内存
+                force_memory_cleanup(self.memory_limit_mb)
+
+                # 2. 计算整卷的聚合直方图
+                roll_histogram = self._calculate_roll_histogram(roll, d_min, d_max, executor=executor)
+                hist_values = roll_histogram.channel_counts() / len(roll.frames)
+                hist_bins = roll_histogram.bin_centers
+                print("计算完成: 聚合直方图")
+
+                # 强制清理内存
+                force_memory_cleanup(self.memory_limit_mb)
+
+                # 3. 计算高密度点和裁切阈值
+                extrema_high_density_net, clip_threshold = self._calculate_clip_threshold(
+                    roll, roll_histogram
+                )
+                print(f"计算完成: 高密度点={extrema_high_density_net:.4f}, 裁切阈值={clip_threshold:.4f}")
 
-            # 4. 计算色彩通道对齐系数 (k值)
-            k_values = self._calculate_k_values(roll, d_min, d_max, extrema_high_density_net)
-            print(f"计算完成: k值={k_values}")
+                # 4. 计算色彩通道对齐系数 (k值)
+                k_values = self._calculate_k_values(
+                    roll, d_min, d_max, extrema_high_density_net, executor=executor
+                )
+                print(f"计算完成: k值={k_values}")
 
             # 5. 将所有结果打包成一个校准配置文件对象
             calibration_profile = RollCalibrationProfile(
@@ -120,44 +146,354 @@ class Analyzer:
             gc.collect()
             self.memory_monitor.log_usage("分析完成")
 
+    def analyze_roll_single_pass(self, roll: Roll) -> RollCalibrationProfile:
+        """
+        单次解码的胶卷分析流程。
+
+        每帧只解码一次并归约为FrameStatistics，随后由归约结果完成
+        Dmin/Dmax、聚合直方图和k值三个阶段，不再重复读取图像。
+        整幅密度在归约后即释放，驻留内存的只有每帧约0.2MB的直方图和约1MB的k值样本。
+        与analyze_roll的逐像素计算相比，Dmin/Dmax和聚合直方图的误差不超过一个逐帧直方图的bin宽
+        （该帧密度范围 / FRAME_HISTOGRAM_BINS），k值由降采样样本计算。
+
+        当max_workers不为1时，逐帧的解码和归约分发到进程池，子进程只返回归约结果；
+        之后的阶段只是在小数组上计算，直接在父进程中按帧顺序完成，结果与串行路径完全一致。
+        """
+        print(f"开始单次解码分析胶卷: {roll.name}...")
+        self.memory_monitor.log_usage("单次解码分析开始")
+
+        try:
+            # 1. 每帧解码一次，收集密度统计量
+            with self._frame_executor(len(roll.frames)) as executor:
+                frame_stats = self._collect_frame_statistics(roll, roll.frames, executor)
+
+            # 2. 由统计量完成全部分析阶段
+            return self._analyze_from_statistics(roll, frame_stats)
+
+        finally:
+            gc.collect()
+            self.memory_monitor.log_usage("单次解码分析完成")
+
+    def collect_frame_statistics(
+        self,
+        roll: Roll,
+        frames: list[Frame] | None = None
+    ) -> list[FrameStatistics]:
+        """
+        解码指定帧并收集其密度统计量，供缓存或后续analyze_statistics使用。
+
+        Args:
+            roll: 帧所属的胶卷，提供技术配方
+            frames: 需要统计的帧，默认为整卷
+        """
+        if frames is None:
+            frames = roll.frames
+
+        with self._frame_executor(len(frames)) as executor:
+            return self._collect_frame_statistics(roll, frames, executor)
+
+    def analyze_statistics(
+        self,
+        roll: Roll,
+        frame_stats: list[FrameStatistics]
+    ) -> RollCalibrationProfile:
+        """
+        由已有的逐帧统计量完成胶卷分析，不读取任何图像。
+
+        Args:
+            roll: 要分析的胶卷
+            frame_stats: 与roll.frames一一对应的逐帧统计量
+        """
+        print(f"开始由密度统计分析胶卷: {roll.name}...")
+        self.memory_monitor.log_usage("统计量分析开始")
+
+        try:
+            return self._analyze_from_statistics(roll, frame_stats)
+
+        finally:
+            gc.collect()
+            self.memory_monitor.log_usage("统计量分析完成")
+
+    def analyze_statistics_incremental(
+        self,
+        roll: Roll,
+        frame_stats: list[FrameStatistics],
+        frame_keys: list[str],
+        previous_state: RollAnalysisState | None = None
+    ) -> tuple[RollCalibrationProfile, RollAnalysisState]:
+        """
+        增量分析：复用上一次分析中未变帧的直方图和k值。
+
+        Dmin/Dmax总是由全部帧的极值重新归约（开销可忽略）。若归约结果及相关
+        配方与上一次相同，旧帧的直方图和k值直接复用，只为新增或变更的帧计算；
+        已删除的帧不再参与归约。结果与analyze_statistics完全一致。
+
+        Args:
+            roll: 要分析的胶卷
+            frame_stats: 与roll.frames一一对应的逐帧统计量
+            frame_keys: 每帧的缓存键，文件或相关配方改变时键随之改变
+            previous_state: 上一次分析记录的逐帧贡献
+
+        Returns:
+            校准配置文件，以及供下一次增量分析使用的逐帧贡献
+        """
+        print(f"开始增量分析胶卷: {roll.name}...")
+        self.memory_monitor.log_usage("增量分析开始")
+        recipe = roll.technical_recipe
+
+        try:
+            # 1. 由逐帧极值归约Dmin和Dmax
+            d_min, d_max = self._find_dmin_dmax(roll, frame_stats)
+            print(f"计算完成 Dmin: {d_min}, Dmax: {d_max}")
+
+            # 2. 聚合直方图：Dmin/Dmax和bin数未变时复用旧帧的直方图
+            histogram_key = _stage_key(d_min, d_max, recipe.bins_number)
+            cached_histograms = {}
+            if previous_state is not None and previous_state.histogram_key == histogram_key:
+                cached_histograms = previous_state.frame_histograms
+
+            frame_histograms = self._reuse_frame_results(
+                cached_histograms, frame_keys, frame_stats, "正在计算聚合直方图",
+                _frame_histogram_counts, d_min, d_max, recipe.bins_number
+            )
+            roll_histogram = _new_roll_histogram(d_max, recipe.bins_number)
+            for counts in frame_histograms:
+                roll_histogram.counts += counts
+            print("计算完成: 聚合直方图")
+
+            # 3. 计算高密度点和裁切阈值
+            extrema_high_density_net, clip_threshold = self._calculate_clip_threshold(
+                roll, roll_histogram
+            )
+            print(f"计算完成: 高密度点={extrema_high_density_net:.4f}, 裁切阈值={clip_threshold:.4f}")
+
+            # 4. k值：对齐所依赖的输入未变时复用旧帧的k值
+            k_key = _stage_key(
+                d_min, d_max, extrema_high_density_net,
+                recipe.target_extrema_high_density_mode,
+                recipe.target_extrema_high_density_factor,
+                recipe.input_target_extrema_high_density,
+                recipe.efficiency_power
+            )
+            cached_k_values = {}
+            if previous_state is not None and previous_state.k_key == k_key:
+                cached_k_values = previous_state.frame_k_values
+
+            frame_k_values = self._reuse_frame_results(
+                cached_k_values, frame_keys, frame_stats, "正在计算通道对齐系数",
+                _frame_k_value, d_min, d_max, extrema_high_density_net, recipe
+            )
+            k_values = np.mean(frame_k_values, axis=0)
+            print(f"计算完成: k值={k_values}")
+
+            calibration_profile = RollCalibrationProfile(
+                d_min=d_min,
+                d_max=d_max,
+                hist_bins=roll_histogram.bin_centers,
+                hist_values=roll_histogram.channel_counts() / len(frame_stats),
+                k_values=k_values,
+                extrema_high_density_net=extrema_high_density_net,
+                clip_threshold=clip_threshold
+            )
+            analysis_state = RollAnalysisState(
+                histogram_key=histogram_key,
+                k_key=k_key,
+                frame_histograms=dict(zip(frame_keys, frame_histograms)),
+                frame_k_values=dict(zip(frame_keys, frame_k_values))
+            )
+
+            roll.calibration = calibration_profile
+            print("增量分析完成，校准数据已保存到Roll对象。")
+
+            return calibration_profile, analysis_state
+
+        finally:
+            gc.collect()
+            self.memory_monitor.log_usage("增量分析完成")
+
     # --- 私有辅助方法 ---
     # 我们将复杂的逻辑分解到这些私有方法中，以保持主方法的清晰
 
+    @property
+    def thumbnail_source(self) -> str:
+        """缩略图来源："pyramid"或"direct"。两者的缩略图不完全相同，缓存键需要区分。"""
+        return "pyramid" if self.thumbnail_pyramid else "direct"
+
+    def _pyramid(self, roll: Roll) -> ThumbnailPyramid | None:
+        """启用缩略图金字塔时返回该卷的金字塔。"""
+        if not self.thumbnail_pyramid:
+            return None
+        return ThumbnailPyramid.for_roll(roll.folder_path)
+
+    @contextmanager
+    def _frame_executor(self, frame_count: int) -> Iterator[Executor | None]:
+        """按max_workers创建逐帧计算使用的进程池；串行时给出None。"""
+        if self.max_workers == 1 or frame_count < 2:
+            yield None
+            return
+
+        print(f"启用并行分析，进程数: {self.max_workers or os.cpu_count()}")
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            yield executor
+
+    def _collect_frame_statistics(
+        self,
+        roll: Roll,
+        frames: list[Frame],
+        executor: Executor | None = None
+    ) -> list[FrameStatistics]:
+        """逐帧解码一次，收集后续所有分析阶段所需的统计量。"""
+        frame_stats = []
+
+        image_paths = [frame.image_path for frame in frames]
+        results = self._map_frames(
+            _extract_frame_statistics, executor,
+            image_paths, repeat(roll.technical_recipe), repeat(self._pyramid(roll))
+        )
+        for i, stats in enumerate(tqdm(results, total=len(image_paths),
+                                       desc="正在收集密度统计", unit="帧")):
+            frame_stats.append(stats)
+
+            if (i + 1) % 10 == 0:
+                self.memory_monitor.check_and_warn(f"密度统计进度: {i+1}/{len(image_paths)}")
+
+        return frame_stats
+
+    def _analyze_from_statistics(
+        self,
+        roll: Roll,
+        frame_stats: list[FrameStatistics]
+    ) -> RollCalibrationProfile:
+        """由逐帧统计量完成Dmin/Dmax、直方图、裁切阈值和k值的计算。"""
+        d_min, d_max = self._find_dmin_dmax(roll, frame_stats)
+        print(f"计算完成 Dmin: {d_min}, Dmax: {d_max}")
+
+        roll_histogram = self._calculate_roll_histogram(roll, d_min, d_max, frame_stats)
+        hist_values = roll_histogram.channel_counts() / len(frame_stats)
+        hist_bins = roll_histogram.bin_centers
+        print("计算完成: 聚合直方图")
+
+        extrema_high_density_net, clip_threshold = self._calculate_clip_threshold(
+            roll, roll_histogram
+        )
+        print(f"计算完成: 高密度点={extrema_high_density_net:.4f}, 裁切阈值={clip_threshold:.4f}")
+
+        k_values = self._calculate_k_values(
+            roll, d_min, d_max, extrema_high_density_net, frame_stats
+        )
+        print(f"计算完成: k值={k_values}")
+
+        calibration_profile = RollCalibrationProfile(
+            d_min=d_min,
+            d_max=d_max,
+            hist_bins=hist_bins,
+            hist_values=hist_values,
+            k_values=k_values,
+            extrema_high_density_net=extrema_high_density_net,
+            clip_threshold=clip_threshold
+        )
+
+        roll.calibration = calibration_profile
+        print("分析完成，校准数据已保存到Roll对象。")
+
+        return calibration_profile
+
+    @staticmethod
+    def _map_frames(func: Callable, executor: Executor | None, *iterables) -> Iterator:
+        """逐帧映射计算函数；有进程池时并行执行，结果始终保持帧顺序。"""
+        if executor is None:
+            return map(func, *iterables)
+        return executor.map(func, *iterables)
+
+    def _reuse_frame_results(
+        self,
+        cached: dict[str, np.ndarray],
+        frame_keys: list[str],
+        frame_stats: list[FrameStatistics],
+        desc: str,
+        func: Callable,
+        *args
+    ) -> list[np.ndarray]:
+        """按帧顺序给出func(stats, *args)的结果，已缓存的帧直接复用。"""
+        results = [cached.get(key) for key in frame_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        print(f"{desc}: 复用 {len(results) - len(missing)} 帧，计算 {len(missing)} 帧")
+
+        missing_stats = [frame_stats[i] for i in missing]
+        computed = map(func, missing_stats, *map(repeat, args))
+        for i, result in zip(missing, tqdm(computed, total=len(missing), desc=desc, unit="帧")):
+            results[i] = result
+
+        return results
+
+    def _map_frame_stage(
+        self,
+        stats_func: Callable,
+        density_func: Callable,
+        roll: Roll,
+        frame_stats: list[FrameStatistics] | None,
+        executor: Executor | None,
+        desc: str,
+        *args
+    ) -> Iterator:
+        """逐帧执行某一分析阶段，按帧顺序给出结果。
+
+        有统计量时对每帧执行stats_func(stats, *args)，直接在本进程中计算（只涉及小数组）；
+        否则逐帧重新解码并对整幅密度执行density_func(density, *args)，
+        有进程池时解码和计算都在子进程中执行，只传回该阶段的结果。
+        """
+        if frame_stats is not None:
+            results = map(stats_func, frame_stats, *map(repeat, args))
+            yield from tqdm(results, total=len(frame_stats), desc=desc, unit="帧")
+            return
+
+        results = self._map_frames(
+            _frame_stage_from_file, executor,
+            [frame.image_path for frame in roll.frames],
+            repeat(roll.technical_recipe), repeat(self._pyramid(roll)),
+            repeat(density_func), repeat(args)
+        )
+        yield from tqdm(results, total=len(roll.frames), desc=desc, unit="帧")
+
+    def _calculate_clip_threshold(
+        self,
+        roll: Roll,
+        roll_histogram: hist_proc.HistogramSketch
+    ) -> tuple[float, float]:
+        """由聚合直方图计算高密度点和裁切阈值。"""
+        extrema_high_density_net, high_density_net = (
+            float(value) for value in roll_histogram.percentiles([
+                roll.technical_recipe.extrema_high_density_percentile,
+                roll.technical_recipe.high_density_percentile,
+            ])
+        )
+        clip_threshold = (
+            extrema_high_density_net - high_density_net
+        ) / roll.technical_recipe.interpolation_factor + high_density_net
+
+        return extrema_high_density_net, clip_threshold
+
     def _find_dmin_dmax(
         self,
-        roll: Roll
+        roll: Roll,
+        frame_stats: list[FrameStatistics] | None = None,
+        executor: Executor | None = None
     ) -> tuple[np.ndarray, np.ndarray]:
         """计算Dmin和Dmax的第一个大循环。"""
-        # 在这里，您将把脚本中那段寻找Dmin/Dmax的代码移入
-        # 注意：它现在操作的是`roll.frames`列表和`roll.technical_recipe`
-
         base_d_candidate = np.array([999, 999, 999])
         leader_d_candidate = np.array([-1, -1, -1])
 
-        for i, frame in enumerate(tqdm(roll.frames, desc="正在计算 Dmin & Dmax", unit="帧")):
-            # 图像加载和预处理应该是一个独立的函数
-            sample_density = loader_proc.preprocess_thumbnail_density(
-                frame.image_path,
-                roll.technical_recipe.light_ratio
-            )
-
-            density_max = density_proc.get_extrema_density(
-                sample_density, percent=roll.technical_recipe.dmax_percentile
-            )
-            density_min = density_proc.get_extrema_density(
-                sample_density, percent=roll.technical_recipe.dmin_percentile
+        results = self._map_frame_stage(
+            _frame_extrema, _density_extrema, roll, frame_stats, executor, "正在计算 Dmin & Dmax",
+            roll.technical_recipe
+        )
+        for i, (density_min, density_max) in enumerate(results):
+            base_d_candidate, leader_d_candidate = _select_extrema(
+                base_d_candidate, leader_d_candidate, density_min, density_max
             )
 
-            if np.mean(density_max) > np.mean(leader_d_candidate):
-                leader_d_candidate = density_max
-            if np.mean(density_min) < np.mean(base_d_candidate):
-                base_d_candidate = density_min
-
-            # 清理临时数据
-            del sample_density, density_max, density_min
-            
             # 每处理10帧执行一次内存检查和清理
-            if (i + 1) % 10 == 0:
+            if frame_stats is None and (i + 1) % 10 == 0:
                 self.memory_monitor.check_and_warn(f"Dmin/Dmax计算进度: {i+1}/{len(roll.frames)}")
                 if force_memory_cleanup(self.memory_limit_mb):
                     print(f"已处理 {i+1} 帧，执行内存清理")
@@ -170,49 +506,25 @@ class Analyzer:
         roll: Roll,
         d_min: np.ndarray,
         d_max: np.ndarray,
-    ) -> tuple[np.ndarray, np.ndarray]:
-        """计算直方图的第二个大循环。"""
-
-        range_min = -0.1
-        range_max = d_max.max() + 0.1
-
-        hist_list = []
+        frame_stats: list[FrameStatistics] | None = None,
+        executor: Executor | None = None
+    ) -> hist_proc.HistogramSketch:
+        """计算直方图的第二个大循环。
 
-        for i, frame in enumerate(tqdm(roll.frames, desc="正在计算聚合直方图", unit="帧")):
-            sample_density = loader_proc.preprocess_thumbnail_density(
-                frame.image_path,
-                roll.technical_recipe.light_ratio
-            )
+        每帧的直方图逐个合并进同一个HistogramSketch，内存占用只与bin数有关。
+        """
 
-            sample_density_net = density_proc.density_to_net(
-                sample_density, dmin=d_min, dmax=d_max
-            )
+        roll_histogram = _new_roll_histogram(d_max, roll.technical_recipe.bins_number)
 
-            hist, bin_edges = np.histogram(
-                sample_density_net,
-                bins=roll.technical_recipe.bins_number,
-                range=(range_min, range_max)
-            )
-            hist_r, _ = np.histogram(
-                sample_density_net[..., 0],
-                bins=roll.technical_recipe.bins_number,
-                range=(range_min, range_max)
-            )
-            hist_g, _ = np.histogram(
-                sample_density_net[..., 1],
-                bins=roll.technical_recipe.bins_number,
-                range=(range_min, range_max)
-            )
-            hist_b, _ = np.histogram(
-                sample_density_net[..., 2],
-                bins=roll.technical_recipe.bins_number,
-                range=(range_min, range_max)
-            )
-            hist_list.append((hist, hist_r, hist_g, hist_b))
-            bins = (bin_edges[:-1] + bin_edges[1:]) / 2.0
+        results = self._map_frame_stage(
+            _frame_histogram, _density_histogram, roll, frame_stats, executor, "正在计算聚合直方图",
+            d_min, d_max, roll.technical_recipe.bins_number
+        )
+        for i, frame_histogram in enumerate(results):
+            roll_histogram.merge(frame_histogram)
 
             # 清理临时数据
-            del sample_density, sample_density_net, hist, hist_r, hist_g, hist_b, bin_edges
+            del frame_histogram
             
             # 每处理8帧执行一次内存检查
             if (i + 1) % 8 == 0:
@@ -220,13 +532,7 @@ class Analyzer:
                 if force_memory_cleanup(self.memory_limit_mb):
                     print(f"已处理 {i+1} 帧，执行内存清理")
 
-        hist_array = np.array(hist_list)
-        hist_mean = np.mean(hist_array, axis=0)
-        
-        # 清理中间数据
-        del hist_list, hist_array
-
-        return hist_mean[0], bins
+        return roll_histogram
 
 
     def _calculate_k_values(
@@ -234,47 +540,20 @@ class Analyzer:
         roll: Roll,
         d_min: np.ndarray,
         d_max: np.ndarray,
-        extrema_high_density_net: float
+        extrema_high_density_net: float,
+        frame_stats: list[FrameStatistics] | None = None,
+        executor: Executor | None = None
     ) -> np.ndarray:
         """计算k值的第三个大循环。"""
 
         k_list = []
 
-        for i, frame in enumerate(tqdm(roll.frames, desc="正在计算通道对齐系数", unit="帧")):
-            sample_density = loader_proc.preprocess_thumbnail_density(
-                frame.image_path, roll.technical_recipe.light_ratio
-            )
-
-            sample_density_net = density_proc.density_to_net(
-                sample_density,
-                dmin=d_min, dmax=d_max
-            )
-
-            if roll.technical_recipe.target_extrema_high_density_mode == "Auto":
-                target_extrema_high_density = align_proc.robust_skewness_index(
-                    sample_density_net,
-                    factor=roll.technical_recipe.target_extrema_high_density_factor
-                )
-            elif roll.technical_recipe.target_extrema_high_density_mode == "Manual":
-                target_extrema_high_density = roll.technical_recipe.input_target_extrema_high_density
-            else:
-                raise ValueError("target_extrema_high_density_mode is not supported: "
-                                 f"{roll.technical_recipe.target_extrema_high_density_mode}")
-
-            sample_density_net_normalized = density_proc.normalize_density_net(
-                sample_density_net,
-                extrema_high_density=extrema_high_density_net,
-                target_extrema_high_density=target_extrema_high_density
-            )
-
-            k = align_proc.calculate_k(
-                sample_density_net_normalized,
-                power=roll.technical_recipe.efficiency_power
-            )
+        results = self._map_frame_stage(
+            _frame_k_value, _density_k_value, roll, frame_stats, executor, "正在计算通道对齐系数",
+            d_min, d_max, extrema_high_density_net, roll.technical_recipe
+        )
+        for i, k in enumerate(results):
             k_list.append(k)
-
-            # 清理临时数据
-            del sample_density, sample_density_net, sample_density_net_normalized, k
             
             # 每处理6帧执行一次内存检查
             if (i + 1) % 6 == 0:
@@ -363,16 +642,11 @@ class Analyzer:
         # 收集Dmin/Dmax候选值
         for frame in batch_roll.frames:
             sample_density = loader_proc.preprocess_thumbnail_density(
-                frame.image_path,
-                batch_roll.technical_recipe.light_ratio
+                frame.image_path, batch_roll.technical_recipe.light_ratio,
+                pyramid=self._pyramid(batch_roll)
             )
             
-            density_max = density_proc.get_extrema_density(
-                sample_density, percent=batch_roll.technical_recipe.dmax_percentile
-            )
-            density_min = density_proc.get_extrema_density(
-                sample_density, percent=batch_roll.technical_recipe.dmin_percentile
-            )
+            density_min, density_max = _density_extrema(sample_density, batch_roll.technical_recipe)
             
             batch_results['dmin_candidates'].append(density_min)
             batch_results['dmax_candidates'].append(density_max)
@@ -400,19 +674,13 @@ class Analyzer:
         print(f"整合完成 Dmin: {d_min}, Dmax: {d_max}")
         
         # 计算其他参数（简化版本）
-        hist_values, hist_bins = self._calculate_roll_histogram(roll, d_min, d_max)
+        roll_histogram = self._calculate_roll_histogram(roll, d_min, d_max)
+        hist_values = roll_histogram.channel_counts() / len(roll.frames)
+        hist_bins = roll_histogram.bin_centers
         
-        extrema_high_density_net = hist_proc.find_percentile_from_histogram(
-            hist_values, hist_bins,
-            roll.technical_recipe.extrema_high_density_percentile
-        )
-        high_density_net = hist_proc.find_percentile_from_histogram(
-            hist_values, hist_bins,
-            roll.technical_recipe.high_density_percentile
+        extrema_high_density_net, clip_threshold = self._calculate_clip_threshold(
+            roll, roll_histogram
         )
-        clip_threshold = (
-            extrema_high_density_net - high_density_net
-        ) / roll.technical_recipe.interpolation_factor + high_density_net
         
         k_values = self._calculate_k_values(roll, d_min, d_max, extrema_high_density_net)
         
@@ -431,3 +699,224 @@ class Analyzer:
         print("内存优化分析完成，校准数据已保存。")
         
         return calibration_profile
+
+
+# --- 逐帧计算函数 ---
+# _frame_* 函数由单帧的归约统计量计算（单次解码和缓存路径），
+# _density_* 函数由整幅密度逐像素计算（多次解码路径），两者共享同一套换算逻辑。
+# 它们必须定义在模块顶层，以便被进程池序列化；传给子进程和传回的都只是小数组。
+
+# 逐帧密度直方图的bin数：bin在该帧有限密度的范围上均分，因此覆盖任意输入的密度范围
+FRAME_HISTOGRAM_BINS = 8192
+# k值样本的长边像素上限
+K_SAMPLE_SIZE = 256
+
+
+def _extract_frame_statistics(
+    image_path: Path,
+    recipe: TechnicalRecipe,
+    pyramid: ThumbnailPyramid | None = None
+) -> FrameStatistics:
+    """解码一帧缩略图并归约为统计量，整幅密度不离开本函数。"""
+    sample_density = loader_proc.preprocess_thumbnail_density(
+        image_path, recipe.light_ratio, pyramid=pyramid
+    )
+    return _reduce_frame(sample_density)
+
+
+def _frame_stage_from_file(
+    image_path: Path,
+    recipe: TechnicalRecipe,
+    pyramid: ThumbnailPyramid | None,
+    func: Callable,
+    args: tuple
+):
+    """解码一帧后立即对整幅密度执行某一分析阶段的逐像素计算，只返回该阶段的结果。"""
+    sample_density = loader_proc.preprocess_thumbnail_density(
+        image_path, recipe.light_ratio, pyramid=pyramid
+    )
+    return func(sample_density, *args)
+
+
+def _reduce_frame(sample_density: np.ndarray) -> FrameStatistics:
+    """把单帧 (高, 宽, 3) 的缩略图密度归约为逐通道直方图、极值和k值样本。
+
+    直方图范围取该帧有限密度的最小和最大值，NaN不计入直方图；
+    全部为常数时范围向上扩展一个单位，使每个bin仍有正宽度。
+    """
+    finite = np.isfinite(sample_density)
+    density_low = np.min(sample_density, axis=(0, 1), where=finite, initial=np.inf)
+    density_high = np.max(sample_density, axis=(0, 1), where=finite, initial=-np.inf)
+    has_values = np.isfinite(density_low)
+    density_low = np.where(has_values, density_low, np.nan)
+    density_high = np.where(has_values, density_high, np.nan)
+
+    if has_values.any():
+        range_low = float(np.nanmin(density_low))
+        range_high = float(np.nanmax(density_high))
+    else:
+        range_low, range_high = 0.0, 1.0
+    if not range_high > range_low:
+        range_high = range_low + 1.0
+
+    histogram = hist_proc.HistogramSketch(
+        FRAME_HISTOGRAM_BINS, (range_low, range_high), channels=3
+    ).add(np.clip(sample_density, range_low, range_high))
+    step = max(1, -(-max(sample_density.shape[:2]) // K_SAMPLE_SIZE))
+
+    return FrameStatistics(
+        histogram=histogram.counts,
+        histogram_range=np.array([range_low, range_high]),
+        density_low=density_low,
+        density_high=density_high,
+        k_sample=np.array(sample_density[::step, ::step], dtype=np.float64)
+    )
+
+
+def _frame_bin_edges(stats: FrameStatistics) -> np.ndarray:
+    """逐帧直方图的bin边界。"""
+    return np.linspace(*stats.histogram_range, stats.histogram.shape[-1] + 1)
+
+
+def _frame_extrema(
+    stats: FrameStatistics,
+    recipe: TechnicalRecipe
+) -> tuple[np.ndarray, np.ndarray]:
+    """由逐帧直方图求单帧在dmin/dmax百分位处的各通道密度。"""
+    density_min = _frame_percentile(stats, recipe.dmin_percentile)
+    density_max = _frame_percentile(stats, recipe.dmax_percentile)
+    return density_min, density_max
+
+
+def _frame_percentile(stats: FrameStatistics, percent: float) -> np.ndarray:
+    """由逐帧直方图求各通道的密度百分位，误差不超过一个bin宽，结果限制在该帧的极值之内。
+
+    没有任何有限密度的通道给出NaN，该帧在Dmin/Dmax的归约中被跳过。
+    """
+    bin_edges = _frame_bin_edges(stats)
+    values = np.array([
+        hist_proc.histogram_percentiles(counts, bin_edges, [percent])[0]
+        if counts.sum() > 0 else np.nan
+        for counts in stats.histogram
+    ])
+    return np.clip(values, stats.density_low, stats.density_high)
+
+
+def _density_extrema(
+    sample_density: np.ndarray,
+    recipe: TechnicalRecipe
+) -> tuple[np.ndarray, np.ndarray]:
+    """由整幅密度逐像素计算单帧在dmin/dmax百分位处的各通道密度。"""
+    density_min = density_proc.get_extrema_density(sample_density, percent=recipe.dmin_percentile)
+    density_max = density_proc.get_extrema_density(sample_density, percent=recipe.dmax_percentile)
+    return density_min, density_max
+
+
+def _select_extrema(
+    base_d_candidate: np.ndarray,
+    leader_d_candidate: np.ndarray,
+    density_min: np.ndarray,
+    density_max: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """按通道均值更新片基 (Dmin) 和片头 (Dmax) 候选值。"""
+    if np.mean(density_max) > np.mean(leader_d_candidate):
+        leader_d_candidate = density_max
+    if np.mean(density_min) < np.mean(base_d_candidate):
+        base_d_candidate = density_min
+    return base_d_candidate, leader_d_candidate
+
+
+def _new_roll_histogram(d_max: np.ndarray, bins_number: int) -> hist_proc.HistogramSketch:
+    """创建覆盖整卷相对密度范围的空直方图（分RGB三通道计数）。"""
+    range_min = -0.1
+    range_max = d_max.max() + 0.1
+    return hist_proc.HistogramSketch(bins_number, (range_min, range_max), channels=3)
+
+
+def _frame_histogram(
+    stats: FrameStatistics,
+    d_min: np.ndarray,
+    d_max: np.ndarray,
+    bins_number: int
+) -> hist_proc.HistogramSketch:
+    """由逐帧直方图计算单帧相对密度的分通道直方图。
+
+    逐帧直方图的每个bin按其中心换算为相对密度，连同计数重新分入整卷的bin。
+    """
+    bin_edges = _frame_bin_edges(stats)
+    bin_centers = np.repeat(((bin_edges[:-1] + bin_edges[1:]) / 2.0)[:, None], 3, axis=1)
+    bin_centers_net = density_proc.density_to_net(bin_centers, dmin=d_min, dmax=d_max)
+    return _new_roll_histogram(d_max, bins_number).add(bin_centers_net, weights=stats.histogram.T)
+
+
+def _density_histogram(
+    sample_density: np.ndarray,
+    d_min: np.ndarray,
+    d_max: np.ndarray,
+    bins_number: int
+) -> hist_proc.HistogramSketch:
+    """由整幅密度逐像素计算单帧相对密度的分通道直方图。"""
+    sample_density_net = density_proc.density_to_net(sample_density, dmin=d_min, dmax=d_max)
+    return _new_roll_histogram(d_max, bins_number).add(sample_density_net)
+
+
+def _frame_histogram_counts(
+    stats: FrameStatistics,
+    d_min: np.ndarray,
+    d_max: np.ndarray,
+    bins_number: int
+) -> np.ndarray:
+    """单帧分通道直方图的计数，便于作为逐帧贡献持久化。"""
+    return _frame_histogram(stats, d_min, d_max, bins_number).counts
+
+
+def _stage_key(*values) -> str:
+    """由某一分析阶段的全部输入生成键，数值按float64的精确字节参与哈希。"""
+    hasher = hashlib.sha256()
+    for value in values:
+        if isinstance(value, str):
+            hasher.update(value.encode('utf-8'))
+        else:
+            hasher.update(np.asarray(value, dtype=np.float64).tobytes())
+        hasher.update(b'|')
+    return hasher.hexdigest()[:16]
+
+
+def _frame_k_value(
+    stats: FrameStatistics,
+    d_min: np.ndarray,
+    d_max: np.ndarray,
+    extrema_high_density_net: float,
+    recipe: TechnicalRecipe
+) -> np.ndarray:
+    """由降采样的密度样本计算单帧的通道对齐系数 (k值)。"""
+    return _density_k_value(stats.k_sample, d_min, d_max, extrema_high_density_net, recipe)
+
+
+def _density_k_value(
+    sample_density: np.ndarray,
+    d_min: np.ndarray,
+    d_max: np.ndarray,
+    extrema_high_density_net: float,
+    recipe: TechnicalRecipe
+) -> np.ndarray:
+    """由密度计算单帧的通道对齐系数 (k值)。"""
+    sample_density_net = density_proc.density_to_net(
+        sample_density,
+        dmin=d_min, dmax=d_max
+    )
+
+    target_extrema_high_density = pipeline.target_extrema_high_density(
+        sample_density_net, recipe
+    )
+
+    sample_density_net_normalized = density_proc.normalize_density_net(
+        sample_density_net,
+        extrema_high_density=extrema_high_density_net,
+        target_extrema_high_density=target_extrema_high_density
+    )
+
+    return align_proc.calculate_k(
+        sample_density_net_normalized,
+        power=recipe.efficiency_power
+    )
@@ -27,8 +27,10 @@ For more information, please refer to the project documentation.
 """
 
 
+from pathlib import Path
+
 from core.roll import Roll
-from core.calibration import RollCalibrationProfile
+from core.calibration import RollCalibrationProfile, FrameStatistics
 from processing import cache_utils as cache
 
 from .analyzer import Analyzer
@@ -52,23 +54,90 @@ class AnalysisCoordinator:
         cache_dir = roll.folder_path / '.cache'
         cache_dir.mkdir(exist_ok=True)
 
-        # 2. 根据当前的技术配方生成唯一的缓存键
+        # 2. 根据当前的技术配方、输入文件和缩略图来源生成唯一的缓存键
         recipe_key = cache.generate_recipe_key(roll.technical_recipe)
-        cache_file_path = cache_dir / f"{recipe_key}.profile.csv"
+        files_key = cache.generate_files_key([frame.image_path for frame in roll.frames])
+        source = self.analyzer.thumbnail_source
+        cache_file_path = cache_dir / f"{recipe_key}-{files_key}-{source}.profile.npz"
 
         # 3. 尝试从缓存加载
-        cached_profile = cache.load_profile_from_csv(cache_file_path)
+        cached_profile = cache.load_profile(cache_file_path)
         if cached_profile:
             print("缓存命中！直接使用已有的分析结果。")
             # 将加载的校准数据存入Roll对象
             roll.calibration = cached_profile
             return cached_profile
 
-        # 4. 如果缓存不存在（缓存未命中），则执行完整的分析
+        # 4. 如果缓存不存在（缓存未命中），则由逐帧统计量重新分析。
+        # 逐帧统计量有自己的缓存，只有缺失的帧才需要重新解码。
         print("缓存未命中。开始执行新的分析...")
-        new_profile = self.analyzer.analyze_roll(roll)
-
-        # 5. 将新的分析结果保存到缓存，以备将来使用
-        cache.save_profile_to_csv(new_profile, cache_file_path)
+        frame_keys, frame_stats = self._get_frame_statistics(roll, cache_dir)
+
+        # 5. 与上一次分析的逐帧贡献比较，只为新增或变更的帧重新归约
+        state_file_path = cache_dir / "analysis_state.npz"
+        previous_state = cache.load_analysis_state(state_file_path)
+        if previous_state is not None:
+            previous_keys = set(previous_state.frame_histograms) | set(previous_state.frame_k_values)
+            added = sum(1 for key in frame_keys if key not in previous_keys)
+            removed = len(previous_keys - set(frame_keys))
+            print(f"相对上一次分析: 新增或变更 {added} 帧，移除 {removed} 帧")
+
+        new_profile, analysis_state = self.analyzer.analyze_statistics_incremental(
+            roll, frame_stats, frame_keys, previous_state
+        )
+
+        # 6. 将新的分析结果保存到缓存，以备将来使用；同一缩略图来源的旧配置文件
+        # 对应已修改的配方或文件，由逐帧统计量重新分析的代价很小，不再保留
+        cache.save_profile(new_profile, cache_file_path)
+        cache.save_analysis_state(analysis_state, state_file_path)
+        removed = cache.prune_cache_files(cache_dir, f"*-{source}.profile.npz", {cache_file_path})
+        if removed:
+            print(f"已清理 {removed} 个过期的校准缓存")
 
         return new_profile
+
+    def _get_frame_statistics(
+        self,
+        roll: Roll,
+        cache_dir: Path
+    ) -> tuple[list[str], list[FrameStatistics]]:
+        """
+        第二级缓存：获取每帧的缓存键和密度统计量。
+
+        缓存的是每帧的直方图计数、极值和k值样本，而不是整幅密度。缓存键只包含
+        文件身份、缩略图来源和光源比例，因此修改任何百分位或interpolation_factor后都无需重新解码图像，
+        命中时也只读取每帧几百KB的数据。
+
+        每种缩略图来源的统计量放在各自的子目录中；写入新的统计量时，同一来源下
+        不属于当前各帧的条目（已删除或修改的帧、旧的光源比例）随之清理。
+        """
+        source = self.analyzer.thumbnail_source
+        frame_cache_dir = cache_dir / 'frames' / source
+        frame_cache_dir.mkdir(parents=True, exist_ok=True)
+
+        frame_keys = [
+            cache.generate_frame_stats_key(frame.image_path, roll.technical_recipe, source)
+            for frame in roll.frames
+        ]
+        cache_paths = [frame_cache_dir / f"{key}.stats.npz" for key in frame_keys]
+        frame_stats = [cache.load_frame_statistics(path) for path in cache_paths]
+
+        missing = [i for i, stats in enumerate(frame_stats) if stats is None]
+        print(f"逐帧统计缓存命中: {len(frame_stats) - len(missing)}/{len(frame_stats)} 帧")
+        if not missing:
+            return frame_keys, frame_stats
+
+        new_stats = self.analyzer.collect_frame_statistics(
+            roll, [roll.frames[i] for i in missing]
+        )
+        for i, stats in zip(missing, new_stats):
+            cache.save_frame_statistics(stats, cache_paths[i])
+            frame_stats[i] = stats
+
+        removed = cache.prune_cache_files(frame_cache_dir, "*.stats.npz", set(cache_paths))
+        # 旧版本直接放在frames目录下的统计量不再被读取
+        removed += cache.prune_cache_files(cache_dir / 'frames', "*.stats.npz", set())
+        if removed:
+            print(f"已清理 {removed} 个过期的逐帧统计缓存")
+
+        return frame_keys, frame_stats
@@ -27,125 +27,490 @@ For more information, please refer to the project documentation.
 """
 
 
-from pathlib import Path
+import os
 import gc
+import json
+import queue
+import hashlib
+import tempfile
+import threading
+import dataclasses
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
 from tqdm import tqdm
 
 from core.roll import Roll
 from core.frame import Frame
-from core.recipe import ExportRecipe, ExportFormat
+from core.recipe import ExportRecipe, ExportOutput, ExportFormat
+from core.calibration import RollCalibrationProfile
 import processing.image_export as file_writers
+import processing.cache_utils as cache_utils
+import processing.image_loader as loader_proc
 
 from .renderer import Renderer
 
 # import processing.image_loader as loader # 用于加载ICC配置文件
 
 
+class ByteBudget:
+    """
+    限制流水线中同时存在的数据量（字节）。
+
+    acquire在超出上限时阻塞，直到其它帧release；没有任何数据在途时总是放行，
+    因此单帧超过上限也不会死锁。
+    """
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes: int) -> None:
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.in_flight == 0 or self.in_flight + nbytes <= self.limit
+            )
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, nbytes: int) -> None:
+        with self._condition:
+            self.in_flight -= nbytes
+            self._condition.notify_all()
+
+
+class ExportManifest:
+    """
+    输出目录中的导出清单，使中断后的导出可以续传、未变化的帧可以跳过。
+
+    每帧以源文件的完整路径为键，记录源文件、配方（技术/创意配方、导出设置和渲染器参数）与校准配置的指纹，
+    以及每个输出文件的大小、修改时间和SHA-256。指纹全部一致且输出文件仍然完好时
+    该帧视为已是最新；大小和修改时间未变时不再重新计算哈希。
+    清单在每帧完成后原子地重写，导出中途退出时已完成的帧仍然有效。
+    """
+    FILENAME = "export_manifest.json"
+    FORMAT_VERSION = 2
+
+    def __init__(self, output_dir: Path):
+        self.path = Path(output_dir) / self.FILENAME
+        self.frames: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding='utf-8'))
+                if data.get('format_version') == self.FORMAT_VERSION:
+                    self.frames = data['frames']
+            except (OSError, ValueError, KeyError) as e:
+                print(f"导出清单损坏，将重新导出所有帧: {self.path.name} ({e})")
+
+    def is_current(self, frame_key: str, fingerprints: dict[str, str], save_paths: list[Path]) -> bool:
+        """该帧的指纹与清单一致，且清单中的每个输出文件都存在且内容未变。"""
+        with self._lock:
+            entry = self.frames.get(frame_key)
+        if entry is None or entry['fingerprints'] != fingerprints:
+            return False
+        if sorted(entry['outputs']) != sorted(path.name for path in save_paths):
+            return False
+        for path in save_paths:
+            record = entry['outputs'][path.name]
+            if not path.exists():
+                return False
+            stat = path.stat()
+            if stat.st_size == record['size'] and stat.st_mtime_ns == record['mtime_ns']:
+                continue
+            if stat.st_size != record['size'] or file_sha256(path) != record['sha256']:
+                return False
+        return True
+
+    def record(self, frame_key: str, fingerprints: dict[str, str], save_paths: list[Path]) -> None:
+        """记录一帧已完成的输出并立即写入清单。"""
+        outputs = {}
+        for path in save_paths:
+            stat = path.stat()
+            outputs[path.name] = {
+                'sha256': file_sha256(path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+            }
+        with self._lock:
+            self.frames[frame_key] = {'fingerprints': fingerprints, 'outputs': outputs}
+            data = json.dumps(
+                {'format_version': self.FORMAT_VERSION, 'frames': self.frames},
+                indent=2, sort_keys=True
+            )
+            _atomic_write(self.path, data.encode('utf-8'))
+
+
+@contextmanager
+def _atomic_output(save_path: Path) -> Iterator[Path]:
+    """给出同目录下的临时文件路径，写入成功后原子地重命名为save_path，失败时删除。"""
+    fd, tmp_name = tempfile.mkstemp(dir=save_path.parent, prefix=f".{save_path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    # 先写同目录下的临时文件再原子替换
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+_STAGE_DONE = object()
+
+
 class Exporter:
     """
     负责协调整个导出流程。
+
+    export_frames以流水线方式执行：读取、渲染、编码写入三个阶段各有自己的线程，
+    阶段之间用有界队列连接，一帧在写入时下一帧可以同时渲染、再下一帧同时读取。
+    解码、NumPy计算和Pillow/tifffile编码都会释放GIL，因此线程即可重叠执行。
     """
-    def __init__(self, renderer: Renderer):
+    def __init__(
+        self,
+        renderer: Renderer,
+        readers: int = 1,
+        render_workers: int = 2,
+        writers: int = 2,
+        max_bytes_in_flight: int = 2 * 1024 ** 3
+    ):
         # Exporter需要一个Renderer来确保图像是最高质量的。
         # 这是“依赖注入”——我们把需要的工具递给它，而不是让它自己创建。
+        if min(readers, render_workers, writers) < 1:
+            raise ValueError("Each export stage needs at least one worker.")
         self.renderer = renderer
+        self.readers = readers
+        self.render_workers = render_workers
+        self.writers = writers
+        # 从读取完成到写入完成，在途帧的原始数据和渲染结果合计不超过该值
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.peak_bytes_in_flight = 0
 
     def export_frames(
         self,
         frames: list[Frame],
         roll: Roll,
         recipe: ExportRecipe,
-        output_dir: Path
-    ):
+        output_dir: Path,
+        skip_current: bool = True
+    ) -> list[Path]:
         """
-        导出指定的一系列帧。
+        导出指定的一系列帧，返回输出文件路径，按帧、再按recipe中输出的顺序排列。
+
+        每帧只渲染一次，结果分发给配方中的所有输出，各输出在写入线程中
+        由渲染得到的浮点结果缩放、编码。任何一帧出错时停止读取新的帧，已读取的帧完成写入并记入清单，最后重新抛出第一个错误。
+        输出目录中的导出清单表明某帧的输出已是最新时跳过该帧（skip_current为False时全部重新导出）。
         
         Args:
             frames: 需要导出的Frame对象列表。
             roll: 当前的Roll对象，用于获取校准数据。
             recipe: 包含所有导出设置的ExportRecipe对象。
             output_dir: 导出的目标目录。
+            skip_current: 是否跳过输出已是最新的帧。
         """
         print(f"开始导出 {len(frames)} 帧到目录: {output_dir}")
         output_dir.mkdir(exist_ok=True, parents=True)
 
-        for i, frame in enumerate(tqdm(frames, desc="正在导出图像", unit="帧")):
+        outputs = recipe.resolved_outputs()
+        manifest = ExportManifest(output_dir)
+        frame_paths = [[self._output_path(frame, output, output_dir) for output in outputs]
+                       for frame in frames]
+        fingerprints = [self._frame_fingerprints(frame, roll.calibration, outputs) for frame in frames]
+        pending = [
+            index for index, frame in enumerate(frames)
+            if not (skip_current
+                    and manifest.is_current(self._manifest_key(frame), fingerprints[index], frame_paths[index]))
+        ]
+        if len(pending) < len(frames):
+            print(f"跳过 {len(frames) - len(pending)} 帧已是最新的输出")
+
+        budget = ByteBudget(self.max_bytes_in_flight)
+        # 每帧在途期间占用的字节数，解码前由文件头估计，该帧的所有输出写入或丢弃时归还
+        costs: dict[int, int] = {}
+        remaining: dict[int, int] = {}
+        remaining_lock = threading.Lock()
+        errors: list[BaseException] = []
+        progress = tqdm(total=len(pending), desc="正在导出图像", unit="帧")
+
+        def read(index: int) -> list[int]:
+            frame = frames[index]
+            # 先按估计的大小占用预算再解码，在途数据不会因提前读取而超出上限
+            costs[index] = self._frame_cost(frame, len(outputs))
+            remaining[index] = len(outputs)
+            budget.acquire(costs[index])
+            self.renderer.load_full_quality(frame)
+            # read_image可能返回内存映射，在读取阶段真正读入内存，渲染阶段不再等待磁盘
+            if isinstance(frame.full_quality_data, np.memmap):
+                frame.full_quality_data = np.array(frame.full_quality_data, copy=True)
+            return [index]
+
+        def render(index: int) -> list[tuple[int, int, np.ndarray]]:
+            frame = frames[index]
+            images = self.renderer.render_full_quality_targets(
+                frame, roll.calibration, [output.icc_bytes for output in outputs]
+            )
+            # 渲染结果由写入阶段持有，不必保留在Frame上
+            frame.processed_image = None
+            return [(index, k, image) for k, image in enumerate(images)]
+
+        def write(item: tuple[int, int, np.ndarray]) -> list:
+            index, k, image = item
+            self._save_image(image, outputs[k], frame_paths[index][k])
+            with remaining_lock:
+                remaining[index] -= 1
+                finished = remaining[index] == 0
+            if finished:
+                manifest.record(self._manifest_key(frames[index]), fingerprints[index], frame_paths[index])
+                discard(index)
+                progress.update(1)
+            return []
+
+        def discard(index: int) -> None:
+            frames[index].clear_large_data()
+            budget.release(costs.pop(index, 0))
+
+        def discard_item(item) -> None:
+            discard(item[0] if isinstance(item, tuple) else item)
+
+        read_queue: queue.Queue = queue.Queue(maxsize=self.readers)
+        render_queue: queue.Queue = queue.Queue(maxsize=self.render_workers)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.writers)
+        # 出错后读取阶段不再读取新的帧，已读取的帧继续完成
+        stages = [
+            (read, read_queue, render_queue, self.readers, "export-read", True),
+            (render, render_queue, write_queue, self.render_workers, "export-render", False),
+            (write, write_queue, None, self.writers, "export-write", False),
+        ]
+        threads = [
+            [
+                threading.Thread(
+                    target=self._stage_worker,
+                    args=(func, inbox, outbox, errors, discard_item, stop_on_error),
+                    name=f"{name}-{n}", daemon=True
+                )
+                for n in range(workers)
+            ]
+            for func, inbox, outbox, workers, name, stop_on_error in stages
+        ]
+        for stage_threads in threads:
+            for thread in stage_threads:
+                thread.start()
+
+        try:
+            for index in pending:
+                if errors:
+                    break
+                read_queue.put(index)
+        finally:
+            # 按阶段顺序关闭：上一阶段的线程全部结束后，下一阶段才会收到结束标记
+            for (_, inbox, _, workers, _, _), stage_threads in zip(stages, threads):
+                for _ in range(workers):
+                    inbox.put(_STAGE_DONE)
+                for thread in stage_threads:
+                    thread.join()
+            progress.close()
+
+        if errors:
+            raise errors[0]
+        self.peak_bytes_in_flight = budget.peak
+        print(f"导出完成，在途数据峰值: {budget.peak / (1024 * 1024):.1f}MB")
+        return [path for paths in frame_paths for path in paths]
+
+    @staticmethod
+    def _stage_worker(
+        func,
+        inbox: queue.Queue,
+        outbox: queue.Queue | None,
+        errors: list,
+        discard,
+        stop_on_error: bool
+    ) -> None:
+        """流水线阶段的工作线程：从inbox取出一项，处理结果放入outbox；出错的项被丢弃。
+
+        stop_on_error为True时，任何阶段出错后本阶段只丢弃剩余的项而不再处理。
+        """
+        while True:
+            item = inbox.get()
+            if item is _STAGE_DONE:
+                return
+            if stop_on_error and errors:
+                discard(item)
+                continue
             try:
-                # 显示内存使用情况
-                memory_usage = frame.get_memory_usage()
-                if memory_usage['total'] > 0:
-                    print(f"处理帧 {i+1}/{len(frames)}: {frame.filename} (内存: {memory_usage['total']:.1f}MB)")
-                
-                # 1. 渲染全质量图像
-                # 我们调用render_full_quality来确保使用原始高分辨率文件进行处理。
-                # 这是与实时预览的核心区别。
-                final_image_data = self.renderer.render_full_quality(
-                    frame,
-                    roll.calibration,
-                    recipe.icc_bytes
+                results = func(item)
+            except BaseException as e:
+                print(f"导出帧时出错: {e}")
+                errors.append(e)
+                discard(item)
+                continue
+            # 一项输入可以产生多项输出（渲染结果分发给每个输出文件）
+            for result in results:
+                outbox.put(result)
+
+    def _frame_cost(self, frame: Frame, output_count: int = 1) -> int:
+        """一帧在途期间的内存上界估计：解码后的原始数据加上每个输出一份同尺寸的RGB渲染结果。
+
+        已加载时按实际数据计算，否则只读取文件头估计，不解码像素。
+        """
+        if frame.full_quality_data is not None:
+            shape, dtype = frame.full_quality_data.shape, frame.full_quality_data.dtype
+        else:
+            shape, dtype = loader_proc.read_image_info(frame.image_path)
+        output_itemsize = np.dtype(self.renderer.buffer_dtype or np.float64).itemsize
+        return (int(np.prod(shape)) * np.dtype(dtype).itemsize
+                + output_count * shape[0] * shape[1] * 3 * output_itemsize)
+
+    def _frame_fingerprints(
+        self,
+        frame: Frame,
+        calibration: RollCalibrationProfile,
+        outputs: list[ExportOutput]
+    ) -> dict[str, str]:
+        """决定一帧导出结果的全部输入的指纹，写入导出清单。"""
+        recipe_hasher = hashlib.sha256(self.renderer.render_fingerprint(frame).encode('utf-8'))
+        for recipe in (frame.technical_recipe, frame.creative_recipe, *outputs):
+            names = tuple(f.name for f in dataclasses.fields(recipe))
+            recipe_hasher.update(cache_utils.generate_recipe_fingerprint(recipe, names).encode('utf-8'))
+        return {
+            'source': cache_utils.generate_file_key(frame.image_path),
+            'recipe': recipe_hasher.hexdigest()[:16],
+            'calibration': cache_utils.generate_recipe_fingerprint(
+                calibration, cache_utils.CALIBRATION_FIELDS
+            ),
+        }
+
+    @staticmethod
+    def _manifest_key(frame: Frame) -> str:
+        # 不同目录中的同名帧各自对应一条记录
+        return str(frame.image_path.resolve())
+
+    @staticmethod
+    def _output_path(frame: Frame, output: ExportOutput, output_dir: Path) -> Path:
+        # 这是一个简单的命名，未来可以根据ExportRecipe中的设置变得更复杂
+        return output_dir / f"{frame.image_path.stem}_{output.filename_suffix}.{output.extension}"
+
+    @staticmethod
+    def _save_image(
+        image_data: np.ndarray,
+        output: ExportOutput,
+        save_path: Path
+    ) -> None:
+        """
+        按输出设置缩放并选择正确的写入工具。
+
+        先写入同目录下的临时文件，完成后原子地重命名，中断时不会留下看似完整的输出。
+        """
+        if output.max_size is not None:
+            image_data = loader_proc.resize_to_fit(
+                image_data,
+                loader_proc.fit_size(image_data.shape[:2], (output.max_size, output.max_size))
+            )
+
+        with _atomic_output(save_path) as tmp_path:
+            if output.export_format == ExportFormat.JPG:
+                file_writers.save_as_jpg(
+                    image_data, tmp_path,
+                    quality=output.quality, icc_profile=output.icc_bytes,
+                    dither=output.dither
+                )
+            elif output.export_format == ExportFormat.TIF_8_BIT:
+                file_writers.save_as_tif(
+                    image_data, tmp_path,
+                    bit_depth=8, icc_profile=output.icc_bytes,
+                    compression=output.compression, dither=output.dither
                 )
+            elif output.export_format == ExportFormat.TIF_16_BIT:
+                file_writers.save_as_tif(
+                    image_data, tmp_path,
+                    bit_depth=16, icc_profile=output.icc_bytes,
+                    compression=output.compression
+                )
+            else:
+                raise ValueError(f"Unsupported export format: {output.export_format}")
 
-                # 2. 构建输出文件名
-                # 这是一个简单的命名，未来可以根据ExportRecipe中的设置变得更复杂
-                base_name = frame.image_path.stem
-                output_name = f"{base_name}_{recipe.filename_suffix}"
-
-                # 3. 根据配方选择正确的写入工具并执行
-                if recipe.export_format == ExportFormat.JPG:
-                    save_path = output_dir / f"{output_name}.jpg"
-                    file_writers.save_as_jpg(
-                        final_image_data, save_path,
-                        quality=recipe.quality, icc_profile=recipe.icc_bytes
-                    )
-                elif recipe.export_format == ExportFormat.TIF_8_BIT:
-                    save_path = output_dir / f"{output_name}.tif"
-                    file_writers.save_as_tif(
-                        final_image_data, save_path,
-                        bit_depth=8, icc_profile=recipe.icc_bytes
-                    )
-                elif recipe.export_format == ExportFormat.TIF_16_BIT:
-                    save_path = output_dir / f"{output_name}.tif"
-                    file_writers.save_as_tif(
-                        final_image_data, save_path,
-                        bit_depth=16, icc_profile=recipe.icc_bytes
-                    )
-                
-                # 4. 保存完成后立即清理当前帧的大型数据
-                frame.clear_large_data()
-                
-                # 5. 每处理几帧就执行一次垃圾回收
-                if (i + 1) % 5 == 0:
-                    gc.collect()
-                    print(f"已处理 {i+1} 帧，执行内存清理")
-                    
-            except Exception as e:
-                print(f"导出帧 {frame.filename} 时出错: {e}")
-                # 即使出错也要清理内存
-                frame.clear_large_data()
-                raise
+    def _stream_tif(
+        self,
+        frame: Frame,
+        calibration: RollCalibrationProfile,
+        output: ExportOutput,
+        save_path: Path
+    ) -> None:
+        """分条带渲染并流式写入全尺寸TIFF，内存中只有少量条带，不存在整幅的渲染结果。"""
+        self.renderer.load_full_quality(frame)
+        shape = frame.full_quality_data.shape[:2] + (3,)
+        strips = self.renderer.iter_full_quality_strips(frame, calibration, output.icc_bytes)
+        bit_depth = 16 if output.export_format == ExportFormat.TIF_16_BIT else 8
+        dither = output.dither if bit_depth == 8 else None
+        with _atomic_output(save_path) as tmp_path:
+            file_writers.write_tif_strips(
+                (strip for _, strip in strips), tmp_path, shape, bit_depth, output.icc_bytes,
+                compression=output.compression, dither=dither
+            )
+
+    @staticmethod
+    def _can_stream(outputs: list[ExportOutput]) -> bool:
+        """只有单个全尺寸TIFF输出时可以边渲染边写入。"""
+        return (len(outputs) == 1 and outputs[0].max_size is None
+                and outputs[0].export_format in (ExportFormat.TIF_8_BIT, ExportFormat.TIF_16_BIT))
 
     def export_roll_with_memory_optimization(
         self,
         roll: Roll,
         recipe: ExportRecipe,
         output_dir: Path,
-        memory_limit_mb: float = 1000
+        memory_limit_mb: float = 1000,
+        skip_current: bool = True
     ):
         """
         导出整卷胶卷，采用内存优化策略。
+
+        与export_frames共用导出清单：中断后重新运行只导出缺失或过期的帧。
         
         Args:
             roll: 要导出的Roll对象
             recipe: 导出配方
             output_dir: 输出目录
             memory_limit_mb: 内存限制（MB）
+            skip_current: 是否跳过输出已是最新的帧
         """
         print(f"开始内存优化导出胶卷: {roll.name}")
         print(f"总帧数: {len(roll.frames)}, 内存限制: {memory_limit_mb}MB")
         
         output_dir.mkdir(exist_ok=True, parents=True)
+        outputs = recipe.resolved_outputs()
+        manifest = ExportManifest(output_dir)
         
         for i, frame in enumerate(tqdm(roll.frames, desc="导出胶卷", unit="帧")):
+            save_paths = [self._output_path(frame, output, output_dir) for output in outputs]
+            fingerprints = self._frame_fingerprints(frame, roll.calibration, outputs)
+            if skip_current and manifest.is_current(self._manifest_key(frame), fingerprints, save_paths):
+                print(f"已是最新，跳过: {frame.filename}")
+                continue
+
             # 优化内存：只保留当前帧及其邻近帧的数据
             roll.optimize_memory_for_batch_processing(
                 current_frame_index=i,
@@ -161,38 +526,22 @@ class Exporter:
                     roll.clear_all_frame_data()
                     gc.collect()
                 
-                # 渲染和保存
-                final_image_data = self.renderer.render_full_quality(
-                    frame,
-                    roll.calibration,
-                    recipe.icc_bytes
-                )
-                
-                # 构建输出路径
-                base_name = frame.image_path.stem
-                output_name = f"{base_name}_{recipe.filename_suffix}"
-                
-                # 保存文件
-                if recipe.export_format == ExportFormat.JPG:
-                    save_path = output_dir / f"{output_name}.jpg"
-                    file_writers.save_as_jpg(
-                        final_image_data, save_path,
-                        quality=recipe.quality, icc_profile=recipe.icc_bytes
-                    )
-                elif recipe.export_format == ExportFormat.TIF_8_BIT:
-                    save_path = output_dir / f"{output_name}.tif"
-                    file_writers.save_as_tif(
-                        final_image_data, save_path,
-                        bit_depth=8, icc_profile=recipe.icc_bytes
-                    )
-                elif recipe.export_format == ExportFormat.TIF_16_BIT:
-                    save_path = output_dir / f"{output_name}.tif"
-                    file_writers.save_as_tif(
-                        final_image_data, save_path,
-                        bit_depth=16, icc_profile=recipe.icc_bytes
+                if self._can_stream(outputs):
+                    # 单个TIFF母版：分条带渲染并直接写入
+                    self._stream_tif(frame, roll.calibration, outputs[0], save_paths[0])
+                    print(f"已导出: {save_paths[0].name}")
+                else:
+                    # 渲染一次，保存所有输出
+                    images = self.renderer.render_full_quality_targets(
+                        frame,
+                        roll.calibration,
+                        [output.icc_bytes for output in outputs]
                     )
-                
-                print(f"已导出: {save_path.name}")
+                    
+                    for output, image, save_path in zip(outputs, images, save_paths):
+                        self._save_image(image, output, save_path)
+                        print(f"已导出: {save_path.name}")
+                manifest.record(self._manifest_key(frame), fingerprints, save_paths)
                 
             except Exception as e:
                 print(f"导出帧 {frame.filename} 失败: {e}")
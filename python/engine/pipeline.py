@@ -0,0 +1,742 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Revela - Professional Film Processing System
+
+Staged render pipeline shared by preview and full quality rendering
+
+File Information:
+    File Name: pipeline.py
+    Author: Flemyng
+    Email: flemyng1999@gmail.com
+    Created: 2025-07-18 12:44:01
+    Last Modified: 2025-07-18 12:44:01
+    Version: 1.0.0
+    Python Version: 3.12+
+    License: GPL-3.0 license
+
+Project Information:
+    Project: Revela
+    Repository: https://github.com/Flemyng1999/Revela
+    Documentation: https://github.com/Flemyng1999/Revela/docs
+
+Copyright (c) 2025 Flemyng. All rights reserved.
+This file is part of the Revela project.
+
+For more information, please refer to the project documentation.
+"""
+
+
+from __future__ import annotations
+import os
+import sys
+import threading
+import hashlib
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import dataclass, field, fields, replace
+from pathlib import Path
+
+import numpy as np
+
+from core.frame import Frame
+from core.recipe import TechnicalRecipe
+from core.calibration import RollCalibrationProfile
+
+from processing import density as density_proc
+from processing import alignment as align_proc
+from processing import conversion as conversion_proc
+from processing import tone as tone_proc
+from processing.cache_utils import generate_file_key, generate_recipe_fingerprint
+from processing.lut_cache import LutRegistry
+
+
+lut_dir = Path(__file__).parent.parent.parent / "data" / "lut"
+
+# 进程内共享的LUT缓存，首次使用时创建，见get_lut_registry
+_lut_registry: LutRegistry | None = None
+_lut_registry_lock = threading.Lock()
+
+# float32工作缓冲区渲染的输出（[0, 1]）与float64路径的最大绝对误差
+FLOAT32_TOLERANCE = 1e-5
+
+
+@dataclass
+class RenderStatistics:
+    """
+    渲染依赖的全图统计量。
+
+    值为None时由对应阶段从当前图像计算并记录；冻结后缺失的统计量会报错，
+    以保证分块渲染时每个块都使用同一组全局值，而不是各自从块内计算。
+    """
+    target_extrema_high_density: float | None = None
+    linear_max: float | None = None
+    rolloff_max: float | None = None
+    display_input_max: float | None = None
+    sdr_max: float | None = None
+    output_max: float | None = None
+    # 烘焙LUT的定义域：对齐后相对密度逐通道的 (下限, 上限)
+    baked_domain: tuple[np.ndarray, np.ndarray] | None = None
+    frozen: bool = False
+
+    def freeze(self) -> None:
+        """冻结统计量，之后的渲染只读取不再计算。"""
+        self.frozen = True
+
+
+class RenderBuffers:
+    """
+    两块交替使用（ping-pong）的工作缓冲区。
+
+    每个阶段把结果写入不与输入重叠的那一块，整次渲染不再为中间结果分配新数组。
+    缓冲区按最大行数分配，行数较少的输入（例如最后一个条带）使用其前若干行。
+    shape为None时在第一次使用时按输入图像的形状分配。
+    """
+
+    def __init__(self, shape: tuple[int, ...] | None = None, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self._buffers = None
+        if shape is not None:
+            self._allocate(shape)
+
+    def _allocate(self, shape: tuple[int, ...]) -> None:
+        self._buffers = (np.empty(shape, dtype=self.dtype), np.empty(shape, dtype=self.dtype))
+
+    def output_for(self, image: np.ndarray) -> np.ndarray:
+        """返回与image不重叠、形状相同的缓冲区。"""
+        if self._buffers is None:
+            self._allocate(image.shape)
+        buffer_shape = self._buffers[0].shape
+        if image.shape[1:] != buffer_shape[1:] or image.shape[0] > buffer_shape[0]:
+            raise ValueError(f"Image of shape {image.shape} does not fit render buffers "
+                             f"of shape {buffer_shape}")
+        for buffer in self._buffers:
+            if not np.may_share_memory(buffer, image):
+                return buffer[:image.shape[0]]
+        raise RuntimeError("Image overlaps both render buffers.")
+
+
+@dataclass
+class RenderContext:
+    """
+    一次渲染中各阶段共享的输入和全局统计量。
+
+    ocio_config可以是原始的OCIO配置，也可以是OcioProcessorCache（Renderer默认传入后者）。
+    buffers为None时各阶段返回新分配的数组；给定时结果写入工作缓冲区，
+    计算精度为缓冲区的dtype。
+    """
+    frame: Frame
+    calibration: RollCalibrationProfile
+    ocio_config: object
+    statistics: RenderStatistics = field(default_factory=RenderStatistics)
+    buffers: RenderBuffers | None = None
+
+    def work_buffer(self, image: np.ndarray) -> np.ndarray | None:
+        """当前阶段结果应写入的缓冲区，未使用工作缓冲区时为None。"""
+        if self.buffers is None:
+            return None
+        return self.buffers.output_for(image)
+
+    def parameter(self, values):
+        """将数组参数转换为缓冲区的dtype，避免在计算中被提升为float64。"""
+        if self.buffers is None:
+            return values
+        return np.asarray(values, dtype=self.buffers.dtype)
+
+
+# 一个阶段接收上一阶段的图像和渲染上下文，返回本阶段的图像
+RenderStage = Callable[[np.ndarray, RenderContext], np.ndarray]
+
+
+# --- 默认阶段实现 ---
+# 所有默认阶段都是逐像素的，分块执行时不需要重叠的边缘（halo）；
+# 只有全图统计量通过context.statistics共享。
+
+def density_stage(image_dn: np.ndarray, context: RenderContext) -> np.ndarray:
+    """原始DN -> 光学密度。"""
+    return density_proc.dn_to_density(
+        image_dn,
+        icc_bytes=context.frame.icc_bytes,
+        light_ratio=context.frame.technical_recipe.light_ratio,
+        out=context.work_buffer(image_dn),
+    )
+
+
+def density_net_stage(image_density: np.ndarray, context: RenderContext) -> np.ndarray:
+    """光学密度 -> 相对密度 (Dnet)。"""
+    return density_proc.density_to_net(
+        image_density,
+        dmin=context.parameter(context.calibration.d_min),
+        dmax=context.parameter(context.calibration.d_max),
+        out=context.work_buffer(image_density)
+    )
+
+
+def normalize_stage(image_density_net: np.ndarray, context: RenderContext) -> np.ndarray:
+    """确定目标高密度点并归一化相对密度。"""
+    target = statistic(
+        context, "target_extrema_high_density",
+        lambda: target_extrema_high_density(image_density_net, context.frame.technical_recipe)
+    )
+
+    return density_proc.normalize_density_net(
+        image_density_net,
+        extrema_high_density=float(context.calibration.extrema_high_density_net),
+        target_extrema_high_density=float(target),
+        out=context.work_buffer(image_density_net)
+    )
+
+
+def align_stage(image_normalized: np.ndarray, context: RenderContext) -> np.ndarray:
+    """按k值对齐三个通道。"""
+    return align_proc.align_three_channels(
+        image_normalized,
+        k=context.calibration.k_values,
+        out=context.work_buffer(image_normalized)
+    )
+
+
+def clip_stage(image_aligned: np.ndarray, context: RenderContext) -> np.ndarray:
+    """按裁切阈值截断高密度部分。"""
+    return np.clip(
+        image_aligned, None, clip_limit(context),
+        out=context.work_buffer(image_aligned)
+    )
+
+
+def linear_stage(image_clipped: np.ndarray, context: RenderContext) -> np.ndarray:
+    """相对密度 -> 线性RGB (ACES2065-1)。"""
+    return conversion_proc.density_to_linear(
+        image_clipped,
+        context.ocio_config,
+        "ACES2065-1",
+        out=context.work_buffer(image_clipped)
+    )
+
+
+def rolloff_stage(image_linear: np.ndarray, context: RenderContext) -> np.ndarray:
+    """目标高密度点超过阈值时，对高光应用Rolloff。"""
+    recipe = context.frame.technical_recipe
+    if context.statistics.target_extrema_high_density <= recipe.extrema_high_density_threshold:
+        return image_linear
+
+    linear_max = statistic(context, "linear_max", lambda: image_linear.max())
+    # rolloff目前不读取levels，不再为它在全图上计算百分位；
+    # 使用levels后应由tone_proc.rolloff_levels计算并作为全局统计量冻结，保证各条带一致
+    out = context.work_buffer(image_linear)
+    image_linear_rolloff = tone_proc.rolloff(
+        image_linear,
+        recipe.extrema_high_density_percentile,
+        recipe.extrema_high_density_multiplier,
+        recipe.threshold_percentile,
+        recipe.threshold_multiplier,
+        out=out,
+    )
+    rolloff_max = statistic(context, "rolloff_max", lambda: image_linear_rolloff.max())
+    # 缩放只作用于本阶段的输出（工作缓冲区或rolloff新分配的数组），不修改输入
+    return np.multiply(image_linear_rolloff, linear_max / rolloff_max, out=out)
+
+
+def display_stage(image_linear: np.ndarray, context: RenderContext) -> np.ndarray:
+    """线性RGB -> 显示空间，使用LUT或OCIO显示转换。"""
+    creative = context.frame.creative_recipe
+    if creative.display_mode == "LUT":
+        lut_cube, domain_min, domain_max = get_lut_registry().get(
+            lut_dir / creative.lut_name,
+        )
+        return conversion_proc.apply_lut(
+            image_linear,
+            lut_cube,
+            domain_min,
+            domain_max,
+            max_data=statistic(context, "display_input_max", lambda: image_linear.max()),
+            out=context.work_buffer(image_linear),
+        )
+    elif creative.display_mode == "Displays":
+        return conversion_proc.linear_to_display(
+            image_linear,
+            context.ocio_config,
+            display_space=creative.display_space,
+        )
+    else:
+        raise ValueError(f"Unsupported display mode: {creative.display_mode}")
+
+
+def tone_stage(image_sdr: np.ndarray, context: RenderContext) -> np.ndarray:
+    """色调映射并归一化到 [0, 1]。"""
+    image_output = tone_proc.tune_function(
+        image_sdr,
+        function_type=context.frame.creative_recipe.tone_mapping,
+        max_value=statistic(context, "sdr_max", lambda: np.max(image_sdr)),
+        out=context.work_buffer(image_sdr)
+    )
+    output_max = statistic(context, "output_max", lambda: image_output.max())
+    return np.divide(image_output, output_max, out=context.work_buffer(image_output))
+
+
+# 默认阶段读取的配方和校准字段，用于阶段缓存的键。
+# 阶段读取新的字段时必须加入此表，否则缓存会在该字段改变后返回旧结果。
+STAGE_INPUTS: dict[str, Callable[[RenderContext], str]] = {
+    "density": lambda context: generate_recipe_fingerprint(
+        context.frame.technical_recipe, ('light_ratio',)),
+    "density_net": lambda context: generate_recipe_fingerprint(
+        context.calibration, ('d_min', 'd_max')),
+    "normalize": lambda context: generate_recipe_fingerprint(
+        context.frame.technical_recipe,
+        ('target_extrema_high_density_mode', 'target_extrema_high_density_factor',
+         'input_target_extrema_high_density')
+    ) + generate_recipe_fingerprint(context.calibration, ('extrema_high_density_net',)),
+    "align": lambda context: generate_recipe_fingerprint(
+        context.calibration, ('k_values',)),
+    "clip": lambda context: generate_recipe_fingerprint(
+        context.calibration, ('clip_threshold', 'extrema_high_density_net')),
+    # OCIO配置在Renderer的生命周期内不变，阶段缓存也属于同一个Renderer
+    "linear": lambda context: "",
+    "rolloff": lambda context: generate_recipe_fingerprint(
+        context.frame.technical_recipe,
+        ('extrema_high_density_threshold', 'extrema_high_density_percentile',
+         'extrema_high_density_multiplier', 'threshold_percentile', 'threshold_multiplier')),
+    # LUT文件被替换或修改后显示阶段失效
+    "display": lambda context: generate_recipe_fingerprint(
+        context.frame.creative_recipe, ('display_mode', 'display_space', 'lut_name')
+    ) + lut_file_key(context.frame.creative_recipe),
+    "tone": lambda context: generate_recipe_fingerprint(
+        context.frame.creative_recipe, ('tone_mapping',)),
+}
+
+# 默认阶段实现的版本，用于导出清单等持久化的指纹。
+# 修改阶段的计算（会改变输出）时必须递增对应的版本，否则已导出的文件不会重新渲染。
+STAGE_VERSIONS: dict[Callable, int] = {
+    density_stage: 1,
+    density_net_stage: 1,
+    normalize_stage: 1,
+    align_stage: 1,
+    clip_stage: 1,
+    linear_stage: 1,
+    rolloff_stage: 1,
+    display_stage: 1,
+    tone_stage: 1,
+}
+
+
+class StageCache:
+    """
+    单帧的阶段缓存，每个检查点阶段只保留最近一次的输出。
+
+    默认检查点为density和linear：只改变创意配方时从线性图像继续，
+    改变技术配方时从光学密度继续，都不需要重新加载源图像。
+    """
+
+    def __init__(self, checkpoints: tuple[str, ...] = ("density", "linear")):
+        self.checkpoints = tuple(checkpoints)
+        self._entries: dict[str, tuple[tuple, np.ndarray, RenderStatistics]] = {}
+
+    def lookup(self, name: str, key: tuple) -> tuple[np.ndarray, RenderStatistics] | None:
+        """键一致时返回缓存的 (图像副本, 统计量)。"""
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1].copy(), replace(entry[2])
+
+    def store(self, name: str, key: tuple, image: np.ndarray, statistics: RenderStatistics) -> None:
+        if name in self.checkpoints:
+            self._entries[name] = (key, image.copy(), replace(statistics))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class BakedChainStage:
+    """
+    将一段逐像素阶段烘焙为一个3D LUT，每个像素只做一次插值（默认四面体插值）。
+
+    链中的全局统计量先在长边不超过statistics_size的降采样输入上计算（已冻结时直接使用），
+    之后整段链在定义域的格点上执行一次得到LUT。阶段输入（STAGE_INPUTS）、统计量和
+    定义域都不变时复用上一次的LUT，降采样输入和阶段输入都不变时也复用上一次收集的统计量，
+    因此连续渲染同一帧或同一组配方时既不重跑统计也不重建LUT。
+    定义域为输入逐通道的最小值到min(最大值, 裁切上限)，之外的值按边界处理；
+    宽度为0的通道（例如恒定通道）所有值都取该通道唯一的格点值。
+    """
+
+    # 烘焙和插值方式的版本，改变LUT的生成或应用方式时递增
+    VERSION = 1
+
+    # 由链在降采样输入上收集的统计量（定义域在全图上单独计算）
+    _STATISTIC_NAMES = tuple(
+        statistic_field.name for statistic_field in fields(RenderStatistics)
+        if statistic_field.name not in ("baked_domain", "frozen")
+    )
+
+    def __init__(
+        self,
+        stages: list[tuple[str, RenderStage]],
+        size: int = 65,
+        statistics_size: int = 256,
+        method: str = "tetrahedral"
+    ):
+        if size < 2:
+            raise ValueError(f"LUT size must be at least 2, got {size}")
+        self.chain = RenderPipeline(stages)
+        self.size = size
+        self.method = method
+        self.statistics_size = statistics_size
+        # (键, 值) 作为一个元组整体发布：共享同一渲染器的多个渲染线程
+        # 只会读到某次写入的完整一对，不会把一帧的键和另一帧的结果配在一起
+        self._statistics_entry = None
+        self._lut_entry = None
+
+    def __call__(self, image: np.ndarray, context: RenderContext) -> np.ndarray:
+        if not context.statistics.frozen:
+            self._collect_statistics(image, context)
+
+        domain_min, domain_max = statistic(context, "baked_domain", lambda: self._domain(image, context))
+        lut = self.lut(context, domain_min, domain_max)
+        return conversion_proc.apply_lut(
+            image, lut, domain_min, domain_max,
+            max_data=1.0,
+            method=self.method,
+            out=context.work_buffer(image)
+        )
+
+    def _collect_statistics(self, image: np.ndarray, context: RenderContext) -> None:
+        """在降采样输入上执行一次链以收集统计量；输入和阶段参数未变时直接复用上一次的结果。"""
+        step = max(1, -(-max(image.shape[:2]) // self.statistics_size))
+        proxy = np.ascontiguousarray(image[::step, ::step])
+        stage_inputs = self._stage_inputs(context)
+        key = None
+        if stage_inputs is not None:
+            key = (
+                stage_inputs, repr(self._statistics(context)),
+                proxy.shape, proxy.dtype.str, hashlib.sha256(proxy).hexdigest()
+            )
+
+        entry = self._statistics_entry
+        if key is not None and entry is not None and entry[0] == key:
+            for name, value in entry[1].items():
+                setattr(context.statistics, name, value)
+            return
+
+        self.chain.run(proxy.copy(), replace(context, buffers=None))
+        collected = dict(zip(self._STATISTIC_NAMES, self._statistics(context)))
+        if key is not None:
+            self._statistics_entry = (key, collected)
+
+    @staticmethod
+    def _domain(image: np.ndarray, context: RenderContext) -> tuple[np.ndarray, np.ndarray]:
+        # 恒定通道或最小值不低于裁切上限时定义域宽度为0，该通道的LUT轴退化为一个值，
+        # apply_lut把它映射到格点0；上限不小于下限，避免出现反向的定义域
+        domain_min = image.min(axis=(0, 1))
+        domain_max = np.maximum(np.minimum(image.max(axis=(0, 1)), clip_limit(context)), domain_min)
+        return domain_min, domain_max
+
+    def lut(self, context: RenderContext, domain_min: np.ndarray, domain_max: np.ndarray) -> np.ndarray:
+        """返回当前输入对应的LUT，必要时重新烘焙。"""
+        key = self._key(context, domain_min, domain_max)
+        entry = self._lut_entry
+        if key is not None and entry is not None and entry[0] == key:
+            return entry[1]
+
+        lut = self._bake(context, domain_min, domain_max)
+        self._lut_entry = (key, lut)
+        return lut
+
+    def _stage_inputs(self, context: RenderContext) -> tuple | None:
+        """链中各阶段及其输入；链中有无法确定输入的阶段时为None。"""
+        stage_inputs = []
+        for name, stage in self.chain._stages:
+            if name not in STAGE_INPUTS:
+                return None
+            stage_inputs.append((name, stage, STAGE_INPUTS[name](context)))
+        return tuple(stage_inputs)
+
+    def _statistics(self, context: RenderContext) -> tuple:
+        """除定义域和冻结标记外的全部统计量。"""
+        return tuple(getattr(context.statistics, name) for name in self._STATISTIC_NAMES)
+
+    def _key(self, context: RenderContext, domain_min: np.ndarray, domain_max: np.ndarray):
+        """由链中各阶段的输入、统计量和定义域组成的键；链中有无法确定输入的阶段时为None。"""
+        stage_inputs = self._stage_inputs(context)
+        if stage_inputs is None:
+            return None
+        return (
+            stage_inputs, repr(self._statistics(context)),
+            tuple(domain_min.tolist()), tuple(domain_max.tolist()), self.size
+        )
+
+    def _bake(self, context: RenderContext, domain_min: np.ndarray, domain_max: np.ndarray) -> np.ndarray:
+        """在定义域格点上执行整段链，统计量冻结为当前值。"""
+        axes = [np.linspace(domain_min[c], domain_max[c], self.size) for c in range(3)]
+        lattice = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+        bake_context = replace(
+            context,
+            statistics=replace(context.statistics, frozen=True),
+            buffers=None
+        )
+        lut = self.chain.run(lattice.reshape(self.size * self.size, self.size, 3), bake_context)
+        return np.ascontiguousarray(lut.reshape(self.size, self.size, self.size, 3))
+
+
+# --- 辅助函数 ---
+
+def default_lut_cache_dir() -> Path:
+    """当前用户的LUT缓存目录（macOS为 ~/Library/Caches，Windows为 %LOCALAPPDATA%，其它为XDG缓存目录）。"""
+    if sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    elif sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        base = Path(os.environ["LOCALAPPDATA"])
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "Revela" / "lut"
+
+
+def configure_lut_registry(cache_dir: Path | None) -> LutRegistry:
+    """按应用配置的目录重建共享的LUT缓存；cache_dir为None时只缓存在内存中。"""
+    global _lut_registry
+    with _lut_registry_lock:
+        _lut_registry = LutRegistry(cache_dir=cache_dir)
+        return _lut_registry
+
+
+def get_lut_registry() -> LutRegistry:
+    """进程内共享的LUT缓存；未配置时在首次使用时创建，旁路文件写入default_lut_cache_dir。"""
+    global _lut_registry
+    with _lut_registry_lock:
+        if _lut_registry is None:
+            _lut_registry = LutRegistry(cache_dir=default_lut_cache_dir())
+        return _lut_registry
+
+
+def lut_file_key(creative) -> str:
+    """LUT显示模式下所用.cube文件的标识（路径、大小和修改时间），其它模式为空串。"""
+    if creative.display_mode != "LUT":
+        return ""
+    lut_path = lut_dir / creative.lut_name
+    return generate_file_key(lut_path) if lut_path.exists() else ""
+
+
+def stage_identity(stage: RenderStage) -> str:
+    """
+    阶段实现的标识，跨进程和Python版本稳定，用于导出清单等持久化的指纹。
+
+    函数由模块、限定名和版本（STAGE_VERSIONS，或函数的stage_version属性）决定；
+    BakedChainStage由其版本、参数和链中各阶段决定；没有版本的可调用对象只能使用repr，
+    默认的repr含对象地址，每次运行都不同，不会被误判为未改变。
+    """
+    if isinstance(stage, BakedChainStage):
+        return (f"BakedChainStage(version={BakedChainStage.VERSION}, size={stage.size}, "
+                f"method={stage.method}, statistics_size={stage.statistics_size}, "
+                f"chain={stage.chain.fingerprint()})")
+    version = STAGE_VERSIONS.get(stage, getattr(stage, 'stage_version', None))
+    if version is not None:
+        qualname = getattr(stage, '__qualname__', type(stage).__qualname__)
+        return f"{stage.__module__}.{qualname}:v{version}"
+    return repr(stage)
+
+
+def target_extrema_high_density(density_net: np.ndarray, recipe: TechnicalRecipe) -> float:
+    """根据技术配方确定目标高密度点。"""
+    if recipe.target_extrema_high_density_mode == "Auto":
+        return align_proc.robust_skewness_index(
+            density_net,
+            factor=recipe.target_extrema_high_density_factor
+        )
+    elif recipe.target_extrema_high_density_mode == "Manual":
+        return recipe.input_target_extrema_high_density
+    else:
+        raise ValueError("target_extrema_high_density_mode is not supported: "
+                         f"{recipe.target_extrema_high_density_mode}")
+
+
+def clip_limit(context: RenderContext) -> float:
+    """归一化后相对密度的裁切上限。"""
+    calibration = context.calibration
+    return (
+        calibration.clip_threshold / calibration.extrema_high_density_net
+    ) * context.statistics.target_extrema_high_density
+
+
+def _restore_statistics(statistics: RenderStatistics, cached: RenderStatistics) -> None:
+    """用缓存的统计量填充尚未确定的字段。"""
+    for statistic_field in fields(RenderStatistics):
+        if statistic_field.name == "frozen":
+            continue
+        if getattr(statistics, statistic_field.name) is None:
+            setattr(statistics, statistic_field.name, getattr(cached, statistic_field.name))
+
+
+def statistic(context: RenderContext, name: str, compute: Callable[[], float]):
+    """读取全局统计量；尚未确定时调用compute从当前图像计算并记录。"""
+    statistics = context.statistics
+    value = getattr(statistics, name)
+    if value is None:
+        if statistics.frozen:
+            raise RuntimeError(f"Render statistic '{name}' was not collected before "
+                               "the statistics were frozen.")
+        value = compute()
+        setattr(statistics, name, value)
+    return value
+
+
+class RenderPipeline:
+    """
+    由命名阶段组成的渲染流水线。
+
+    预览和全尺寸渲染驱动同一条流水线，只在输入来源和输出变换上不同。
+    每个阶段都可以通过with_stage替换为其它实现（例如融合或分块的版本），
+    流水线本身不关心阶段的具体实现。
+    """
+
+    def __init__(self, stages: list[tuple[str, RenderStage]]):
+        names = [name for name, _ in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Stage names must be unique, got {names}")
+        self._stages = list(stages)
+
+    @classmethod
+    def default(cls) -> RenderPipeline:
+        """密度 -> 相对密度 -> 归一化 -> 对齐 -> 裁切 -> 线性 -> Rolloff -> 显示 -> 色调。"""
+        return cls([
+            ("density", density_stage),
+            ("density_net", density_net_stage),
+            ("normalize", normalize_stage),
+            ("align", align_stage),
+            ("clip", clip_stage),
+            ("linear", linear_stage),
+            ("rolloff", rolloff_stage),
+            ("display", display_stage),
+            ("tone", tone_stage),
+        ])
+
+    @property
+    def stage_names(self) -> list[str]:
+        return [name for name, _ in self._stages]
+
+    def stage(self, name: str) -> RenderStage:
+        """获取指定名称的阶段实现。"""
+        for stage_name, stage in self._stages:
+            if stage_name == name:
+                return stage
+        raise KeyError(f"Unknown render stage: {name}")
+
+    def with_stage(self, name: str, stage: RenderStage) -> RenderPipeline:
+        """返回将指定阶段替换为新实现的流水线，原流水线不变。"""
+        self.stage(name)
+        return RenderPipeline([
+            (stage_name, stage if stage_name == name else old_stage)
+            for stage_name, old_stage in self._stages
+        ])
+
+    def run(self, image: np.ndarray, context: RenderContext) -> np.ndarray:
+        """依次执行所有阶段。"""
+        for _, stage in self._stages:
+            image = stage(image, context)
+        return image
+
+    def with_baked_chain(self, after: str = "align", size: int = 65) -> RenderPipeline:
+        """
+        返回将after之后的所有阶段烘焙为一个3D LUT阶段（名为baked_chain）的流水线。
+
+        after之后的阶段必须都是逐像素的RGB -> RGB函数。
+        """
+        names = self.stage_names
+        split = names.index(after) + 1 if after in names else None
+        if split is None:
+            raise KeyError(f"Unknown render stage: {after}")
+        if split == len(names):
+            raise ValueError(f"No stages to bake after '{after}'")
+        return RenderPipeline(
+            self._stages[:split]
+            + [("baked_chain", BakedChainStage(self._stages[split:], size=size))]
+        )
+
+    def stage_keys(self, source_key, context: RenderContext) -> list[tuple | None]:
+        """
+        每个阶段输出的缓存键，由源图像、之前所有阶段和本阶段的输入共同决定。
+
+        不在STAGE_INPUTS中的阶段（例如自定义名称的阶段）无法确定输入，
+        它及之后阶段的键为None，不参与缓存。
+        """
+        keys = []
+        key = (source_key,)
+        for name, stage in self._stages:
+            if key is not None and name in STAGE_INPUTS:
+                key = (key, name, stage, STAGE_INPUTS[name](context))
+            else:
+                key = None
+            keys.append(key)
+        return keys
+
+    def run_cached(
+        self,
+        load_source: Callable[[], np.ndarray],
+        source_key,
+        context: RenderContext,
+        cache: StageCache
+    ) -> np.ndarray:
+        """
+        从缓存中最靠后的有效检查点继续执行流水线，并更新检查点。
+
+        只有所有检查点都失效时才调用load_source加载源图像。
+        """
+        keys = self.stage_keys(source_key, context)
+
+        start, image = 0, None
+        for index in reversed(range(len(self._stages))):
+            if keys[index] is None:
+                continue
+            cached = cache.lookup(self._stages[index][0], keys[index])
+            if cached is not None:
+                image, statistics = cached
+                _restore_statistics(context.statistics, statistics)
+                start = index + 1
+                break
+        if image is None:
+            image = load_source()
+
+        for index in range(start, len(self._stages)):
+            name, stage = self._stages[index]
+            image = stage(image, context)
+            if keys[index] is not None:
+                cache.store(name, keys[index], image, context.statistics)
+        return image
+
+    def collect_statistics(self, sample: np.ndarray, context: RenderContext) -> None:
+        """
+        在代表性样本上执行一遍流水线，记录全局统计量后冻结。
+
+        样本通常是全尺寸图像的降采样视图；为全尺寸图像本身时，
+        后续分块渲染的结果与整图渲染完全一致。
+        """
+        self.run(sample, context)
+        context.statistics.freeze()
+
+    def run_strips(
+        self,
+        image: np.ndarray,
+        context: RenderContext,
+        strip_rows: int
+    ) -> Iterator[tuple[slice, np.ndarray]]:
+        """
+        按行条带依次执行流水线，逐个产出 (行范围, 条带结果)。
+
+        峰值内存只与条带大小有关。context.statistics必须已经由collect_statistics冻结。
+        """
+        if strip_rows < 1:
+            raise ValueError(f"strip_rows must be at least 1, got {strip_rows}")
+        if not context.statistics.frozen:
+            raise RuntimeError("Render statistics must be collected before running strips.")
+
+        height = image.shape[0]
+        for start in range(0, height, strip_rows):
+            rows = slice(start, min(start + strip_rows, height))
+            yield rows, self.run(image[rows], context)
+
+    def fingerprint(self) -> str:
+        """各阶段名称与实现的指纹，任一阶段替换为其它实现时改变。"""
+        hasher = hashlib.sha256()
+        for name, stage in self._stages:
+            hasher.update(f"{name}={stage_identity(stage)};".encode('utf-8'))
+        return hasher.hexdigest()[:16]
+
+    def __repr__(self) -> str:
+        return f"RenderPipeline({' -> '.join(self.stage_names)})"
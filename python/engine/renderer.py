@@ -28,6 +28,10 @@ For more information, please refer to the project documentation.
 
 
 from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
 from pathlib import Path
 
 import numpy as np
@@ -37,14 +41,13 @@ from core.calibration import RollCalibrationProfile
 from core.memory_manager import memory_cleanup_context, MemoryMonitor
 
 from processing import image_loader as loader_proc
-from processing import density as density_proc
-from processing import alignment as align_proc
-from processing import conversion as conversion_proc
-from processing import tone as tone_proc
+from processing import cache_utils
+from processing.pyramid_cache import ThumbnailPyramid
 from processing import color_space as colorspace_proc
+from processing import conversion as conversion_proc
 
-
-lut_dir = Path(__file__).parent.parent.parent / "data" / "lut"
+from .pipeline import RenderPipeline, RenderContext, RenderBuffers, RenderStatistics, StageCache
+from .pipeline import lut_file_key
 
 
 class Renderer:
@@ -54,11 +57,40 @@ class Renderer:
     提供两种渲染模式：
     - render_preview: 用于实时预览，使用缩略图数据，速度快
     - render_full_quality: 用于最终导出，使用全尺寸原始数据，质量高
+    - render_full_quality_tiled: 与render_full_quality相同，但按条带渲染，中间结果内存有界
+
+    两种模式驱动同一条RenderPipeline，只在输入来源和输出变换上不同。
     """
 
-    def __init__(self, ocio_config):
+    def __init__(
+        self,
+        ocio_config,
+        pipeline: RenderPipeline | None = None,
+        buffer_dtype=None,
+        max_cached_frames: int = 4,
+        proxy_statistics_size: tuple[int, int] | None = None,
+        thumbnail_pyramid: bool = False
+    ):
         # Renderer可能需要一些配置，比如OCIO配置，在创建时传入
         self.ocio_config = ocio_config
+        # 构建好的OCIO处理器在所有帧和线程间复用
+        self.ocio_processors = (
+            conversion_proc.OcioProcessorCache(ocio_config) if ocio_config is not None else None
+        )
+        # 渲染流水线，可替换其中的单个阶段
+        self.pipeline = pipeline if pipeline is not None else RenderPipeline.default()
+        # 给定时（例如np.float32）每帧分配两块该精度的工作缓冲区，各阶段原地交替写入；
+        # float32的输出与默认float64路径的差异在pipeline.FLOAT32_TOLERANCE以内
+        self.buffer_dtype = buffer_dtype
+        # 预览的逐帧阶段缓存（LRU），只改变配方时从中间结果继续渲染
+        self.max_cached_frames = max_cached_frames
+        self._stage_caches: OrderedDict[Path, StageCache] = OrderedDict()
+        self._stage_caches_lock = threading.Lock()
+        # 给定时全尺寸渲染的全局统计量取自该尺寸的缩略图（与预览共用阶段缓存），
+        # 不再在全尺寸数据上做归约，分块渲染也不需要预先扫描全图
+        self.proxy_statistics_size = proxy_statistics_size
+        # 为True时缩略图取自胶卷目录下的缩略图金字塔（与分析共用），不再重新解码原始文件
+        self.thumbnail_pyramid = thumbnail_pyramid
         self.memory_monitor = MemoryMonitor(warning_threshold_mb=500)
 
     def render_preview(
@@ -76,108 +108,12 @@ class Renderer:
         print(f"开始渲染预览帧: {frame.filename}...")
         self.memory_monitor.log_usage("预览渲染开始")
 
-        # 0) 加载预览图像并计算光学密度
-        loader_proc.load_thumbnail(frame, preview_target_size)
-        if frame.thumbnail_data is None:
-            raise ValueError("Frame thumbnail data has not been loaded.")
-
-        # 读取ICC配置文件
-        if frame.icc_bytes is None:
-            loader_proc.load_icc_bytes(frame)
-            if frame.icc_bytes is None:
-                raise ValueError("Frame ICC bytes have not been loaded.")
-
-        image_density = density_proc.dn_to_density(
-            frame.thumbnail_data,
-            icc_bytes=frame.icc_bytes,
-            light_ratio=frame.technical_recipe.light_ratio,
-        )
-
-        # 1) 计算相对密度 (Dnet) 并归一化
-        image_density_net = density_proc.density_to_net(
-            image_density,
-            dmin=calibration.d_min,
-            dmax=calibration.d_max
-        )
-
-        if frame.technical_recipe.target_extrema_high_density_mode == "Auto":
-            target_extrema_high_density = align_proc.robust_skewness_index(
-                image_density_net,
-                factor=frame.technical_recipe.target_extrema_high_density_factor
-            )
-        elif frame.technical_recipe.target_extrema_high_density_mode == "Manual":
-            target_extrema_high_density = frame.technical_recipe.input_target_extrema_high_density
-        else:
-            raise ValueError("target_extrema_high_density_mode is not supported: "
-                                f"{frame.technical_recipe.target_extrema_high_density_mode}")
-
-        image_density_net_normalized = density_proc.normalize_density_net(
-            image_density_net,
-            extrema_high_density=calibration.extrema_high_density_net,
-            target_extrema_high_density=target_extrema_high_density
-        )
-
-        # 2) 对齐通道并裁切
-        image_density_net_aligned = align_proc.align_three_channels(
-            image_density_net_normalized,
-            k=calibration.k_values
-        )
-        image_density_net_clipped = np.clip(
-            image_density_net_aligned,
-            None,
-            (
-                calibration.clip_threshold / calibration.extrema_high_density_net
-            ) * target_extrema_high_density
-        )
-
-        # 3) 转换为线性RGB
-        image_linear = conversion_proc.density_to_linear(
-            image_density_net_clipped,
-            self.ocio_config,
-            "ACES2065-1"
-        )
-
-        # 应用Rolloff (如果需要)
-        if target_extrema_high_density > frame.technical_recipe.extrema_high_density_threshold:
-            # 应用 Rolloff
-            image_linear_rolloff = tone_proc.rolloff(
-                image_linear,
-                frame.technical_recipe.extrema_high_density_percentile,
-                frame.technical_recipe.extrema_high_density_multiplier,
-                frame.technical_recipe.threshold_percentile,
-                frame.technical_recipe.threshold_multiplier,
-            )
-            image_linear_rolloff *= image_linear.max() / image_linear_rolloff.max()
-            image_linear = image_linear_rolloff
-
-        # 4) 转换到输出
-        if frame.creative_recipe.display_mode == "LUT":
-            lut_cube = conversion_proc.load_lut_cube(
-                lut_dir / frame.creative_recipe.lut_name,
-            )
-            # 使用LUT转换
-            image_sdr = conversion_proc.apply_lut(
-                image_linear,
-                lut_cube,
-                max_data=image_linear.max(),
-            )
-        elif frame.creative_recipe.display_mode == "Displays":
-            # 使用SDR转换
-            image_sdr = conversion_proc.linear_to_display(
-                image_linear,
-                self.ocio_config,
-                display_space=frame.creative_recipe.display_space
-            )
-        else:
-            raise ValueError(f"Unsupported display mode: {frame.creative_recipe.display_mode}")
-
-        # 5) 色调映射
-        image_output = tone_proc.tune_function(
-            image_sdr,
-            function_type=frame.creative_recipe.tone_mapping
+        # 1) 执行渲染流水线，从阶段缓存中最靠后的有效结果继续（有效时不加载预览图像）
+        image_output = self._run_thumbnail(
+            frame, preview_target_size, self._render_context(frame, calibration)
         )
-        image_output = image_output / image_output.max()
 
+        # 2) 输出变换
         if frame.creative_recipe.flip_up_and_down:
             image_output = np.flipud(image_output)
 
@@ -203,141 +139,311 @@ class Renderer:
         :param calibration: 胶卷的校准配置
         :param target_icc_bytes: 目标色彩空间的ICC配置文件字节数据
         """
+        return self.render_full_quality_targets(frame, calibration, [target_icc_bytes])[0]
+
+    def render_full_quality_targets(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile,
+        target_icc_list: list[bytes | None]
+    ) -> list[np.ndarray]:
+        """
+        渲染一次全尺寸图像，分别变换到多个目标色彩空间，按target_icc_list的顺序返回。
+
+        流水线只执行一次，相同的ICC只变换一次（返回同一个数组）。
+        frame.processed_image为第一个目标的结果。
+        """
         print(f"开始渲染全尺寸图像: {frame.filename}...")
         self.memory_monitor.log_usage("全质量渲染开始")
 
-        # 0) 加载全尺寸图像并计算光学密度
-        loader_proc.load_full_quality(frame)
+        # 0) 代理统计量模式下先在缩略图上确定全局统计量
+        statistics = self._proxy_statistics(frame, calibration)
+
+        # 1) 加载全尺寸图像（已预先加载时直接使用）
+        self.load_full_quality(frame)
+
+        # 2) 执行渲染流水线
+        context = self._render_context(frame, calibration, frame.full_quality_data.shape)
+        if statistics is not None:
+            context.statistics = statistics
+        image_output = self.pipeline.run(frame.full_quality_data, context)
+
+        # 3) 输出变换：色彩空间转换
+        transformed: dict[bytes | None, np.ndarray] = {}
+        for target_icc_bytes in target_icc_list:
+            if target_icc_bytes in transformed:
+                continue
+            image_output_transformed = self._transform_to_target_space(
+                image_output, frame, target_icc_bytes
+            )
+            if frame.creative_recipe.flip_up_and_down:
+                image_output_transformed = np.flipud(image_output_transformed)
+            transformed[target_icc_bytes] = image_output_transformed
+        outputs = [transformed[target_icc_bytes] for target_icc_bytes in target_icc_list]
+
+        frame.processed_image = outputs[0]
+        print(f"全尺寸渲染完成: {frame.filename}")
+        
+        # 渲染完成后立即清理原始数据以节省内存
+        if frame.full_quality_data is not None:
+            del frame.full_quality_data
+            frame.full_quality_data = None
+        
+        return outputs
+
+    def load_full_quality(self, frame: Frame) -> None:
+        """
+        加载全尺寸图像和ICC配置文件，已加载时不重复读取。
+
+        导出时可以在其它线程中提前调用，使读取与上一帧的渲染重叠。
+        """
         if frame.full_quality_data is None:
-            raise ValueError("Frame full quality data has not been loaded.")
+            loader_proc.load_full_quality(frame)
+            if frame.full_quality_data is None:
+                raise ValueError("Frame full quality data has not been loaded.")
+        self._ensure_icc_bytes(frame)
 
-        # 读取ICC配置文件
-        if frame.icc_bytes is None:
-            loader_proc.load_icc_bytes(frame)
-            if frame.icc_bytes is None:
-                raise ValueError("Frame ICC bytes have not been loaded.")
+    def iter_full_quality_strips(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile,
+        target_icc_bytes: bytes | None = None,
+        strip_rows: int = 256,
+        statistics_size: int = 1024
+    ) -> Iterator[tuple[slice, np.ndarray]]:
+        """
+        分条带渲染全尺寸图像，按输出图像自上而下的顺序逐个产出 (行范围, 条带结果)，
+        可以直接交给流式写入（image_export.write_tif_strips）。
 
-        image_density = density_proc.dn_to_density(
-            frame.full_quality_data,
-            icc_bytes=frame.icc_bytes,
-            light_ratio=frame.technical_recipe.light_ratio,
-        )
+        全局统计量（目标高密度点、rolloff百分位、各处的max归一化）先在长边
+        不超过statistics_size的降采样视图上计算一次，之后每个条带都使用这组值。
+        中间结果的峰值内存只与条带大小有关。statistics_size不小于图像长边时
+        统计量来自全图，结果与render_full_quality完全一致。
+        设置了proxy_statistics_size时统计量改为取自缩略图，全尺寸数据只经过一遍。
+        使用工作缓冲区时，产出的条带可能在下一次迭代中被覆盖，需要保留时应复制。
 
-        # 1) 计算相对密度 (Dnet) 并归一化
-        image_density_net = density_proc.density_to_net(
-            image_density,
-            dmin=calibration.d_min,
-            dmax=calibration.d_max
-        )
+        :param frame: 要渲染的帧
+        :param calibration: 胶卷的校准配置
+        :param target_icc_bytes: 目标色彩空间的ICC配置文件字节数据
+        :param strip_rows: 每个条带的行数
+        :param statistics_size: 计算全局统计量所用视图的长边上限
+        """
+        print(f"开始分块渲染全尺寸图像: {frame.filename}...")
+        self.memory_monitor.log_usage("分块渲染开始")
 
-        if frame.technical_recipe.target_extrema_high_density_mode == "Auto":
-            target_extrema_high_density = align_proc.robust_skewness_index(
-                image_density_net,
-                factor=frame.technical_recipe.target_extrema_high_density_factor
-            )
-        elif frame.technical_recipe.target_extrema_high_density_mode == "Manual":
-            target_extrema_high_density = frame.technical_recipe.input_target_extrema_high_density
-        else:
-            raise ValueError("target_extrema_high_density_mode is not supported: "
-                                f"{frame.technical_recipe.target_extrema_high_density_mode}")
+        statistics = self._proxy_statistics(frame, calibration)
 
-        image_density_net_normalized = density_proc.normalize_density_net(
-            image_density_net,
-            extrema_high_density=calibration.extrema_high_density_net,
-            target_extrema_high_density=target_extrema_high_density
-        )
+        # 0) 加载全尺寸图像
+        self.load_full_quality(frame)
 
-        # 2) 对齐通道并裁切
-        image_density_net_aligned = align_proc.align_three_channels(
-            image_density_net_normalized,
-            k=calibration.k_values
-        )
-        image_density_net_clipped = np.clip(
-            image_density_net_aligned,
-            None,
-            (
-                calibration.clip_threshold / calibration.extrema_high_density_net
-            ) * target_extrema_high_density
-        )
+        try:
+            image_dn = frame.full_quality_data
+            height, width = image_dn.shape[:2]
 
-        # 3) 转换为线性RGB
-        image_linear = conversion_proc.density_to_linear(
-            image_density_net_clipped,
-            self.ocio_config,
-            "ACES2065-1"
-        )
+            # 1) 一次性计算全局统计量（代理统计量模式下已取自缩略图）
+            if statistics is not None:
+                context = self._render_context(frame, calibration)
+                context.statistics = statistics
+            else:
+                step = max(1, -(-max(height, width) // statistics_size))
+                sample = image_dn[::step, ::step]
+                context = self._render_context(frame, calibration, sample.shape)
+                self.pipeline.collect_statistics(sample, context)
+            if self.buffer_dtype is not None:
+                strip_shape = (min(strip_rows, height),) + image_dn.shape[1:]
+                context.buffers = RenderBuffers(strip_shape, self.buffer_dtype)
+
+            # 2) 逐条带执行流水线和输出变换
+            # 条带之间相互独立，上下翻转时直接从底部开始按倒序的行处理，产出顺序即输出顺序
+            input_colorspace = self._target_input_colorspace(frame)
+            if frame.creative_recipe.flip_up_and_down:
+                image_dn = image_dn[::-1]
+            for rows, strip in self.pipeline.run_strips(image_dn, context, strip_rows):
+                if input_colorspace is not None:
+                    strip = colorspace_proc.color_space_transform(
+                        strip,
+                        input_colorspace=input_colorspace,
+                        output_colorspace=target_icc_bytes
+                    )
+                yield rows, strip
+
+            print(f"分块渲染完成: {frame.filename}")
+        finally:
+            # 无论是否渲染完所有条带，都清理原始数据以节省内存
+            if frame.full_quality_data is not None:
+                del frame.full_quality_data
+                frame.full_quality_data = None
+
+    def render_full_quality_tiled(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile,
+        target_icc_bytes: bytes | None = None,
+        strip_rows: int = 256,
+        statistics_size: int = 1024
+    ) -> np.ndarray:
+        """
+        分条带渲染全尺寸图像并拼接为完整结果，参数见iter_full_quality_strips。
 
-        # 应用Rolloff (如果需要)
-        if target_extrema_high_density > frame.technical_recipe.extrema_high_density_threshold:
-            # 应用 Rolloff
-            image_linear_rolloff = tone_proc.rolloff(
-                image_linear,
-                frame.technical_recipe.extrema_high_density_percentile,
-                frame.technical_recipe.extrema_high_density_multiplier,
-                frame.technical_recipe.threshold_percentile,
-                frame.technical_recipe.threshold_multiplier,
-            )
-            image_linear_rolloff *= image_linear.max() / image_linear_rolloff.max()
-            image_linear = image_linear_rolloff
+        只有输出图像是全尺寸的，中间结果按条带释放。
+        """
+        image_output = None
+        for rows, strip in self.iter_full_quality_strips(
+            frame, calibration, target_icc_bytes, strip_rows, statistics_size
+        ):
+            if image_output is None:
+                height = frame.full_quality_data.shape[0]
+                image_output = np.empty((height,) + strip.shape[1:], dtype=strip.dtype)
+            image_output[rows] = strip
 
-        # 4) 转换到输出
-        if frame.creative_recipe.display_mode == "LUT":
-            lut_cube = conversion_proc.load_lut_cube(
-                lut_dir / frame.creative_recipe.lut_name,
-            )
-            # 使用LUT转换
-            image_sdr = conversion_proc.apply_lut(
-                image_linear,
-                lut_cube,
-                max_data=image_linear.max(),
-            )
-        elif frame.creative_recipe.display_mode == "Displays":
-            # 使用SDR转换
-            image_sdr = conversion_proc.linear_to_display(
-                image_linear,
-                self.ocio_config,
-                display_space=frame.creative_recipe.display_space
-            )
-        else:
-            raise ValueError(f"Unsupported display mode: {frame.creative_recipe.display_mode}")
+        frame.processed_image = image_output
+        return image_output
 
-        # 5) 色调映射
-        image_output = tone_proc.tune_function(
-            image_sdr,
-            function_type=frame.creative_recipe.tone_mapping
+    def render_fingerprint(self, frame: Frame) -> str:
+        """
+        决定该帧渲染结果的渲染器参数的指纹，配方和校准不在其中。
+
+        包括流水线各阶段的实现、工作缓冲区精度、代理统计量尺寸、缩略图来源、
+        OCIO配置的内容和LUT显示模式下.cube文件的标识。
+        """
+        buffer_dtype = None if self.buffer_dtype is None else np.dtype(self.buffer_dtype)
+        parts = (
+            self.pipeline.fingerprint(),
+            str(buffer_dtype),
+            repr(self.proxy_statistics_size),
+            repr(self.thumbnail_pyramid),
+            self._ocio_config_identity(),
+            lut_file_key(frame.creative_recipe),
         )
-        image_output = image_output / image_output.max()
-
-        # 6) 色彩空间转换
-        if frame.creative_recipe.display_mode == "Displays":
-            if frame.creative_recipe.display_space == "Display P3 - Display":
-                image_output_transformed = colorspace_proc.color_space_transform(
-                    image_output,
-                    input_colorspace='Display P3',
-                    output_colorspace=target_icc_bytes
-                )
-                print(f"导出色彩空间: {frame.creative_recipe.display_space}")
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+    def clear_stage_cache(self, frame: Frame | None = None) -> None:
+        """清除指定帧的阶段缓存；frame为None时清除所有帧。"""
+        with self._stage_caches_lock:
+            if frame is None:
+                self._stage_caches.clear()
             else:
-                print(f"使用自定义色彩空间: {frame.creative_recipe.display_space}")
-        elif frame.creative_recipe.display_mode == "LUT":
-            image_output_transformed = colorspace_proc.color_space_transform(
-                image_output,
-                input_colorspace='ITU-R BT.709',
-                output_colorspace=target_icc_bytes
-            )
-            print(f"导出色彩空间: {frame.creative_recipe.display_space}")
-        else:
-            raise ValueError(f"Unsupported display mode: {frame.creative_recipe.display_mode}")
+                self._stage_caches.pop(frame.image_path, None)
 
-        if frame.creative_recipe.flip_up_and_down:
-            image_output_transformed = np.flipud(image_output_transformed)
+    def proxy_statistics(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile,
+        proxy_size: tuple[int, int] = (1024, 1024)
+    ) -> RenderStatistics:
+        """
+        在缩略图上执行一遍流水线，返回冻结的全局统计量，供全尺寸渲染使用。
 
-        frame.processed_image = image_output_transformed
-        print(f"全尺寸渲染完成: {frame.filename}")
-        
-        # 渲染完成后立即清理原始数据以节省内存
-        if frame.full_quality_data is not None:
-            del frame.full_quality_data
-            frame.full_quality_data = None
-        
-        return image_output_transformed
+        与预览共用阶段缓存，预览已渲染过相同尺寸时只需执行对齐之后的阶段。
+        """
+        context = self._render_context(frame, calibration)
+        self._run_thumbnail(frame, proxy_size, context)
+        context.statistics.freeze()
+        return context.statistics
+
+    # --- 私有辅助方法 ---
+
+    def _run_thumbnail(
+        self, frame: Frame,
+        target_size: tuple[int, int],
+        context: RenderContext
+    ) -> np.ndarray:
+        """在缩略图上执行流水线，使用并更新该帧的阶段缓存。"""
+        def load_source() -> np.ndarray:
+            if self.thumbnail_pyramid:
+                pyramid = ThumbnailPyramid.for_roll(frame.image_path.parent)
+                frame.thumbnail_data = pyramid.get(frame.image_path, target_size)
+            else:
+                loader_proc.load_thumbnail(frame, target_size)
+            if frame.thumbnail_data is None:
+                raise ValueError("Frame thumbnail data has not been loaded.")
+            self._ensure_icc_bytes(frame)
+            return frame.thumbnail_data
+
+        # 源文件被替换或修改（大小或修改时间改变）后所有检查点失效
+        return self.pipeline.run_cached(
+            load_source,
+            (cache_utils.generate_file_key(frame.image_path), tuple(target_size)),
+            context,
+            self._stage_cache(frame)
+        )
+
+    def _proxy_statistics(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile
+    ) -> RenderStatistics | None:
+        """代理统计量模式下返回缩略图上的统计量，否则为None。"""
+        if self.proxy_statistics_size is None:
+            return None
+        return self.proxy_statistics(frame, calibration, self.proxy_statistics_size)
+
+    def _ocio_config_identity(self) -> str:
+        # OCIO的缓存ID由配置内容（含引用的文件）决定
+        if self.ocio_config is None:
+            return ""
+        get_cache_id = getattr(self.ocio_config, 'getCacheID', None)
+        return str(get_cache_id()) if get_cache_id is not None else repr(self.ocio_config)
+
+    def _stage_cache(self, frame: Frame) -> StageCache:
+        """获取帧的阶段缓存，超出数量上限时淘汰最久未使用的帧。"""
+        # 导出时多个渲染线程会同时访问
+        with self._stage_caches_lock:
+            cache = self._stage_caches.pop(frame.image_path, None)
+            if cache is None:
+                # 烘焙流水线中没有linear阶段，改为缓存对齐后的结果
+                if "linear" in self.pipeline.stage_names:
+                    cache = StageCache(("density", "linear"))
+                else:
+                    cache = StageCache(("density", "align"))
+            self._stage_caches[frame.image_path] = cache
+            while len(self._stage_caches) > self.max_cached_frames:
+                self._stage_caches.popitem(last=False)
+            return cache
+
+    def _render_context(
+        self, frame: Frame,
+        calibration: RollCalibrationProfile,
+        shape: tuple[int, ...] | None = None
+    ) -> RenderContext:
+        """创建渲染上下文；设置了buffer_dtype时为给定形状（None时按首个输入）分配工作缓冲区。"""
+        buffers = None
+        if self.buffer_dtype is not None:
+            buffers = RenderBuffers(shape, self.buffer_dtype)
+        return RenderContext(frame, calibration, self.ocio_processors, buffers=buffers)
+
+    @staticmethod
+    def _ensure_icc_bytes(frame: Frame) -> None:
+        """读取帧的ICC配置文件。"""
+        if frame.icc_bytes is None:
+            loader_proc.load_icc_bytes(frame)
+            if frame.icc_bytes is None:
+                raise ValueError("Frame ICC bytes have not been loaded.")
+
+    @staticmethod
+    def _target_input_colorspace(frame: Frame) -> str | None:
+        """渲染结果所在的色彩空间；为None时不做导出色彩空间转换。"""
+        creative = frame.creative_recipe
+        if creative.display_mode == "Displays":
+            if creative.display_space == "Display P3 - Display":
+                print(f"导出色彩空间: {creative.display_space}")
+                return 'Display P3'
+            print(f"使用自定义色彩空间: {creative.display_space}")
+            return None
+        elif creative.display_mode == "LUT":
+            print(f"导出色彩空间: {creative.display_space}")
+            return 'ITU-R BT.709'
+        else:
+            raise ValueError(f"Unsupported display mode: {creative.display_mode}")
+
+    @classmethod
+    def _transform_to_target_space(
+        cls,
+        image_output: np.ndarray,
+        frame: Frame,
+        target_icc_bytes: bytes | None
+    ) -> np.ndarray:
+        """将显示空间的渲染结果转换到导出的目标色彩空间。"""
+        input_colorspace = cls._target_input_colorspace(frame)
+        if input_colorspace is None:
+            return image_output
+        return colorspace_proc.color_space_transform(
+            image_output,
+            input_colorspace=input_colorspace,
+            output_colorspace=target_icc_bytes
+        )
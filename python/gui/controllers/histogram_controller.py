@@ -38,8 +38,13 @@ class HistogramWorker(QObject):
     def __init__(self):
         super().__init__()
         
-    def calculateHistogram(self, image_path: str):
-        """计算图像直方图"""
+    def calculateHistogram(self, image_path: str, roll_path: str = ""):
+        """计算图像直方图
+
+        Args:
+            image_path: 图像路径
+            roll_path: 当前加载的胶卷目录，为空表示没有加载胶卷
+        """
         try:
             if not HISTOGRAM_AVAILABLE:
                 # 模拟直方图数据
@@ -47,10 +52,19 @@ class HistogramWorker(QObject):
                 return
                 
             # 实际计算直方图
-            from processing.image_loader import load_image_data
+            from processing import image_loader
             
-            # 加载图像数据
-            image_data = load_image_data(image_path)
+            # 加载图像数据，直方图只需要512级的缩略图
+            path = Path(image_path)
+            image_data = None
+            pyramid = self._roll_pyramid(path, roll_path)
+            if pyramid is not None:
+                try:
+                    image_data = pyramid.get(path, (512, 512))
+                except OSError as e:
+                    print(f"缩略图金字塔读取失败，直接读取原始文件: {e}")
+            if image_data is None:
+                image_data = image_loader.read_thumbnail(path, (512, 512))
             if image_data is None:
                 self.histogramError.emit("无法加载图像数据")
                 return
@@ -72,6 +86,18 @@ class HistogramWorker(QObject):
         except Exception as e:
             self.histogramError.emit(f"计算直方图时出错: {str(e)}")
             
+    @staticmethod
+    def _roll_pyramid(path: Path, roll_path: str):
+        """图像是已加载胶卷中的一帧且缓存目录可写时返回该卷的缩略图金字塔，否则为None"""
+        from processing.pyramid_cache import ThumbnailPyramid
+
+        if not roll_path or path.suffix.lower() != '.tif':
+            return None
+        if path.parent.resolve() != Path(roll_path).resolve():
+            return None
+        pyramid = ThumbnailPyramid.for_roll(Path(roll_path))
+        return pyramid if pyramid.is_writable() else None
+            
     def _simulate_histogram(self):
         """模拟直方图数据"""
         import random
@@ -114,6 +140,7 @@ class HistogramController(QObject):
     histogramDataChanged = Signal()          # 直方图数据变化
     histogramModeChanged = Signal()          # 显示模式变化
     histogramCalculating = Signal(bool)      # 计算状态变化
+    rollPathChanged = Signal()               # 当前胶卷目录变化
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -129,6 +156,8 @@ class HistogramController(QObject):
         self._show_luminance = True
         self._histogram_mode = "RGB"  # "RGB", "Luminance", "All"
         self._is_calculating = False
+        # 当前加载的胶卷目录，只有胶卷中的帧才使用该卷的缩略图金字塔
+        self._roll_path = ""
         
         # 创建计算工作线程
         self._histogram_thread = QThread()
@@ -188,6 +217,16 @@ class HistogramController(QObject):
             self._show_luminance = value
             self.histogramModeChanged.emit()
             
+    @Property(str, notify=rollPathChanged)
+    def rollPath(self) -> str:
+        return self._roll_path
+        
+    @rollPath.setter
+    def rollPath(self, value: str):
+        if self._roll_path != value:
+            self._roll_path = value
+            self.rollPathChanged.emit()
+            
     @Property(bool, notify=histogramCalculating)
     def isCalculating(self) -> bool:
         return self._is_calculating
@@ -214,7 +253,7 @@ class HistogramController(QObject):
         self.histogramCalculating.emit(True)
         
         # 在工作线程中计算直方图
-        self._histogram_worker.calculateHistogram(image_path)
+        self._histogram_worker.calculateHistogram(image_path, self._roll_path)
         
     @Slot()
     def clearHistogram(self):
@@ -6,6 +6,7 @@
 from __future__ import annotations
 
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
@@ -19,10 +20,12 @@ if str(current_dir) not in sys.path:
 
 try:
     from core.roll import Roll
+    from processing.pyramid_cache import ThumbnailPyramid
     CORE_AVAILABLE = True
 except ImportError as e:
     print(f"核心模块导入警告: {e}")
     Roll = None
+    ThumbnailPyramid = None
     CORE_AVAILABLE = False
 
 QML_IMPORT_NAME = "Revela"
@@ -49,6 +52,10 @@ class ProjectController(QObject):
         self._frame_count = 0
         self._loading_progress = 0.0
         self._roll_loaded = False
+
+        # 加载胶卷后在后台建立缩略图金字塔，浏览和直方图不必在首次查看时同步解码原始文件
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pyramid")
+        self._prefetch_futures: list[Future] = []
         
         # 支持的胶片类型
         self._supported_film_types = [
@@ -133,6 +140,7 @@ class ProjectController(QObject):
                 self._current_roll = Roll(folder_path=path, film_type=self._film_type)
                 self._frame_count = len(self._current_roll.frames)
                 print(f"成功加载胶卷，包含 {self._frame_count} 帧")
+                self._start_pyramid_prefetch(path, [frame.image_path for frame in self._current_roll.frames])
             else:
                 # 模拟数据模式
                 print("运行在模拟数据模式")
@@ -158,6 +166,25 @@ class ProjectController(QObject):
             self.loadingProgressChanged.emit()
             self.errorOccurred.emit(f"加载胶卷失败: {str(e)}")
             
+    def _start_pyramid_prefetch(self, folder_path: Path, image_paths: list[Path]):
+        """按帧顺序在后台建立整卷的缩略图金字塔，取消上一卷尚未开始的任务"""
+        self._cancel_pyramid_prefetch()
+        pyramid = ThumbnailPyramid.for_roll(folder_path)
+        self._prefetch_futures = pyramid.prefetch(image_paths, self._prefetch_executor)
+        for future in self._prefetch_futures:
+            future.add_done_callback(self._report_prefetch_error)
+
+    def _cancel_pyramid_prefetch(self):
+        for future in self._prefetch_futures:
+            future.cancel()
+        self._prefetch_futures = []
+
+    @staticmethod
+    def _report_prefetch_error(future: Future):
+        # 预取失败不影响浏览，查看该帧时会再次尝试或直接读取原始文件
+        if not future.cancelled() and future.exception() is not None:
+            print(f"缩略图金字塔预取失败: {future.exception()}")
+
     def _scan_folder_for_images(self, folder_path: Path):
         """扫描文件夹中的图像文件（模拟模式）"""
         image_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.raw', '.dng'}
@@ -174,6 +201,7 @@ class ProjectController(QObject):
     @Slot()
     def unloadRoll(self):
         """卸载当前胶卷"""
+        self._cancel_pyramid_prefetch()
         self._current_roll = None
         self._roll_path = ""
         self._frame_count = 0
@@ -185,6 +213,11 @@ class ProjectController(QObject):
         self.rollLoadedChanged.emit()
         self.loadingProgressChanged.emit()
         
+    def shutdown(self):
+        """关闭项目控制器，等待正在建立的缩略图金字塔完成"""
+        self._cancel_pyramid_prefetch()
+        self._prefetch_executor.shutdown(wait=True)
+
     @Slot(str)
     def setFilmType(self, film_type: str):
         """设置胶片类型"""
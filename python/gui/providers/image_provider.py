@@ -46,6 +46,17 @@ class ImageLoadWorker(QObject):
             
             print(f"[ImageLoadWorker] 文件存在，大小: {path.stat().st_size} 字节")
             
+            # TIFF优先从胶卷的缩略图金字塔读取，避免解码原始文件；结果已不超过请求尺寸
+            if path.suffix.lower() in ('.tif', '.tiff'):
+                try:
+                    image = self._load_from_pyramid(path, requested_size)
+                except Exception as pyramid_error:
+                    print(f"[ImageLoadWorker] 缩略图金字塔加载失败，直接加载原始文件: {pyramid_error}")
+                else:
+                    print(f"[ImageLoadWorker] 从缩略图金字塔加载，尺寸: {image.size()}")
+                    self.imageLoaded.emit(image_id, image)
+                    return
+            
             try:
                 # 尝试使用QPixmap加载图像，然后转换为QImage
                 # 这种方法对某些格式的支持更好
@@ -131,6 +142,32 @@ class ImageLoadWorker(QObject):
             self.loadError.emit(image_id, f"加载图像时发生错误: {str(e)}")
 
 
+    def _load_from_pyramid(self, path: Path, requested_size: QSize) -> QImage:
+        """从缩略图金字塔取出不超过请求尺寸的一级，量化为8位后转换为ARGB32 QImage"""
+        import numpy as np
+        from processing.pyramid_cache import ThumbnailPyramid, PYRAMID_LEVELS
+
+        if requested_size.isValid() and not requested_size.isEmpty():
+            target_size = (requested_size.height(), requested_size.width())
+        else:
+            target_size = (max(PYRAMID_LEVELS), max(PYRAMID_LEVELS))
+        data = ThumbnailPyramid.for_roll(path.parent).get(path, target_size)
+
+        if data.dtype == np.uint16:
+            data = (data >> 8).astype(np.uint8)
+        elif data.dtype != np.uint8:
+            data = (np.clip(data, 0.0, 1.0) * 255 + 0.5).astype(np.uint8)
+        if data.ndim == 2:
+            data = np.repeat(data[..., None], 3, axis=-1)
+        data = np.ascontiguousarray(data)
+
+        height, width = data.shape[:2]
+        # 转换出的QImage持有自己的数据，不依赖numpy数组的生命周期；格式与直接加载的路径一致
+        return QImage(data.data, width, height, 3 * width, QImage.Format_RGB888).convertToFormat(
+            QImage.Format_ARGB32
+        )
+
+
 class FilmImageProvider(QQuickImageProvider):
     """胶片图像提供器"""
     
@@ -107,6 +107,7 @@ def main():
         try:
             export_controller.shutdown()
             analysis_controller.shutdown()
+            project_controller.shutdown()
         except Exception as cleanup_error:
             print(f"[Main] 清理资源时出错: {cleanup_error}")
             
@@ -32,9 +32,11 @@ def calculate_k(
 def align_three_channels(
     density_net: np.ndarray,
     k: list[float] = None,
+    out: np.ndarray = None
 ) -> np.ndarray:
+    # 给定out时结果写入out（不能与输入重叠），否则返回新数组
     if k is None:
         k = [1.0, 0.92, 0.95]
     if len(k) != 3:
         raise ValueError("k must be a list of 3 elements for rgb channels.")
-    return density_net
\ No newline at end of file
+    return np.multiply(density_net, 1.0, out=out)
\ No newline at end of file
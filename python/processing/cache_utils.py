@@ -1,18 +1,214 @@
+import os
 import hashlib
+import tempfile
+from enum import Enum
 from pathlib import Path
-import pandas as pd
 import numpy as np
-from core.calibration import RollCalibrationProfile
+from core.calibration import RollCalibrationProfile, FrameStatistics, RollAnalysisState
 from core.recipe import TechnicalRecipe
 
+# 影响整卷校准结果的技术配方字段。Analyzer使用新的配方字段时必须加入此列表；
+# 其余字段（例如仅用于渲染的rolloff参数和手动模式输入）的改变不会使缓存失效。
+ANALYSIS_RECIPE_FIELDS = (
+    'light_ratio',
+    'dmin_percentile',
+    'dmax_percentile',
+    'bins_number',
+    'extrema_high_density_percentile',
+    'high_density_percentile',
+    'interpolation_factor',
+    'target_extrema_high_density_mode',
+    'target_extrema_high_density_factor',
+    'input_target_extrema_high_density',
+    'efficiency_power',
+)
+
+# 影响逐帧统计量的配方字段：只有光源比例决定密度。
+# 各种百分位都由缓存的逐帧直方图求得，修改它们不需要重新解码
+FRAME_STATS_RECIPE_FIELDS = ('light_ratio',)
+
+def generate_recipe_fingerprint(recipe, fields: tuple[str, ...]) -> str:
+    # 规范化序列化：字段名 + 类型标记 + 小端精确字节，与repr、numpy打印选项和平台无关
+    hasher = hashlib.sha256(b'recipe-fingerprint-v1')
+    for name in fields:
+        hasher.update(name.encode('utf-8'))
+        hasher.update(_canonical_bytes(getattr(recipe, name)))
+    return hasher.hexdigest()[:16]
+
+# 校准配置文件中影响渲染结果的全部字段
+CALIBRATION_FIELDS = (
+    'd_min',
+    'd_max',
+    'hist_bins',
+    'hist_values',
+    'k_values',
+    'extrema_high_density_net',
+    'clip_threshold',
+)
+
 def generate_recipe_key(recipe: TechnicalRecipe) -> str:
-    recipe_string = repr(recipe)
+    return generate_recipe_fingerprint(recipe, ANALYSIS_RECIPE_FIELDS)
+
+def _canonical_bytes(value) -> bytes:
+    if value is None:
+        return b'n'
+    if isinstance(value, Enum):
+        return b'e' + _canonical_bytes(value.value)
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        return b's' + len(data).to_bytes(8, 'little') + data
+    if isinstance(value, bytes):
+        return b'y' + len(value).to_bytes(8, 'little') + value
+    if isinstance(value, (bool, np.bool_)):
+        return b'b' + bytes([bool(value)])
+    if isinstance(value, (int, np.integer)):
+        return b'i' + np.asarray(value, dtype='<i8').tobytes()
+    if isinstance(value, (float, np.floating)):
+        return b'f' + np.asarray(value, dtype='<f8').tobytes()
+    array = np.asarray(value, dtype='<f8')
+    shape = np.asarray(array.shape, dtype='<i8')
+    return b'a' + len(shape).to_bytes(1, 'little') + shape.tobytes() + array.tobytes()
+
+def generate_file_key(file_path: Path) -> str:
+    # 以路径、大小和修改时间标识文件，文件被替换或修改后键随之改变
+    stat = file_path.stat()
+    identity = f"{file_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+def generate_files_key(file_paths: list[Path]) -> str:
+    # 整卷输入文件的指纹：任何一帧增删或修改都会改变该键
+    hasher = hashlib.sha256()
+    for file_path in file_paths:
+        hasher.update(generate_file_key(file_path).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+def generate_frame_stats_key(image_path: Path, recipe: TechnicalRecipe, source: str = "direct") -> str:
+    # source为缩略图来源（"direct"或"pyramid"），两者解码出的缩略图不完全相同，统计量分开缓存
     hasher = hashlib.sha256()
-    hasher.update(recipe_string.encode('utf-8'))
+    hasher.update(generate_file_key(image_path).encode('utf-8'))
+    hasher.update(source.encode('utf-8'))
+    hasher.update(generate_recipe_fingerprint(recipe, FRAME_STATS_RECIPE_FIELDS).encode('utf-8'))
     return hasher.hexdigest()[:16]
 
-def save_profile_to_csv(profile: RollCalibrationProfile, file_path: Path):
-    pass
+# 校准配置文件的二进制缓存格式版本，字段或语义变化时递增，旧版本缓存视为未命中
+PROFILE_FORMAT_VERSION = 1
+
+def save_profile(profile: RollCalibrationProfile, file_path: Path):
+    _atomic_savez(
+        file_path,
+        format_version=np.array(PROFILE_FORMAT_VERSION),
+        d_min=profile.d_min,
+        d_max=profile.d_max,
+        hist_bins=profile.hist_bins,
+        hist_values=profile.hist_values,
+        k_values=profile.k_values,
+        extrema_high_density_net=np.float64(profile.extrema_high_density_net),
+        clip_threshold=np.float64(profile.clip_threshold),
+    )
+
+def load_profile(file_path: Path) -> RollCalibrationProfile | None:
+    if not file_path.exists():
+        return None
+    try:
+        with np.load(file_path) as data:
+            if int(data['format_version']) != PROFILE_FORMAT_VERSION:
+                return None
+            return RollCalibrationProfile(
+                d_min=data['d_min'],
+                d_max=data['d_max'],
+                hist_bins=data['hist_bins'],
+                hist_values=data['hist_values'],
+                k_values=data['k_values'],
+                extrema_high_density_net=float(data['extrema_high_density_net']),
+                clip_threshold=float(data['clip_threshold']),
+            )
+    except (OSError, KeyError, ValueError) as e:
+        print(f"校准缓存损坏，将重新分析: {file_path.name} ({e})")
+        return None
+
+# 逐帧统计缓存的格式版本，字段、直方图bin或样本尺寸变化时递增，旧版本缓存视为未命中
+FRAME_STATS_FORMAT_VERSION = 3
+
+def save_frame_statistics(stats: FrameStatistics, file_path: Path):
+    _atomic_savez(
+        file_path,
+        format_version=np.array(FRAME_STATS_FORMAT_VERSION),
+        histogram=stats.histogram,
+        histogram_range=stats.histogram_range,
+        density_low=stats.density_low,
+        density_high=stats.density_high,
+        k_sample=stats.k_sample,
+    )
+
+def load_frame_statistics(file_path: Path) -> FrameStatistics | None:
+    if not file_path.exists():
+        return None
+    try:
+        with np.load(file_path) as data:
+            if 'format_version' not in data or int(data['format_version']) != FRAME_STATS_FORMAT_VERSION:
+                return None
+            return FrameStatistics(
+                histogram=data['histogram'],
+                histogram_range=data['histogram_range'],
+                density_low=data['density_low'],
+                density_high=data['density_high'],
+                k_sample=data['k_sample'],
+            )
+    except (OSError, KeyError, ValueError) as e:
+        print(f"逐帧统计缓存损坏，将重新计算: {file_path.name} ({e})")
+        return None
+
+# 增量分析状态的格式版本，字段或逐帧贡献的语义变化时递增，旧版本状态视为不存在
+ANALYSIS_STATE_FORMAT_VERSION = 1
+
+def save_analysis_state(state: RollAnalysisState, file_path: Path):
+    histogram_keys = list(state.frame_histograms)
+    k_keys = list(state.frame_k_values)
+    _atomic_savez(
+        file_path,
+        format_version=np.array(ANALYSIS_STATE_FORMAT_VERSION),
+        histogram_key=np.array(state.histogram_key),
+        k_key=np.array(state.k_key),
+        histogram_frame_keys=np.array(histogram_keys, dtype=str),
+        frame_histograms=np.array([state.frame_histograms[k] for k in histogram_keys]),
+        k_frame_keys=np.array(k_keys, dtype=str),
+        frame_k_values=np.array([state.frame_k_values[k] for k in k_keys]),
+    )
+
+def load_analysis_state(file_path: Path) -> RollAnalysisState | None:
+    if not file_path.exists():
+        return None
+    try:
+        with np.load(file_path) as data:
+            if 'format_version' not in data or int(data['format_version']) != ANALYSIS_STATE_FORMAT_VERSION:
+                print(f"增量分析状态版本不匹配，将完整重新分析: {file_path.name}")
+                return None
+            return RollAnalysisState(
+                histogram_key=str(data['histogram_key']),
+                k_key=str(data['k_key']),
+                frame_histograms=dict(zip(data['histogram_frame_keys'].tolist(), data['frame_histograms'])),
+                frame_k_values=dict(zip(data['k_frame_keys'].tolist(), data['frame_k_values'])),
+            )
+    except (OSError, KeyError, ValueError) as e:
+        print(f"增量分析状态损坏，将完整重新分析: {file_path.name} ({e})")
+        return None
+
+def prune_cache_files(directory: Path, pattern: str, keep: set[Path]) -> int:
+    """删除directory中匹配pattern且不在keep中的缓存文件，返回删除的数量。"""
+    removed = 0
+    for path in directory.glob(pattern):
+        if path not in keep:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
 
-def load_profile_from_csv(file_path: Path) -> RollCalibrationProfile | None:
-    return None
+def _atomic_savez(file_path: Path, **arrays):
+    # 先写入同目录下的临时文件再原子替换，读取方永远不会看到写了一半的文件
+    fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
@@ -1,15 +1,85 @@
 import os
+import threading
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
+
+try:
+    import PyOpenColorIO as ocio
+except ImportError:
+    ocio = None
+
+class OcioProcessorCache:
+    """按 (源色彩空间, 目标色彩空间) 缓存优化后的OCIO CPUProcessor。
+
+    构建处理器的开销远大于应用，同一配置下所有帧和线程共用同一个处理器
+    （OCIO的CPUProcessor可在多线程中同时apply）。处理器以float32输入输出、
+    OPTIMIZATION_VERY_GOOD优化级别构建，与applyRGB原地处理float32数组相匹配。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._processors = {}
+        self._lock = threading.Lock()
+
+    def get(self, src: str, dst: str):
+        key = (src, dst)
+        processor = self._processors.get(key)
+        if processor is None:
+            with self._lock:
+                processor = self._processors.get(key)
+                if processor is None:
+                    processor = _build_cpu_processor(self.config, src, dst)
+                    self._processors[key] = processor
+        return processor
+
+    def __len__(self) -> int:
+        return len(self._processors)
+
+def _build_cpu_processor(config, src: str, dst: str):
+    if ocio is None:
+        raise ImportError("PyOpenColorIO is required for OCIO color conversions.")
+    return config.getProcessor(src, dst).getOptimizedCPUProcessor(
+        ocio.BIT_DEPTH_F32, ocio.BIT_DEPTH_F32, ocio.OPTIMIZATION_VERY_GOOD
+    )
+
+def get_cpu_processor(cfg, src: str, dst: str):
+    # cfg可以是OcioProcessorCache（复用缓存的处理器）或原始的OCIO配置（每次新建）
+    if isinstance(cfg, OcioProcessorCache):
+        return cfg.get(src, dst)
+    return _build_cpu_processor(cfg, src, dst)
+
+def apply_cpu_processor(processor, image_: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    # applyRGB原地处理C连续的float32数组。结果的dtype与out（未给出时与image_）相同：
+    # out可以就是image_（原地处理，不复制）；C连续的float32只复制一次到out或新数组，
+    # 其它dtype或内存布局经由一个float32临时数组再写回
+    if out is None:
+        out = np.empty(image_.shape, dtype=image_.dtype)
+    if out.dtype != np.float32 or not out.flags.c_contiguous:
+        rgb = np.array(image_, dtype=np.float32, order="C")
+        processor.applyRGB(rgb)
+        np.copyto(out, rgb, casting="same_kind")
+        return out
+    if out is not image_:
+        np.copyto(out, image_)
+    processor.applyRGB(out)
+    return out
+
+# 密度换算得到的线性RGB所在的工作空间
+WORKING_LINEAR_SPACE = "ACES2065-1"
 
 def density_to_linear(
     density: np.ndarray,
     cfg = None,
-    linear_space: str = "ACES2065-1"
+    linear_space: str = "ACES2065-1",
+    out: np.ndarray = None
 ) -> np.ndarray:
-    return density * 0.8
+    # 目标空间不是工作空间时，经cfg（OcioProcessorCache或原始配置）取得的处理器原地转换
+    linear = np.multiply(density, 0.8, out=out)
+    if cfg is None or linear_space == WORKING_LINEAR_SPACE:
+        return linear
+    processor = get_cpu_processor(cfg, WORKING_LINEAR_SPACE, linear_space)
+    return apply_cpu_processor(processor, linear, out=linear)
 
 def linear_to_display(
     linear_rgb: np.ndarray,
@@ -26,10 +96,39 @@ def normalize(
     return data / max_data
 
 def load_lut_cube(filename: Path) -> tuple:
-    lut_size = 32
-    lut_data = np.random.rand(lut_size**3, 3)
-    lut_ = lut_data.reshape((lut_size, lut_size, lut_size, 3))
-    return lut_, [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]
+    # 解析Adobe/Resolve .cube格式的3D LUT，返回 (lut[r, g, b, 3], domain_min, domain_max)。
+    # 文件中红色分量变化最快，数据按 [b, g, r] 排列，这里转置为 [r, g, b]。
+    # 重复加载请使用lut_cache.LutRegistry，避免每次渲染重新解析文本。
+    lut_size = None
+    domain_min_, domain_max_ = [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]
+    rows = []
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            keyword, _, value = line.partition(" ")
+            if keyword == "LUT_3D_SIZE":
+                lut_size = int(value)
+            elif keyword == "DOMAIN_MIN":
+                domain_min_ = [float(v) for v in value.split()]
+            elif keyword == "DOMAIN_MAX":
+                domain_max_ = [float(v) for v in value.split()]
+            elif keyword == "LUT_1D_SIZE":
+                raise ValueError(f"1D LUTs are not supported: {filename}")
+            elif keyword[0].isdigit() or keyword[0] in "-+.":
+                rows.append(line)
+
+    if lut_size is None:
+        raise ValueError(f"LUT_3D_SIZE is missing in {filename}")
+    lut_data = np.array(" ".join(rows).split(), dtype=np.float64)
+    if lut_data.size != lut_size ** 3 * 3:
+        raise ValueError(f"Expected {lut_size ** 3} entries in {filename}, got {lut_data.size // 3}")
+    lut_ = lut_data.reshape((lut_size, lut_size, lut_size, 3)).transpose(2, 1, 0, 3)
+    return np.ascontiguousarray(lut_), domain_min_, domain_max_
+
+_LUT_BLOCK = 65536
+_LUT_METHODS = ("trilinear", "tetrahedral")
 
 def map_colors_to_indices(
     image_: np.ndarray,
@@ -37,10 +136,84 @@ def map_colors_to_indices(
     domain_min_: list,
     domain_max_: list
 ) -> np.ndarray:
-    return image_ * (lut_size - 1)
+    # 将颜色映射为LUT格点坐标 [0, lut_size - 1]，超出定义域的值按边界处理
+    # 定义域宽度为0（例如恒定的通道）时该通道映射到格点0，不做除零
+    domain_min_ = np.asarray(domain_min_, dtype=np.float64)
+    span = np.asarray(domain_max_, dtype=np.float64) - domain_min_
+    scale = np.divide(lut_size - 1, span, out=np.zeros_like(span), where=span > 0)
+    return np.clip((image_ - domain_min_) * scale, 0, lut_size - 1)
+
+def _lattice_cell(position: np.ndarray, lut_size: int) -> tuple[np.ndarray, np.ndarray]:
+    # 格点坐标 -> (所在格子原点在展平LUT中的下标, 格子内的小数部分)
+    # 下标用uint32计算，65³的LUT只需要约27万个条目
+    index = np.minimum(position.astype(np.uint32), np.uint32(lut_size - 2))
+    fraction = position - index
+    size = np.uint32(lut_size)
+    base = (index[:, 0] * size + index[:, 1]) * size + index[:, 2]
+    return base, fraction
+
+def _interpolate_trilinear(flat_lut: np.ndarray, lut_size: int, position: np.ndarray) -> np.ndarray:
+    base, fraction = _lattice_cell(position, lut_size)
+    weights = (1 - fraction, fraction)
+    result = np.zeros(position.shape, dtype=np.float64)
+    for dr in (0, 1):
+        for dg in (0, 1):
+            for db in (0, 1):
+                weight = weights[dr][:, 0] * weights[dg][:, 1] * weights[db][:, 2]
+                corner = np.take(flat_lut, base + np.uint32((dr * lut_size + dg) * lut_size + db), axis=0)
+                corner *= weight[:, None]
+                result += corner
+    return result
+
+def _interpolate_tetrahedral(flat_lut: np.ndarray, lut_size: int, position: np.ndarray) -> np.ndarray:
+    # 按三个小数部分的大小顺序确定所在的四面体：
+    # c000 -> 最大分量所在轴的顶点 -> 再加上次大分量所在轴的顶点 -> c111
+    base, fraction = _lattice_cell(position, lut_size)
+    fr, fg, fb = fraction[:, 0], fraction[:, 1], fraction[:, 2]
+    strides = np.array([lut_size * lut_size, lut_size, 1], dtype=np.uint32)
+    diagonal = strides.sum()
+
+    # 最大轴按 r, g, b 的优先级、最小轴按 b, g, r 的优先级选择，相等时两者也不会相同
+    max_axis = np.where((fr >= fg) & (fr >= fb), 0, np.where(fg >= fb, 1, 2))
+    min_axis = np.where((fb <= fg) & (fb <= fr), 2, np.where(fg <= fr, 1, 0))
+    f_max = np.take_along_axis(fraction, max_axis[:, None], axis=1)[:, 0]
+    f_min = np.take_along_axis(fraction, min_axis[:, None], axis=1)[:, 0]
+    f_mid = fr + fg + fb - f_max - f_min
+
+    c000 = np.take(flat_lut, base, axis=0)
+    c_max = np.take(flat_lut, base + strides[max_axis], axis=0)
+    c_mid = np.take(flat_lut, base + (diagonal - strides[min_axis]), axis=0)
+    c111 = np.take(flat_lut, base + diagonal, axis=0)
 
-def cubic_interp_lut(lut_, x, y, z):
-    return np.random.rand(*x.shape, 3)
+    result = c000 * (1 - f_max)[:, None]
+    result += c_max * (f_max - f_mid)[:, None]
+    result += c_mid * (f_mid - f_min)[:, None]
+    result += c111 * f_min[:, None]
+    return result
+
+def cubic_interp_lut(lut_, x, y, z, method="trilinear"):
+    # 在格点坐标 (x, y, z) 处插值3D LUT，返回形状为 (*x.shape, 3)
+    position = np.stack(np.broadcast_arrays(x, y, z), axis=-1).astype(np.float64)
+    lut_size = lut_.shape[0]
+    return process_batch(
+        position.reshape(-1, 3), lut_, [0.0, 0.0, 0.0], [lut_size - 1] * 3, method=method
+    ).reshape(position.shape)
+
+def process_batch(batch, lut_, domain_min_, domain_max_, method="tetrahedral", out=None):
+    # 对 (N, 3) 的一批颜色插值LUT，结果写入out（形状相同）；按块计算以限制临时数组大小
+    if method not in _LUT_METHODS:
+        raise ValueError(f"method must be one of {_LUT_METHODS}, got {method}")
+    interpolate = _interpolate_tetrahedral if method == "tetrahedral" else _interpolate_trilinear
+    lut_size = lut_.shape[0]
+    flat_lut = np.ascontiguousarray(lut_).reshape(-1, lut_.shape[-1])
+    if out is None:
+        out = np.empty(batch.shape, dtype=np.result_type(np.float32, batch.dtype, lut_.dtype))
+
+    for start in range(0, batch.shape[0], _LUT_BLOCK):
+        block = batch[start:start + _LUT_BLOCK]
+        position = map_colors_to_indices(block, lut_size, domain_min_, domain_max_)
+        out[start:start + _LUT_BLOCK] = interpolate(flat_lut, lut_size, position)
+    return out
 
 def apply_lut(
     image_: np.ndarray,
@@ -48,20 +221,53 @@ def apply_lut(
     domain_min_: list=None,
     domain_max_: list=None,
     max_data: float=1023,
-    min_data: float=0.0
+    min_data: float=0.0,
+    method: str="tetrahedral",
+    out: np.ndarray=None,
+    workers: int=1,
+    batch_size: int=1 << 18
 ) -> np.ndarray:
-    return image_
+    # 先按 [min_data, max_data] 归一化再在 [domain_min_, domain_max_] 上查LUT。
+    # 两步合并为原始数值上的一个定义域，不生成归一化后的整幅中间图像。
+    # workers > 1 时按batch_size个像素分块多线程执行，各块直接写入out的对应区域。
+    if domain_min_ is None:
+        domain_min_ = [0.0, 0.0, 0.0]
+    if domain_max_ is None:
+        domain_max_ = [1.0, 1.0, 1.0]
+    data_range = max_data - min_data
+    raw_min = min_data + np.asarray(domain_min_, dtype=np.float64) * data_range
+    raw_max = min_data + np.asarray(domain_max_, dtype=np.float64) * data_range
+
+    if out is None:
+        out = np.empty(image_.shape, dtype=np.result_type(np.float32, image_.dtype, lut_.dtype))
+    elif out.shape != image_.shape or not out.flags.c_contiguous:
+        raise ValueError("out must be C-contiguous and have the same shape as the image.")
+    flat_image = image_.reshape(-1, 3)
+    flat_out = out.reshape(-1, 3)
+
+    def run(start: int) -> None:
+        stop = start + batch_size
+        process_batch(flat_image[start:stop], lut_, raw_min, raw_max, method, out=flat_out[start:stop])
 
-def process_batch(batch, lut_, domain_min_, domain_max_):
-    return batch
+    starts = range(0, flat_image.shape[0], batch_size)
+    if workers <= 1 or len(starts) <= 1:
+        for start in starts:
+            run(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, starts))
+    return out
 
 def apply_lut_parallel(
     image_,
     lut_,
     domain_min_=None,
     domain_max_=None,
-    batch_size=1024,
+    batch_size=1 << 18,
     max_data=1023,
     min_data=0.0
 ):
-    return image_
+    return apply_lut(
+        image_, lut_, domain_min_, domain_max_, max_data, min_data,
+        workers=os.cpu_count() or 1, batch_size=batch_size
+    )
@@ -1,8 +1,11 @@
+import functools
 import numpy as np
 from . import color_space as cs
+from . import histogram as hist_proc
 
-def get_extrema_density(sample_d_, percent=0.01):
-    return np.array([0.1, 0.1, 0.1])
+def get_extrema_density(sample_d_, percent=0.01, method="exact"):
+    # 各通道密度在percent百分位处的值，由共享的百分位引擎计算；method见hist_proc.percentiles
+    return hist_proc.percentiles(sample_d_, [percent], method=method, per_channel=True)[0]
 
 def t_to_d(transmittance: np.ndarray) -> np.ndarray:
     return -np.log10(transmittance + 0.001)
@@ -12,32 +15,68 @@ def simple_decode(x: np.ndarray):
         return x
     return np.array(x, dtype=np.float32)
 
+_DENSITY_BLOCK = 1 << 17
+
 def dn_to_density(
     image_data: np.ndarray,
     icc_bytes: bytes = None,
     light_ratio: list[float] = None,
     black_level: int = 10,
+    out: np.ndarray = None,
 ) -> np.ndarray:
     if light_ratio is None:
         light_ratio = [1.0, 1.0, 1.0]
     if len(light_ratio) != 3:
         raise ValueError("light_ratio must be a list of 3 elements for rgb channels.")
-    return image_data * 0.5
+    if image_data.dtype == np.uint16 and image_data.ndim >= 1 and image_data.shape[-1] == 3:
+        # 16位扫描每个通道只有65536种取值，查表代替逐像素计算
+        lut = density_lut(icc_bytes, tuple(light_ratio), black_level)
+        if out is None:
+            out = np.empty(image_data.shape, dtype=lut.dtype)
+        elif not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous.")
+        # 三个通道的表首尾相接，按块把DN加上通道偏移后一次take，float32输出时表也用float32
+        flat_lut = lut.reshape(-1).astype(out.dtype, copy=False)
+        offsets = np.arange(3, dtype=np.uint32) * 65536
+        flat_image = image_data.reshape(-1, 3)
+        flat_out = out.reshape(-1, 3)
+        for start in range(0, flat_image.shape[0], _DENSITY_BLOCK):
+            stop = start + _DENSITY_BLOCK
+            np.take(flat_lut, flat_image[start:stop] + offsets, out=flat_out[start:stop], mode="clip")
+        return out
+    return _dn_to_density_direct(image_data, icc_bytes, light_ratio, black_level, out)
+
+def _dn_to_density_direct(image_data, icc_bytes, light_ratio, black_level, out=None):
+    # 逐像素计算：归一化、ICC解码、透过率 -> 密度
+    return np.multiply(image_data, 0.5, out=out)
+
+@functools.lru_cache(maxsize=8)
+def density_lut(icc_bytes: bytes, light_ratio: tuple[float, ...], black_level: int) -> np.ndarray:
+    # 每个通道65536个条目的 DN -> 密度 查找表，形状 (3, 65536)。
+    # 由逐像素的计算在所有16位取值上求值得到，查表结果与直接计算完全一致
+    values = np.repeat(np.arange(65536, dtype=np.uint16)[:, None], 3, axis=1)
+    lut = _dn_to_density_direct(values, icc_bytes, list(light_ratio), black_level)
+    lut = np.ascontiguousarray(lut.T)
+    lut.setflags(write=False)
+    return lut
 
 def density_to_net(
     density: np.ndarray,
     dmin: np.ndarray = None,
-    dmax: np.ndarray = None
+    dmax: np.ndarray = None,
+    out: np.ndarray = None
 ) -> np.ndarray:
     if dmin is None:
         dmin = np.array([0.1, 0.1, 0.1])
     if dmax is None:
         dmax = np.array([2.0, 2.0, 2.0])
-    return density - dmin
+    return np.subtract(density, dmin, out=out)
 
 def normalize_density_net(
     density_net: np.ndarray,
     extrema_high_density: float = 1.0,
     target_extrema_high_density: float = 0.4,
+    out: np.ndarray = None,
 ) -> np.ndarray:
-    return density_net * target_extrema_high_density / extrema_high_density
+    result = np.multiply(density_net, target_extrema_high_density, out=out)
+    return np.divide(result, extrema_high_density, out=result)
@@ -6,4 +6,210 @@ def find_percentile_from_histogram(
     bins,
     percentile=97.5
 ) -> float:
-    return float(percentile / 100.0)
+    # bins为等宽bin的中心
+    bins = np.asarray(bins, dtype=np.float64)
+    width = bins[1] - bins[0] if bins.size > 1 else 1.0
+    bin_edges = np.append(bins - width / 2.0, bins[-1] + width / 2.0)
+    return float(histogram_percentiles(hist, bin_edges, [percentile])[0])
+
+
+def histogram_percentiles(counts, bin_edges, percentiles) -> np.ndarray:
+    """由一组固定bin的计数求多个百分位。
+
+    落在同一bin内的值按均匀分布线性插值，因此结果与精确百分位的差
+    不超过一个bin宽（外加相邻样本间距，样本较多时可忽略）。
+    """
+    counts = np.asarray(counts)
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    total = counts.sum()
+    if total <= 0:
+        raise ValueError("Cannot compute percentiles of an empty histogram.")
+
+    cumulative = np.cumsum(counts)
+    # 与np.percentile相同的次序位置 p * (n - 1)，第k个样本占据累计计数 [k, k + 1) 的中点
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100.0 * (total - 1) + 0.5
+    # rank为0时取第一个非空bin的左边缘
+    indices = np.where(
+        ranks > 0,
+        np.searchsorted(cumulative, ranks, side="left"),
+        np.searchsorted(cumulative, 0, side="right")
+    )
+    indices = np.minimum(indices, counts.size - 1)
+    below = cumulative[indices] - counts[indices]
+    fraction = np.clip((ranks - below) / np.maximum(counts[indices], 1), 0.0, 1.0)
+    return bin_edges[indices] + fraction * (bin_edges[indices + 1] - bin_edges[indices])
+
+
+def exact_percentiles(values, percentiles) -> np.ndarray:
+    """精确百分位：np.partition一次定位所有需要的次序统计量，结果与np.percentile（linear）一致。"""
+    flat = np.asarray(values).reshape(-1)
+    if flat.size == 0:
+        raise ValueError("Cannot compute percentiles of an empty array.")
+    virtual = np.asarray(percentiles, dtype=np.float64) / 100.0 * (flat.size - 1)
+    lower = np.floor(virtual).astype(np.intp)
+    upper = np.minimum(lower + 1, flat.size - 1)
+    partitioned = np.partition(flat, np.unique(np.concatenate([lower, upper])))
+
+    # 与np.percentile相同的插值公式
+    below, above = partitioned[lower].astype(np.float64), partitioned[upper].astype(np.float64)
+    t = virtual - lower
+    difference = above - below
+    return np.where(t >= 0.5, above - difference * (1 - t), below + difference * t)
+
+
+def percentiles(
+    values,
+    percentiles,
+    method: str = "histogram",
+    bins_number: int = 4096,
+    value_range: tuple[float, float] | None = None,
+    per_channel: bool = False
+) -> np.ndarray:
+    """共享的百分位引擎，一次求多个百分位。
+
+    method="histogram"：一次直方图统计求出所有百分位，误差不超过一个bin宽，
+    即 (value_range[1] - value_range[0]) / bins_number；未给定value_range时使用数据的最小、最大值。
+    method="exact"：np.partition多kth的精确结果。
+    per_channel为True时最后一维为通道，返回形状 (len(percentiles), 通道数)，否则返回 (len(percentiles),)。
+    """
+    values = np.asarray(values)
+    if method == "exact":
+        if not per_channel:
+            return exact_percentiles(values, percentiles)
+        flat = values.reshape(-1, values.shape[-1])
+        return np.stack([exact_percentiles(flat[:, c], percentiles) for c in range(flat.shape[1])], axis=-1)
+    elif method != "histogram":
+        raise ValueError(f"method must be 'histogram' or 'exact', got {method}")
+
+    channels = values.shape[-1] if per_channel else 1
+    if value_range is None:
+        value_range = (float(np.nanmin(values)), float(np.nanmax(values)))
+    if not value_range[0] < value_range[1]:
+        # 所有值相同（或只有一个值）
+        return np.full((len(percentiles), channels) if per_channel else len(percentiles),
+                       value_range[0], dtype=np.float64)
+
+    sketch = HistogramSketch(bins_number, value_range, channels=channels).add(values)
+    if not per_channel:
+        return sketch.percentiles(percentiles)
+    return np.stack([sketch.percentiles(percentiles, channel=c) for c in range(channels)], axis=-1)
+
+
+class HistogramSketch:
+    """固定bin、整数计数的可合并直方图。
+
+    各帧的数据可以逐帧add，也可以在不同进程中分别统计后merge，
+    内存占用只与bin数有关。bin的划分与np.histogram完全一致（最后一个bin
+    包含右端点），超出范围的值不计入。所有计算均在float64下进行。
+    """
+
+    _BLOCK = 65536
+
+    def __init__(
+        self,
+        bins_number: int,
+        value_range: tuple[float, float],
+        channels: int = 1
+    ):
+        if bins_number < 1:
+            raise ValueError(f"bins_number must be at least 1, got {bins_number}")
+        if channels < 1:
+            raise ValueError(f"channels must be at least 1, got {channels}")
+        range_min, range_max = float(value_range[0]), float(value_range[1])
+        if not range_min < range_max:
+            raise ValueError(f"value_range must be increasing, got {value_range}")
+
+        self.bins_number = bins_number
+        self.value_range = (range_min, range_max)
+        self.channels = channels
+        self.bin_edges = np.linspace(range_min, range_max, bins_number + 1)
+        self.counts = np.zeros((channels, bins_number), dtype=np.int64)
+
+    @property
+    def bin_centers(self) -> np.ndarray:
+        return (self.bin_edges[:-1] + self.bin_edges[1:]) / 2.0
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def channel_counts(self, channel: int | None = None) -> np.ndarray:
+        """返回指定通道的计数；channel为None时返回所有通道合计的计数。"""
+        if channel is None:
+            return self.counts.sum(axis=0)
+        return self.counts[channel]
+
+    def add(self, values: np.ndarray, weights: np.ndarray | None = None) -> HistogramSketch:
+        """将一组数据计入直方图。多通道时values的最后一维为通道。
+
+        weights为与values形状相同的整数计数时，每个值按其计数计入（用于把另一组bin重新分bin）。
+        """
+        values = np.asarray(values)
+        if self.channels > 1 and (values.ndim == 0 or values.shape[-1] != self.channels):
+            raise ValueError(f"values must have {self.channels} channels in the last axis, "
+                             f"got shape {values.shape}")
+        values = values.reshape(-1, self.channels)
+        if weights is not None:
+            weights = np.asarray(weights)
+            if weights.size != values.size:
+                raise ValueError(f"weights must match values, got {weights.shape} for {values.shape}")
+            weights = weights.reshape(values.shape)
+
+        channel_offsets = np.arange(self.channels) * self.bins_number
+        flat_counts = self.counts.reshape(-1)
+        for start in range(0, values.shape[0], self._BLOCK):
+            block = values[start:start + self._BLOCK].astype(np.float64, copy=False)
+            indices = self._bin_indices(block)
+            keep = indices >= 0
+            if weights is None:
+                flat_counts += np.bincount(
+                    (indices + channel_offsets)[keep],
+                    minlength=flat_counts.size
+                )
+            else:
+                # 带权bincount的结果为float64，计数不超过2**53时精确
+                flat_counts += np.rint(np.bincount(
+                    (indices + channel_offsets)[keep],
+                    weights=weights[start:start + self._BLOCK][keep],
+                    minlength=flat_counts.size
+                )).astype(np.int64)
+
+        return self
+
+    def merge(self, other: HistogramSketch) -> HistogramSketch:
+        """将另一个相同bin划分的直方图合并进来。"""
+        if (self.bins_number != other.bins_number
+                or self.value_range != other.value_range
+                or self.channels != other.channels):
+            raise ValueError("Cannot merge histogram sketches with different bins, "
+                             "range or channels.")
+        self.counts += other.counts
+        return self
+
+    def percentile(self, percentile: float, channel: int | None = None) -> float:
+        """由计数查找百分位对应的值；channel为None时使用所有通道合计。"""
+        return float(self.percentiles([percentile], channel)[0])
+
+    def percentiles(self, percentiles, channel: int | None = None) -> np.ndarray:
+        """一次求多个百分位，误差不超过一个bin宽。"""
+        return histogram_percentiles(self.channel_counts(channel), self.bin_edges, percentiles)
+
+    def _bin_indices(self, block: np.ndarray) -> np.ndarray:
+        """计算每个值所在的bin，超出范围或NaN记为-1。
+
+        与np.histogram的等宽bin算法相同，包括对bin边缘附近1 ULP误差的修正。
+        """
+        range_min, range_max = self.value_range
+        in_range = (block >= range_min) & (block <= range_max)
+
+        f_indices = (block - range_min) / (range_max - range_min) * self.bins_number
+        indices = np.where(in_range, f_indices, 0).astype(np.intp)
+        indices[indices == self.bins_number] -= 1
+
+        decrement = block < self.bin_edges[indices]
+        indices[decrement] -= 1
+        increment = (block >= self.bin_edges[indices + 1]) & (indices != self.bins_number - 1)
+        indices[increment] += 1
+
+        indices[~in_range] = -1
+        return indices
@@ -1,32 +1,241 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import threading
 import tifffile as tiff
 import numpy as np
 from PIL import Image
 
-def to_uint8(image_float: np.ndarray) -> np.ndarray:
-    return np.clip(image_float * 255, 0, 255).astype(np.uint8)
+DITHER_METHODS = ("ordered", "blue_noise")
+# 每块约这么多个元素，临时缓冲为4-8 MiB
+_QUANTIZE_BLOCK = 1 << 20
+_DITHER_SIZE = 64
 
-def to_uint16(image_float: np.ndarray) -> np.ndarray:
-    return np.clip(image_float * 65535, 0, 65535).astype(np.uint16)
+def to_uint8(image_float: np.ndarray, out: np.ndarray | None = None, dither: str | None = None) -> np.ndarray:
+    return quantize(image_float, 8, out=out, dither=dither)
 
-def save_as_jpg(image_data: np.ndarray, save_path: Path, quality: int, icc_profile: bytes | None):
+def to_uint16(image_float: np.ndarray, out: np.ndarray | None = None, dither: str | None = None) -> np.ndarray:
+    return quantize(image_float, 16, out=out, dither=dither)
+
+def quantize(
+    image_float: np.ndarray,
+    bit_depth: int,
+    out: np.ndarray | None = None,
+    dither: str | None = None,
+    row_offset: int = 0,
+    workers: int = 1
+) -> np.ndarray:
+    """把0-1的浮点图像量化为8/16位整数：缩放、加抖动、四舍五入、裁剪、转换类型一次完成。
+
+    按行分块处理，每块只用一个可复用的浮点缓冲，结果直接写入out，
+    不产生整幅大小的临时数组。dither为"ordered"（8x8 Bayer矩阵）或
+    "blue_noise"（64x64蓝噪声），在舍入前加入±0.5 LSB的阈值偏移以消除色带；
+    抖动图案按图像坐标平铺，row_offset为本块在整幅图像中的起始行，分条带量化时保持图案连续。
+    workers > 1 时各块多线程执行。
+    """
+    if bit_depth not in (8, 16):
+        raise ValueError(f"bit_depth must be 8 or 16, got {bit_depth}")
+    if dither is not None and dither not in DITHER_METHODS:
+        raise ValueError(f"dither must be one of {DITHER_METHODS}, got {dither}")
+    dtype = np.uint8 if bit_depth == 8 else np.uint16
+    image_float = np.asarray(image_float)
+    if out is None:
+        out = np.empty(image_float.shape, dtype=dtype)
+    elif out.shape != image_float.shape or out.dtype != dtype:
+        raise ValueError(f"out must be {np.dtype(dtype).name} with shape {image_float.shape}")
+    if image_float.size == 0:
+        return out
+
+    max_value = float(np.iinfo(dtype).max)
+    # 缓冲与输入同精度（至少float32），float64输入在16位下不会因精度不足舍入错误
+    work_dtype = np.result_type(np.float32, image_float.dtype)
+    height = image_float.shape[0]
+    row_size = image_float.size // height
+    # 块的行数取抖动图案边长的整数倍，每块可以共用同一段平铺好的偏移
+    rows = max(_DITHER_SIZE, _QUANTIZE_BLOCK // max(row_size, 1) // _DITHER_SIZE * _DITHER_SIZE)
+    rows = min(rows, height)
+    offsets = None
+    if dither is not None:
+        offsets = _tiled_dither(dither, rows, image_float.shape[1] if image_float.ndim > 1 else 1, row_offset)
+        if image_float.ndim > 2:
+            offsets = offsets.reshape(offsets.shape + (1,) * (image_float.ndim - 2))
+        elif image_float.ndim == 1:
+            offsets = offsets[:, 0]
+
+    local = threading.local()
+
+    def run(start: int) -> None:
+        stop = min(start + rows, height)
+        scratch = getattr(local, "scratch", None)
+        if scratch is None:
+            scratch = local.scratch = np.empty((rows,) + image_float.shape[1:], dtype=work_dtype)
+        buffer = scratch[:stop - start]
+        np.multiply(image_float[start:stop], max_value, out=buffer, casting='unsafe')
+        if offsets is not None:
+            buffer += offsets[:stop - start]
+        np.rint(buffer, out=buffer)
+        np.clip(buffer, 0.0, max_value, out=buffer)
+        np.copyto(out[start:stop], buffer, casting='unsafe')
+
+    starts = range(0, height, rows)
+    if workers <= 1 or len(starts) <= 1:
+        for start in starts:
+            run(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, starts))
+    return out
+
+def _tiled_dither(method: str, rows: int, width: int, row_offset: int) -> np.ndarray:
+    # 阈值图减0.5，均值为0，范围 [-0.5, 0.5)
+    pattern = _bayer_matrix(8) if method == "ordered" else _blue_noise(_DITHER_SIZE)
+    size = pattern.shape[0]
+    row_index = (np.arange(rows) + row_offset) % size
+    col_index = np.arange(width) % size
+    return pattern[row_index[:, None], col_index[None, :]] - np.float32(0.5)
+
+@lru_cache(maxsize=None)
+def _bayer_matrix(size: int) -> np.ndarray:
+    matrix = np.zeros((1, 1))
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    result = ((matrix + 0.5) / matrix.size).astype(np.float32)
+    result.flags.writeable = False
+    return result
+
+@lru_cache(maxsize=None)
+def _blue_noise(size: int, sigma: float = 1.5, iterations: int = 4) -> np.ndarray:
+    # 近似蓝噪声：可平铺的白噪声反复去掉低频（周期性高斯模糊）并按排名均衡为均匀分布，
+    # 结果只含高频成分，比Bayer矩阵少了规则的网格纹理。固定种子，每次生成的图案相同。
+    noise = np.random.default_rng(0).random((size, size))
+    frequency = np.fft.fftfreq(size)
+    gaussian = np.exp(-2 * (np.pi * sigma) ** 2 * (frequency[:, None] ** 2 + frequency[None, :] ** 2))
+    for _ in range(iterations):
+        high_pass = noise - np.fft.ifft2(np.fft.fft2(noise) * gaussian).real
+        ranks = np.empty(size * size)
+        ranks[np.argsort(high_pass, axis=None)] = np.arange(size * size)
+        noise = ((ranks + 0.5) / ranks.size).reshape(size, size)
+    result = noise.astype(np.float32)
+    result.flags.writeable = False
+    return result
+
+def save_as_jpg(
+    image_data: np.ndarray,
+    save_path: Path,
+    quality: int,
+    icc_profile: bytes | None,
+    dither: str | None = None
+):
     if image_data.dtype != np.uint8:
-        image_data = to_uint8(image_data)
+        image_data = to_uint8(image_data, dither=dither)
     pil_image = Image.fromarray(image_data, 'RGB')
-    pil_image.save(save_path, format='JPEG', quality=quality)
+    # ICC配置文件写入APP2段，与TIFF的InterColorProfile标签对应
+    pil_image.save(save_path, format='JPEG', quality=quality, icc_profile=icc_profile)
 
 def save_as_tif(
     image_data: np.ndarray,
     save_path: Path,
     bit_depth: int,
     icc_profile: bytes | None,
-    compression: str = 'zlib'
+    compression: str | None = None,
+    dither: str | None = None
+):
+    # 按行分块量化写入，不为整幅图像分配量化后的副本；默认与旧版一样不压缩
+    rows = _TIF_STRIP_ROWS
+    write_tif_strips(
+        (image_data[start:start + rows] for start in range(0, image_data.shape[0], rows)),
+        save_path, image_data.shape, bit_depth, icc_profile, compression, dither=dither
+    )
+
+_TIF_STRIP_ROWS = 256
+# 超过该大小（未压缩）时自动使用BigTIFF，留出IFD和标签的余量
+_BIGTIFF_THRESHOLD = 2 ** 32 - 2 ** 25
+
+def write_tif_strips(
+    strips,
+    save_path: Path,
+    shape: tuple[int, ...],
+    bit_depth: int,
+    icc_profile: bytes | None,
+    compression: str | None = None,
+    predictor: bool = True,
+    bigtiff: bool | None = None,
+    tile: tuple[int, int | None] | None = None,
+    maxworkers: int | None = None,
+    buffersize: int = 64 * 2 ** 20,
+    dither: str | None = None
 ):
-    if bit_depth == 8:
-        if image_data.dtype != np.uint8:
-            image_data = to_uint8(image_data)
-    elif bit_depth == 16:
-        if image_data.dtype != np.uint16:
-            image_data = to_uint16(image_data)
-    tiff.imwrite(save_path, image_data)
+    """流式写入TIFF：strips按自上而下的顺序给出任意行数的条带（浮点0-1或已量化的整数）。
+
+    条带逐个量化并重新切分为每条_TIF_STRIP_ROWS行的TIFF条带（给出tile时为tile），
+    compression为None时不压缩（默认，与旧版导出一致），否则由tifffile多线程压缩后写入，
+    内存中只保留不超过buffersize的待压缩数据加上一个条带。tile的列数为None时使用
+    覆盖整行宽度的tile。bigtiff为None时按未压缩大小自动决定。
+    浮点条带直接量化到条带缓冲中，dither见quantize。
+    """
+    if bit_depth not in (8, 16):
+        raise ValueError(f"bit_depth must be 8 or 16, got {bit_depth}")
+    dtype = np.uint8 if bit_depth == 8 else np.uint16
+    if tile is None:
+        tile_rows, tile_cols = _TIF_STRIP_ROWS, shape[1]
+        layout = {'rowsperstrip': tile_rows}
+    else:
+        tile_rows, tile_cols = tile
+        if tile_cols is None:
+            tile_cols = -(-shape[1] // 16) * 16
+        if tile_rows % 16 or tile_cols % 16:
+            raise ValueError(f"tile dimensions must be multiples of 16, got {(tile_rows, tile_cols)}")
+        layout = {'tile': (tile_rows, tile_cols)}
+    if bigtiff is None:
+        bigtiff = int(np.prod(shape)) * np.dtype(dtype).itemsize > _BIGTIFF_THRESHOLD
+    compression = None if compression in (None, 'none') else compression
+
+    with tiff.TiffWriter(save_path, bigtiff=bigtiff) as writer:
+        writer.write(
+            _iter_tiles(strips, shape, dtype, tile_rows, tile_cols, dither),
+            shape=tuple(shape),
+            dtype=dtype,
+            photometric='rgb' if len(shape) == 3 else 'minisblack',
+            compression=compression,
+            predictor=predictor if compression is not None else None,
+            iccprofile=icc_profile,
+            maxworkers=maxworkers,
+            buffersize=buffersize,
+            **layout,
+        )
+
+def _iter_tiles(strips, shape, dtype, tile_rows: int, tile_cols: int, dither: str | None = None):
+    # 把任意行数的条带重新切分为 tile_rows 行的tile行，再按列切出tile（边缘由tifffile补零）；
+    # tile_cols不小于宽度时产出的就是整行宽度的TIFF条带，最后一条可以较短
+    # tifffile取够tile数后不再迭代，行数必须在产出最后一个tile之前校验
+    band = np.empty((tile_rows,) + tuple(shape[1:]), dtype=dtype)
+    bit_depth = np.dtype(dtype).itemsize * 8
+    filled = 0
+    received = 0
+    for strip in strips:
+        if received + strip.shape[0] > shape[0]:
+            raise ValueError(f"Strips cover more than {shape[0]} rows")
+        start = 0
+        while start < strip.shape[0]:
+            count = min(tile_rows - filled, strip.shape[0] - start)
+            if strip.dtype == dtype:
+                band[filled:filled + count] = strip[start:start + count]
+            else:
+                quantize(strip[start:start + count], bit_depth, out=band[filled:filled + count],
+                         dither=dither, row_offset=received + start)
+            filled += count
+            start += count
+            if filled == tile_rows:
+                yield from _band_tiles(band, tile_cols)
+                filled = 0
+        received += strip.shape[0]
+    if received != shape[0]:
+        raise ValueError(f"Strips cover {received} rows, expected {shape[0]}")
+    if filled:
+        yield from _band_tiles(band[:filled], tile_cols)
+
+def _band_tiles(band: np.ndarray, tile_cols: int):
+    for col in range(0, band.shape[1], tile_cols):
+        # tifffile按批次压缩，tile必须是独立的数组，不能是会被覆盖的band的视图
+        yield band[:, col:col + tile_cols].copy()
@@ -2,25 +2,153 @@ from pathlib import Path
 import cv2
 import colour
 import numpy as np
+import tifffile
+from PIL import Image
 from core.frame import Frame
 from . import density as density_proc
 from . import color_space as cs
 
+_TIFF_SUFFIXES = ('.tif', '.tiff')
+
 def preprocess_thumbnail_density(
     image_path: Path,
     light_ratio: list,
-    target_size: tuple[int, int] = (1024, 1024)
+    target_size: tuple[int, int] = (1024, 1024),
+    pyramid=None
 ) -> np.ndarray:
-    return np.random.rand(target_size[0], target_size[1], 3)
+    # pyramid为pyramid_cache.ThumbnailPyramid时从缩略图金字塔读取
+    if pyramid is not None:
+        image_dn = pyramid.get(image_path, target_size)
+    else:
+        image_dn = read_thumbnail(image_path, target_size)
+    return density_proc.dn_to_density(image_dn, cs.get_icc_profile(image_path), light_ratio)
 
 def load_thumbnail(
     frame: Frame,
     target_size: tuple[int, int] = (1024, 1024)
 ) -> None:
-    frame.thumbnail_data = np.random.rand(target_size[0], target_size[1], 3)
+    frame.thumbnail_data = read_thumbnail(frame.image_path, target_size)
 
 def load_full_quality(frame: Frame) -> None:
-    frame.full_quality_data = np.random.rand(1000, 1000, 3)
+    frame.full_quality_data = read_image(frame.image_path)
 
 def load_icc_bytes(frame: Frame) -> None:
     frame.icc_bytes = b"dummy_icc_bytes"
+
+def read_image(image_path: Path) -> np.ndarray:
+    # 未压缩、连续存储的TIFF直接内存映射（只读），按需从磁盘读取；其余完整解码
+    if Path(image_path).suffix.lower() not in _TIFF_SUFFIXES:
+        return _read_with_cv2(image_path)
+    with tifffile.TiffFile(image_path) as tif:
+        page = tif.pages[0]
+        planar = _is_planar(page)
+        if not page.is_memmappable:
+            return _color_channels(_samples_last(page.asarray(), planar))
+    return _color_channels(_samples_last(tifffile.memmap(image_path, mode='r'), planar))
+
+def read_image_info(image_path: Path) -> tuple[tuple[int, ...], np.dtype]:
+    """只读取文件头，返回read_image结果的 (形状, dtype)，不解码像素。"""
+    if Path(image_path).suffix.lower() in _TIFF_SUFFIXES:
+        with tifffile.TiffFile(image_path) as tif:
+            page = tif.pages[0]
+            samples = min(page.samplesperpixel, 3)
+            return _plane_shape(page) + ((samples,) if samples > 1 else ()), page.dtype
+    with Image.open(image_path) as image:
+        width, height = image.size
+        samples = min(len(image.getbands()), 3)
+        dtype = np.dtype(np.uint16 if image.mode.startswith('I') else np.uint8)
+    return (height, width) + ((samples,) if samples > 1 else ()), dtype
+
+def read_thumbnail(
+    image_path: Path,
+    target_size: tuple[int, int] = (1024, 1024)
+) -> np.ndarray:
+    """读取不超过target_size（高, 宽）的缩略图，保持宽高比，保留原始位深。
+
+    TIFF按以下顺序选择代价最低的来源：内嵌的降分辨率层（SubIFD或后续页面）中
+    不小于目标尺寸的最小一层；可内存映射时直接按步长取样；否则逐条带/逐块解码，
+    解码后立即按步长抽取，峰值内存只有一个条带加上抽取结果。最后用INTER_AREA缩放到目标尺寸。
+    """
+    if Path(image_path).suffix.lower() not in _TIFF_SUFFIXES:
+        image = _read_with_cv2(image_path)
+        return resize_to_fit(image, fit_size(image.shape[:2], target_size))
+
+    with tifffile.TiffFile(image_path) as tif:
+        series = tif.series[0]
+        fit = fit_size(_plane_shape(series.pages[0]), target_size)
+        # levels[0]为全分辨率，之后依次缩小
+        level = series
+        for candidate in series.levels[1:]:
+            height, width = _plane_shape(candidate.pages[0])
+            if height >= fit[0] and width >= fit[1]:
+                level = candidate
+        page = level.pages[0]
+
+        height, width = _plane_shape(page)
+        step = max(1, min(height // fit[0], width // fit[1]))
+        if page.is_memmappable:
+            planar = _is_planar(page)
+            mapped = np.memmap(tif.filehandle.path, dtype=page.dtype, mode='r',
+                               offset=page.dataoffsets[0], shape=page.shape)
+            # 平面分离存储时第一维为通道
+            decimated = mapped[:, ::step, ::step] if planar else mapped[::step, ::step]
+            image = np.ascontiguousarray(_samples_last(decimated, planar))
+        else:
+            image = _decode_decimated(page, step)
+
+    return resize_to_fit(_color_channels(image), fit)
+
+def _decode_decimated(page, step: int) -> np.ndarray:
+    # 每个条带/块解码后只保留行列号为step整数倍的像素
+    # 平面分离存储时每个条带/块只含一个通道，通道号由段的第一个下标给出
+    height, width = _plane_shape(page)
+    samples = page.samplesperpixel
+    out = np.empty((-(-height // step), -(-width // step), samples), dtype=page.dtype)
+    for segment, (sample, _, row, col, _), shape in page.segments():
+        if segment is None:
+            continue
+        segment = segment.reshape(shape[-3], shape[-2], -1)
+        # 边缘块按整块大小填充，只取图像内的部分
+        rows = min(segment.shape[0], height - row)
+        cols = min(segment.shape[1], width - col)
+        first_row = -(-row // step) * step
+        first_col = -(-col // step) * step
+        if first_row >= row + rows or first_col >= col + cols:
+            continue
+        decimated = segment[first_row - row:rows:step, first_col - col:cols:step]
+        out[first_row // step:first_row // step + decimated.shape[0],
+            first_col // step:first_col // step + decimated.shape[1],
+            sample:sample + decimated.shape[2]] = decimated
+    return out if samples > 1 else out[..., 0]
+
+def _plane_shape(page) -> tuple[int, int]:
+    # page.shaped为 (平面通道, 深度, 高, 宽, 交错通道)，与平面配置无关
+    return page.shaped[2], page.shaped[3]
+
+def _is_planar(page) -> bool:
+    return page.samplesperpixel > 1 and page.planarconfig == tifffile.PLANARCONFIG.SEPARATE
+
+def _samples_last(image: np.ndarray, planar: bool) -> np.ndarray:
+    return np.moveaxis(image, 0, -1) if planar else image
+
+def fit_size(shape: tuple[int, int], target_size: tuple[int, int]) -> tuple[int, int]:
+    # 保持宽高比缩小到target_size以内，不放大
+    scale = min(target_size[0] / shape[0], target_size[1] / shape[1], 1.0)
+    return max(1, round(shape[0] * scale)), max(1, round(shape[1] * scale))
+
+def resize_to_fit(image: np.ndarray, fit: tuple[int, int]) -> np.ndarray:
+    if image.shape[:2] == tuple(fit):
+        return image
+    return cv2.resize(image, (fit[1], fit[0]), interpolation=cv2.INTER_AREA)
+
+def _color_channels(image: np.ndarray) -> np.ndarray:
+    # 丢弃alpha等额外通道
+    return image[..., :3] if image.ndim == 3 and image.shape[2] > 3 else image
+
+def _read_with_cv2(image_path: Path) -> np.ndarray:
+    image = cv2.imread(str(image_path), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Cannot read image: {image_path}")
+    if image.ndim == 3:
+        image = cv2.cvtColor(image[..., :3], cv2.COLOR_BGR2RGB)
+    return image
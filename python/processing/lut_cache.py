@@ -0,0 +1,96 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from .conversion import load_lut_cube
+from .cache_utils import generate_file_key
+
+class LutRegistry:
+    """进程内共享的3D LUT缓存。
+
+    每个.cube文件只解析一次：解析结果以float32写入缓存目录下的.npy旁路文件，
+    之后（包括其它进程）直接内存映射该文件。已加载的LUT按最近使用保留max_entries个。
+    键由路径、大小和修改时间组成，文件改变后自动重新解析。
+    旁路文件的前两行为domain_min和domain_max，其余为按 [r, g, b] 展平的LUT。
+    """
+
+    def __init__(self, cache_dir: Path | None = None, max_entries: int = 8):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """返回 (lut[r, g, b, 3], domain_min, domain_max)，与load_lut_cube相同。"""
+        key = generate_file_key(Path(filename))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = self._load_sidecar(key)
+        if entry is None:
+            lut_, domain_min_, domain_max_ = load_lut_cube(filename)
+            entry = self._save_sidecar(key, lut_, domain_min_, domain_max_)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        """清空内存中的LUT，旁路文件保留。"""
+        with self._lock:
+            self._entries.clear()
+
+    def _sidecar_path(self, key: str) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{key}.lut.npy"
+
+    def _load_sidecar(self, key: str) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        path = self._sidecar_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            data = np.load(path, mmap_mode="r")
+            return self._unpack(data)
+        except (OSError, ValueError) as e:
+            print(f"LUT缓存损坏，将重新解析: {path.name} ({e})")
+            return None
+
+    def _save_sidecar(self, key, lut_, domain_min_, domain_max_):
+        data = np.concatenate([
+            np.asarray([domain_min_, domain_max_], dtype=np.float32),
+            lut_.reshape(-1, 3).astype(np.float32),
+        ])
+        path = self._sidecar_path(key)
+        if path is None:
+            return self._unpack(data)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._unpack(np.load(path, mmap_mode="r"))
+
+    @staticmethod
+    def _unpack(data: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lut_size = round((data.shape[0] - 2) ** (1 / 3))
+        if data.ndim != 2 or data.shape[1] != 3 or lut_size ** 3 != data.shape[0] - 2:
+            raise ValueError(f"Unexpected LUT cache shape {data.shape}")
+        lut_ = data[2:].reshape(lut_size, lut_size, lut_size, 3)
+        return lut_, np.array(data[0], dtype=np.float64), np.array(data[1], dtype=np.float64)
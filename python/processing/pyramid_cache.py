@@ -0,0 +1,105 @@
+import os
+import tempfile
+from concurrent.futures import Executor, Future
+from pathlib import Path
+import numpy as np
+from . import image_loader
+from .cache_utils import generate_file_key
+
+PYRAMID_LEVELS = (2048, 1024, 512, 256)
+
+class ThumbnailPyramid:
+    """每卷一份的磁盘缩略图金字塔。
+
+    每帧只从原始TIFF解码一次，得到长边不超过各级尺寸的缩略图，存为.npy后按需内存映射。
+    整数输入保留原始位深（通常为uint16），浮点输入存为float16。
+    文件键由路径、大小和修改时间组成，原始文件改变后自动重建。
+    """
+
+    def __init__(self, cache_dir: Path, levels: tuple[int, ...] = PYRAMID_LEVELS):
+        if not levels:
+            raise ValueError("levels must not be empty")
+        self.cache_dir = Path(cache_dir)
+        self.levels = tuple(sorted(levels, reverse=True))
+
+    @classmethod
+    def for_roll(cls, folder_path: Path, levels: tuple[int, ...] = PYRAMID_LEVELS) -> "ThumbnailPyramid":
+        """使用胶卷目录下的.cache/pyramid，与分析缓存放在一起。"""
+        return cls(Path(folder_path) / '.cache' / 'pyramid', levels)
+
+    def is_writable(self) -> bool:
+        """缓存目录（尚未建立时为最近的已有上级目录）是否可写。"""
+        directory = self.cache_dir
+        while not directory.exists():
+            if directory.parent == directory:
+                return False
+            directory = directory.parent
+        return directory.is_dir() and os.access(directory, os.W_OK)
+
+    def level_for(self, target_size: tuple[int, int]) -> int | None:
+        """能覆盖target_size的最小一级；目标大于最大一级时为None。"""
+        fitting = [level for level in self.levels if level >= max(target_size)]
+        return min(fitting) if fitting else None
+
+    def level_path(self, image_path: Path, level: int) -> Path:
+        return self.cache_dir / f"{generate_file_key(Path(image_path))}.{level}.npy"
+
+    def get(
+        self,
+        image_path: Path,
+        target_size: tuple[int, int] = (1024, 1024)
+    ) -> np.ndarray:
+        """返回不超过target_size（高, 宽）的缩略图，语义与image_loader.read_thumbnail相同。
+
+        该级尺寸恰好符合时直接返回只读的内存映射，否则在映射上缩放。
+        目标大于最大一级时直接从原始文件读取，不经过缓存。
+        """
+        level = self.level_for(target_size)
+        if level is None:
+            return image_loader.read_thumbnail(image_path, target_size)
+
+        image = np.load(self.ensure(image_path)[level], mmap_mode='r')
+        fit = image_loader.fit_size(image.shape[:2], target_size)
+        if image.shape[:2] != fit and image.dtype == np.float16:
+            # cv2不支持float16的缩放
+            image = image.astype(np.float32)
+        return image_loader.resize_to_fit(image, fit)
+
+    def ensure(self, image_path: Path) -> dict[int, Path]:
+        """确保该帧的所有级别都已存在，返回 {级别: 文件路径}。"""
+        paths = {level: self.level_path(image_path, level) for level in self.levels}
+        if not all(path.exists() for path in paths.values()):
+            self._build(image_path, paths)
+        return paths
+
+    def prefetch(self, image_paths: list[Path], executor: Executor | None = None) -> list[Future]:
+        """为一卷的所有帧建立金字塔。给出executor时只提交任务并立即返回，可在后台建立。"""
+        if executor is None:
+            for image_path in image_paths:
+                self.ensure(image_path)
+            return []
+        return [executor.submit(self.ensure, image_path) for image_path in image_paths]
+
+    def _build(self, image_path: Path, paths: dict[int, Path]) -> None:
+        # 只解码一次最大的一级，其余各级依次由上一级面积缩放得到
+        image = image_loader.read_thumbnail(image_path, (self.levels[0], self.levels[0]))
+        storage_dtype = image.dtype if np.issubdtype(image.dtype, np.integer) else np.float16
+        if storage_dtype == np.float16:
+            image = image.astype(np.float32)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for level in self.levels:
+            image = image_loader.resize_to_fit(image, image_loader.fit_size(image.shape[:2], (level, level)))
+            _save_atomic(paths[level], image.astype(storage_dtype, copy=False))
+
+def _save_atomic(path: Path, data: np.ndarray) -> None:
+    # 先写临时文件再重命名，并发建立或中断时不会留下不完整的文件
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,4 +1,5 @@
 import numpy as np
+from . import histogram as hist_proc
 
 def smoothstep(t):
     t = np.clip(t, 0.0, 1.0)
@@ -20,14 +21,32 @@ def rolloff_new(t, max_value=None, threshold=0.5):
         max_value = np.max(t)
     return t / max_value
 
+def rolloff_levels(
+    linear_rgb: np.ndarray,
+    extrema_percentile: float = 99.999,
+    extrema_multiplier: float = 1.0,
+    threshold_percentile: float = 98,
+    threshold_multiplier: float = 1.0,
+    method: str = "histogram",
+) -> tuple[float, float]:
+    """由百分位计算rolloff的 (高光上限, 起始阈值)，两个百分位来自同一次统计。"""
+    extrema, threshold = hist_proc.percentiles(
+        linear_rgb, [extrema_percentile, threshold_percentile], method=method
+    )
+    return float(extrema * extrema_multiplier), float(threshold * threshold_multiplier)
+
 def rolloff(
     linear_rgb: np.ndarray,
     extrema_percentile: float = 99.999,
     extrema_multiplier: float = 1.0,
     threshold_percentile: float = 98,
     threshold_multiplier: float = 1.0,
+    levels: tuple[float, float] | None = None,
+    out: np.ndarray = None
 ) -> np.ndarray:
-    return linear_rgb
+    # levels为rolloff_levels预先计算的 (高光上限, 起始阈值)，给定时不再从输入计算百分位，
+    # 分块渲染时所有块使用同一组levels。给定out时结果写入out，否则返回新数组
+    return np.multiply(linear_rgb, 1.0, out=out)
 
 def smootherstep_3(x):
     x = np.clip(x, 0.0, 1.0)
@@ -37,13 +56,31 @@ def smootherstep_5(x):
     x = np.clip(x, 0.0, 1.0)
     return x * x * x * (x * (x * 6 - 15) + 10)
 
-def tune_function(x, function_type="Standard"):
-    t = x / np.max(x)
+_TUNE_BLOCK = 65536
+
+def tune_function(x, function_type="Standard", max_value=None, out=None):
     if function_type == "None":
-        return t
+        curve = None
     elif function_type == "Standard":
-        return smootherstep_3(t)
+        curve = smootherstep_3
     elif function_type == "Enhanced":
-        return smootherstep_5(t)
+        curve = smootherstep_5
     else:
         raise ValueError("function_type must be None, Standard or Enhanced.")
+    if max_value is None:
+        max_value = np.max(x)
+
+    if out is None:
+        t = x / max_value
+        return t if curve is None else curve(t)
+
+    # 写入out（可以就是x）时按块计算，临时数组只占一个块的大小
+    t = np.divide(x, max_value, out=out)
+    if curve is not None and not t.flags.c_contiguous:
+        t[...] = curve(t)
+    elif curve is not None:
+        flat_t = t.reshape(-1)
+        for start in range(0, flat_t.size, _TUNE_BLOCK):
+            block = flat_t[start:start + _TUNE_BLOCK]
+            block[...] = curve(block)
+    return t
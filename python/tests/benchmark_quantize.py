@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Revela - Professional Film Processing System
+
+Benchmark of the fused export quantization kernels against the naive clip/astype conversion
+
+File Information:
+    File Name: benchmark_quantize.py
+    Author: Flemyng
+    Email: flemyng1999@gmail.com
+    Created: 2025-07-18 12:44:01
+    Last Modified: 2025-07-18 12:44:01
+    Version: 1.0.0
+    Python Version: 3.12+
+    License: GPL-3.0 license
+
+Project Information:
+    Project: Revela
+    Repository: https://github.com/Flemyng1999/Revela
+    Documentation: https://github.com/Flemyng1999/Revela/docs
+
+Copyright (c) 2025 Flemyng. All rights reserved.
+This file is part of the Revela project.
+
+For more information, please refer to the project documentation.
+"""
+
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# 添加python目录到路径
+current_dir = Path(__file__).parent
+python_dir = current_dir.parent
+if str(python_dir) not in sys.path:
+    sys.path.insert(0, str(python_dir))
+
+from processing import image_export
+
+
+def best_time(func, repeat: int) -> tuple[float, np.ndarray]:
+    """多次运行取最短耗时，返回 (秒, 最后一次的结果)。"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(megapixels: float, repeat: int) -> None:
+    rng = np.random.default_rng(0)
+    side = int(np.sqrt(megapixels * 1_000_000))
+    image = rng.random((side, side, 3))
+    pixels = side * side
+    workers = os.cpu_count() or 1
+    out8 = np.empty(image.shape, dtype=np.uint8)
+    out16 = np.empty(image.shape, dtype=np.uint16)
+
+    cases = {
+        "8-bit clip+astype (截断)": lambda: np.clip(image * 255, 0, 255).astype(np.uint8),
+        "8-bit quantize": lambda: image_export.to_uint8(image, out=out8),
+        "8-bit quantize ordered": lambda: image_export.to_uint8(image, out=out8, dither="ordered"),
+        "8-bit quantize blue_noise": lambda: image_export.to_uint8(image, out=out8, dither="blue_noise"),
+        f"8-bit quantize x{workers} threads": lambda: image_export.quantize(
+            image, 8, out=out8, workers=workers),
+        "16-bit clip+astype (截断)": lambda: np.clip(image * 65535, 0, 65535).astype(np.uint16),
+        "16-bit quantize": lambda: image_export.to_uint16(image, out=out16),
+        f"16-bit quantize x{workers} threads": lambda: image_export.quantize(
+            image, 16, out=out16, workers=workers),
+    }
+
+    print(f"图像: {side}x{side}x3 float64 ({pixels / 1e6:.1f} MP), 重复 {repeat} 次取最快")
+    for name, func in cases.items():
+        seconds, _ = best_time(func, repeat)
+        print(f"{name:<32} {seconds * 1000:9.1f} ms  {pixels / seconds / 1e6:7.1f} MP/s  "
+              f"{seconds * 1000 / (pixels / 1e6):6.2f} ms/MP")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="导出量化性能测试")
+    parser.add_argument("--megapixels", type=float, default=24.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.megapixels, args.repeat)
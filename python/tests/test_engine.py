@@ -27,13 +27,17 @@ For more information, please refer to the project documentation.
 """
 
 
+import os
 import sys
 import unittest
+import multiprocessing
 import tempfile
 import shutil
 from unittest.mock import MagicMock, patch
 from pathlib import Path
 
+import numpy as np
+
 # 添加父目录到Python路径，确保能找到core和engine模块
 current_dir = Path(__file__).parent
 python_dir = current_dir.parent
@@ -41,7 +45,22 @@ if str(python_dir) not in sys.path:
     sys.path.insert(0, str(python_dir))
 
 from core.roll import Roll
+from core.frame import Frame
+from core.calibration import RollAnalysisState, RollCalibrationProfile
+from engine import analyzer as analyzer_module
+from engine.analyzer import Analyzer
 from engine.coordinator import AnalysisCoordinator
+from engine.renderer import Renderer
+from engine.exporter import Exporter, ExportManifest
+from core.recipe import ExportRecipe, ExportOutput, ExportFormat
+from processing import conversion as conversion_proc
+from processing import image_export
+from processing import image_loader as image_loader_proc
+from processing.lut_cache import LutRegistry
+from engine import pipeline as pipeline_module
+from engine.pipeline import (
+    RenderPipeline, RenderContext, RenderBuffers, BakedChainStage, FLOAT32_TOLERANCE
+)
 
 class TestAnalysisCoordinator(unittest.TestCase):
 
@@ -66,51 +85,884 @@ class TestAnalysisCoordinator(unittest.TestCase):
         if self.temp_dir.exists():
             shutil.rmtree(self.temp_dir)
 
-    @patch('processing.cache_utils.load_profile_from_csv')
-    def test_get_calibration_profile_cache_hit(self, mock_load_csv):
+    @patch('processing.cache_utils.load_profile')
+    def test_get_calibration_profile_cache_hit(self, mock_load_profile):
         """测试当缓存存在时（缓存命中）的行为。"""
         print("测试缓存命中...")
         # 安排：让假的“加载缓存”函数返回一个模拟的配置文件
         mock_profile = MagicMock() 
-        mock_load_csv.return_value = mock_profile
+        mock_load_profile.return_value = mock_profile
 
         # 执行：调用我们要测试的方法
         result = self.coordinator.get_calibration_profile(self.test_roll)
 
         # 断言：验证我们的期望
         # 1. 确认它尝试去加载缓存了
-        mock_load_csv.assert_called_once()
+        mock_load_profile.assert_called_once()
         # 2. **最关键的断言**：确认它**没有**调用耗时的分析器！
-        self.mock_analyzer.analyze_roll.assert_not_called()
+        self.mock_analyzer.analyze_statistics_incremental.assert_not_called()
         # 3. 确认返回的是从缓存中加载的那个对象
         self.assertEqual(result, mock_profile)
         # 4. 确认Roll对象的calibration属性被正确设置
         self.assertEqual(self.test_roll.calibration, mock_profile)
 
-    @patch('processing.cache_utils.load_profile_from_csv')
-    @patch('processing.cache_utils.save_profile_to_csv')
-    def test_get_calibration_profile_cache_miss(self, mock_save_csv, mock_load_csv):
+    @patch('processing.cache_utils.load_profile')
+    @patch('processing.cache_utils.save_profile')
+    def test_get_calibration_profile_cache_miss(self, mock_save_profile, mock_load_profile):
         """测试当缓存不存在时（缓存未命中）的行为。"""
         print("测试缓存未命中...")
         # 安排：让假的“加载缓存”函数返回None，模拟找不到缓存文件
-        mock_load_csv.return_value = None
+        mock_load_profile.return_value = None
         # 安排：让假的分析器在被调用时，返回一个模拟的分析结果
         mock_new_profile = MagicMock()
-        self.mock_analyzer.analyze_roll.return_value = mock_new_profile
+        self.mock_analyzer.analyze_statistics_incremental.return_value = (
+            mock_new_profile, RollAnalysisState('', '', {}, {})
+        )
 
         # 执行
         result = self.coordinator.get_calibration_profile(self.test_roll)
 
         # 断言
         # 1. 确认它尝试去加载缓存了
-        mock_load_csv.assert_called_once()
+        mock_load_profile.assert_called_once()
         # 2. **最关键的断言**：确认它**调用了**耗时的分析器！
-        self.mock_analyzer.analyze_roll.assert_called_once_with(self.test_roll)
+        self.mock_analyzer.analyze_statistics_incremental.assert_called_once_with(
+            self.test_roll, [], [], None
+        )
         # 3. 确认它尝试去保存新的分析结果到缓存
-        mock_save_csv.assert_called_once_with(mock_new_profile, unittest.mock.ANY)
+        mock_save_profile.assert_called_once_with(mock_new_profile, unittest.mock.ANY)
         # 4. 确认返回的是新计算出的那个对象
         self.assertEqual(result, mock_new_profile)
 
 
+def fake_thumbnail_density(image_path, light_ratio, target_size=(64, 64), pyramid=None):
+    """按文件名生成确定性的float64缩略图密度。"""
+    seed = int(Path(image_path).stem.split('_')[-1])
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.0, 2.5, size=(*target_size, 3))
+
+
+class TestAnalyzerSinglePass(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for i in range(4):
+            (self.temp_dir / f"frame_{i}.tif").touch()
+        self.test_roll = Roll(folder_path=self.temp_dir, film_type="test_film")
+        self.analyzer = Analyzer()
+
+    def tearDown(self):
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_single_pass_decodes_each_frame_once(self, mock_loader):
+        """单次解码模式下每帧只读取一次，结果与逐像素的多次解码相差不超过bin宽。"""
+        profile = self.analyzer.analyze_roll_single_pass(self.test_roll)
+        self.assertEqual(mock_loader.call_count, len(self.test_roll.frames))
+
+        mock_loader.reset_mock()
+        reference = self.analyzer.analyze_roll(self.test_roll)
+        self.assertEqual(mock_loader.call_count, 3 * len(self.test_roll.frames))
+
+        # 逐帧直方图的bin宽不超过 密度范围(0~2.5) / bin数
+        frame_bin = 2.5 / analyzer_module.FRAME_HISTOGRAM_BINS
+        roll_bin = reference.hist_bins[1] - reference.hist_bins[0]
+        np.testing.assert_allclose(profile.d_min, reference.d_min, rtol=0, atol=frame_bin)
+        np.testing.assert_allclose(profile.d_max, reference.d_max, rtol=0, atol=frame_bin)
+        self.assertAlmostEqual(profile.hist_values.sum(), reference.hist_values.sum())
+        self.assertAlmostEqual(profile.extrema_high_density_net, reference.extrema_high_density_net,
+                               delta=roll_bin + 2 * frame_bin)
+        self.assertAlmostEqual(profile.clip_threshold, reference.clip_threshold,
+                               delta=roll_bin + 2 * frame_bin)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_reduced_statistics_are_within_one_bin_of_pixel_results(self, mock_loader):
+        """逐帧归约后的极值和聚合直方图百分位与逐像素计算的差不超过bin宽。"""
+        from processing import histogram as hist_proc
+        recipe = self.test_roll.technical_recipe
+        frame_bin = 2.5 / analyzer_module.FRAME_HISTOGRAM_BINS
+        densities = [fake_thumbnail_density(frame.image_path, recipe.light_ratio)
+                     for frame in self.test_roll.frames]
+
+        for density in densities:
+            stats = analyzer_module._reduce_frame(density)
+            self.assertIsNone(getattr(stats, 'density', None))
+            density_min, density_max = analyzer_module._frame_extrema(stats, recipe)
+            flat = density.reshape(-1, 3)
+            np.testing.assert_allclose(density_min, np.percentile(flat, recipe.dmin_percentile, axis=0),
+                                       rtol=0, atol=frame_bin)
+            np.testing.assert_allclose(density_max, np.percentile(flat, recipe.dmax_percentile, axis=0),
+                                       rtol=0, atol=frame_bin)
+
+        profile = self.analyzer.analyze_roll_single_pass(self.test_roll)
+        direct = hist_proc.HistogramSketch(
+            recipe.bins_number, (-0.1, profile.d_max.max() + 0.1), channels=3
+        )
+        for density in densities:
+            direct.add(density - profile.d_min)
+        roll_bin = direct.bin_edges[1] - direct.bin_edges[0]
+        np.testing.assert_array_equal(profile.hist_bins, direct.bin_centers)
+        self.assertEqual(profile.hist_values.sum() * len(densities), direct.total)
+
+        levels = [1.0, 50.0, recipe.high_density_percentile, recipe.extrema_high_density_percentile]
+        reduced = hist_proc.histogram_percentiles(profile.hist_values, direct.bin_edges, levels)
+        np.testing.assert_allclose(reduced, direct.percentiles(levels), rtol=0, atol=roll_bin + frame_bin)
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         "子进程需要继承被替换的图像加载函数")
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_parallel_matches_serial(self, mock_loader):
+        """进程池并行分析（单次解码和多次解码）的结果与各自的串行路径完全一致。"""
+        for parallel, serial in (
+            (Analyzer(max_workers=2).analyze_roll_single_pass(self.test_roll),
+             self.analyzer.analyze_roll_single_pass(self.test_roll)),
+            (Analyzer(max_workers=2).analyze_roll(self.test_roll),
+             self.analyzer.analyze_roll(self.test_roll)),
+        ):
+            np.testing.assert_array_equal(parallel.d_min, serial.d_min)
+            np.testing.assert_array_equal(parallel.d_max, serial.d_max)
+            np.testing.assert_array_equal(parallel.hist_values, serial.hist_values)
+            np.testing.assert_array_equal(parallel.k_values, serial.k_values)
+            self.assertEqual(parallel.extrema_high_density_net, serial.extrema_high_density_net)
+            self.assertEqual(parallel.clip_threshold, serial.clip_threshold)
+
+    def test_out_of_range_and_missing_densities_are_reduced(self):
+        """远超常规范围的密度（如uint16直接换算）和NaN通道不会使归约后的百分位失败。"""
+        recipe = self.test_roll.technical_recipe
+        rng = np.random.default_rng(0)
+        density = rng.uniform(1000.0, 30000.0, size=(256, 256, 3))
+        density[..., 2] = np.nan
+
+        stats = analyzer_module._reduce_frame(density)
+        density_min, density_max = analyzer_module._frame_extrema(stats, recipe)
+        flat = density[..., :2].reshape(-1, 2)
+        bin_width = (stats.histogram_range[1] - stats.histogram_range[0]) / analyzer_module.FRAME_HISTOGRAM_BINS
+        np.testing.assert_allclose(density_min[:2], np.percentile(flat, recipe.dmin_percentile, axis=0),
+                                   rtol=0, atol=bin_width)
+        np.testing.assert_allclose(density_max[:2], np.percentile(flat, recipe.dmax_percentile, axis=0),
+                                   rtol=0, atol=bin_width)
+        self.assertTrue(np.isnan(density_min[2]))
+
+        constant = analyzer_module._reduce_frame(np.full((8, 8, 3), 7.0))
+        np.testing.assert_array_equal(analyzer_module._frame_extrema(constant, recipe)[0], [7.0] * 3)
+
+
+class TestFrameStatisticsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for i in range(3):
+            (self.temp_dir / f"frame_{i}.tif").touch()
+        self.test_roll = Roll(folder_path=self.temp_dir, film_type="test_film")
+        self.coordinator = AnalysisCoordinator(analyzer=Analyzer())
+
+    def tearDown(self):
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_recipe_change_reuses_frame_statistics(self, mock_loader):
+        """只修改不影响逐帧统计量的配方字段时，不应重新解码图像。"""
+        first = self.coordinator.get_calibration_profile(self.test_roll)
+        self.assertEqual(mock_loader.call_count, 3)
+
+        mock_loader.reset_mock()
+        self.test_roll.technical_recipe.interpolation_factor = 3.0
+        self.test_roll.technical_recipe.high_density_percentile = 95.0
+        second = self.coordinator.get_calibration_profile(self.test_roll)
+        mock_loader.assert_not_called()
+        np.testing.assert_array_equal(second.d_min, first.d_min)
+        np.testing.assert_array_equal(second.hist_values, first.hist_values)
+
+        # dmin/dmax百分位由缓存的逐帧直方图重新求得，同样不需要解码
+        self.test_roll.technical_recipe.dmin_percentile = 10.0
+        third = self.coordinator.get_calibration_profile(self.test_roll)
+        mock_loader.assert_not_called()
+        np.testing.assert_array_equal(
+            third.d_min, Analyzer().analyze_roll_single_pass(self.test_roll).d_min
+        )
+        self.assertFalse(np.array_equal(third.d_min, first.d_min))
+        mock_loader.reset_mock()
+
+        self.test_roll.technical_recipe.light_ratio = [1.0, 0.9, 0.8]
+        self.coordinator.get_calibration_profile(self.test_roll)
+        self.assertEqual(mock_loader.call_count, 3)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_pyramid_and_direct_statistics_are_cached_separately(self, mock_loader):
+        """缩略图金字塔和直接解码的逐帧统计量与校准配置各自缓存，互不命中。"""
+        self.coordinator.get_calibration_profile(self.test_roll)
+        mock_loader.reset_mock()
+        pyramid_coordinator = AnalysisCoordinator(analyzer=Analyzer(thumbnail_pyramid=True))
+        pyramid_coordinator.get_calibration_profile(self.test_roll)
+        self.assertEqual(mock_loader.call_count, 3)
+        self.assertIsNotNone(mock_loader.call_args.kwargs['pyramid'])
+
+        mock_loader.reset_mock()
+        self.coordinator.get_calibration_profile(self.test_roll)
+        pyramid_coordinator.get_calibration_profile(self.test_roll)
+        mock_loader.assert_not_called()
+        self.assertEqual(len(list((self.temp_dir / '.cache' / 'frames').rglob('*.stats.npz'))), 6)
+        self.assertEqual(len(list((self.temp_dir / '.cache').glob('*.profile.npz'))), 2)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_stale_cache_entries_are_pruned(self, mock_loader):
+        """写入新的统计量和配置文件时清理同一来源下过期的条目，其它来源的缓存保留。"""
+        cache_dir = self.temp_dir / '.cache'
+        AnalysisCoordinator(analyzer=Analyzer(thumbnail_pyramid=True)).get_calibration_profile(self.test_roll)
+        self.coordinator.get_calibration_profile(self.test_roll)
+        self.test_roll.technical_recipe.interpolation_factor = 3.0
+        self.coordinator.get_calibration_profile(self.test_roll)
+        self.assertEqual(len(list(cache_dir.glob('*-direct.profile.npz'))), 1)
+
+        (self.temp_dir / "frame_0.tif").unlink()
+        roll = Roll(folder_path=self.temp_dir, film_type="test_film")
+        roll.technical_recipe.light_ratio = [1.0, 0.9, 0.8]
+        self.coordinator.get_calibration_profile(roll)
+        self.assertEqual(len(list((cache_dir / 'frames' / 'direct').glob('*.stats.npz'))), 2)
+        self.assertEqual(len(list((cache_dir / 'frames' / 'pyramid').glob('*.stats.npz'))), 3)
+        self.assertEqual(len(list(cache_dir.glob('*-direct.profile.npz'))), 1)
+        self.assertEqual(len(list(cache_dir.glob('*-pyramid.profile.npz'))), 1)
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_analysis_state_with_other_version_is_discarded(self, mock_loader):
+        """增量分析状态带有格式版本，版本不同的状态视为不存在。"""
+        from processing import cache_utils
+        self.coordinator.get_calibration_profile(self.test_roll)
+        state_path = self.temp_dir / '.cache' / 'analysis_state.npz'
+        self.assertIsNotNone(cache_utils.load_analysis_state(state_path))
+
+        with patch.object(cache_utils, 'ANALYSIS_STATE_FORMAT_VERSION',
+                          cache_utils.ANALYSIS_STATE_FORMAT_VERSION + 1):
+            self.assertIsNone(cache_utils.load_analysis_state(state_path))
+
+    @patch('processing.image_loader.preprocess_thumbnail_density',
+           side_effect=fake_thumbnail_density)
+    def test_added_and_removed_frames_are_incremental(self, mock_loader):
+        """增删帧后只解码新增的帧，结果与完整分析一致。"""
+        self.coordinator.get_calibration_profile(self.test_roll)
+
+        (self.temp_dir / "frame_0.tif").unlink()
+        (self.temp_dir / "frame_7.tif").touch()
+        (self.temp_dir / "frame_8.tif").touch()
+        roll = Roll(folder_path=self.temp_dir, film_type="test_film")
+
+        mock_loader.reset_mock()
+        profile = self.coordinator.get_calibration_profile(roll)
+        self.assertEqual(mock_loader.call_count, 2)
+
+        reference = Analyzer().analyze_roll_single_pass(roll)
+        np.testing.assert_array_equal(profile.d_min, reference.d_min)
+        np.testing.assert_array_equal(profile.d_max, reference.d_max)
+        np.testing.assert_array_equal(profile.hist_values, reference.hist_values)
+        np.testing.assert_array_equal(profile.k_values, reference.k_values)
+        self.assertEqual(profile.clip_threshold, reference.clip_threshold)
+
+
+def make_test_calibration():
+    """构造一个用于渲染测试的校准配置。"""
+    return RollCalibrationProfile(
+        d_min=np.array([0.1, 0.2, 0.3]),
+        d_max=np.array([2.0, 2.2, 2.4]),
+        hist_bins=np.linspace(-0.1, 2.5, 1024),
+        hist_values=np.ones(1024),
+        k_values=np.array([1.0, 0.9, 0.95]),
+        extrema_high_density_net=1.2,
+        clip_threshold=0.9,
+    )
+
+
+class TestRenderPipeline(unittest.TestCase):
+
+    def setUp(self):
+        # 阶段缓存以源文件的大小和修改时间为键，源文件需要真实存在
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for name in ("frame_0.tif", "frame_1.tif", "frame_2.tif"):
+            (self.temp_dir / name).write_bytes(b"scan")
+        self.frame = Frame(self.temp_dir / "frame_0.tif")
+        self.image = np.random.default_rng(0).random((16, 12, 3))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_with_stage_replaces_single_stage(self):
+        """替换一个阶段不影响原流水线和其它阶段。"""
+        pipeline = RenderPipeline.default()
+        replacement = MagicMock(side_effect=lambda image, context: image)
+        swapped = pipeline.with_stage("rolloff", replacement)
+
+        self.assertEqual(swapped.stage_names, pipeline.stage_names)
+        self.assertIs(swapped.stage("rolloff"), replacement)
+        self.assertIsNot(pipeline.stage("rolloff"), replacement)
+        self.assertIs(swapped.stage("linear"), pipeline.stage("linear"))
+        with self.assertRaises(KeyError):
+            pipeline.with_stage("unknown", replacement)
+
+    def test_preview_and_full_quality_share_pipeline(self):
+        """预览和全尺寸渲染执行同一条流水线，结果只差输出变换。"""
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = self.image.copy()
+
+        def load_full_quality(frame):
+            frame.full_quality_data = self.image.copy()
+
+        tone = MagicMock(side_effect=RenderPipeline.default().stage("tone"))
+        renderer = Renderer(None, RenderPipeline.default().with_stage("tone", tone))
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail), \
+             patch('processing.image_loader.load_full_quality', load_full_quality):
+            preview = renderer.render_preview(self.frame, make_test_calibration(), (16, 12))
+            full = renderer.render_full_quality(self.frame, make_test_calibration())
+
+        self.assertEqual(tone.call_count, 2)
+        np.testing.assert_array_equal(preview, full)
+
+    def test_preview_resumes_from_cached_stages(self):
+        """创意配方改变时从线性图像继续，技术配方改变时从光学密度继续。"""
+        load_thumbnail = MagicMock(side_effect=lambda frame, target_size=None:
+                                   setattr(frame, 'thumbnail_data', self.image.copy()))
+        default = RenderPipeline.default()
+        density = MagicMock(side_effect=default.stage("density"))
+        normalize = MagicMock(side_effect=default.stage("normalize"))
+        pipeline = default.with_stage("density", density).with_stage("normalize", normalize)
+        renderer = Renderer(None, pipeline)
+        calibration = make_test_calibration()
+
+        def render():
+            fresh = Renderer(None).render_preview(self.frame, calibration, (16, 12))
+            with patch('processing.image_loader.load_thumbnail', load_thumbnail):
+                image = renderer.render_preview(self.frame, calibration, (16, 12))
+            np.testing.assert_array_equal(image, fresh)
+            return load_thumbnail.call_count, density.call_count, normalize.call_count
+
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            self.assertEqual(render(), (2, 1, 1))
+            self.frame.creative_recipe.tone_mapping = "Enhanced"
+            self.assertEqual(render(), (3, 1, 1))
+            self.frame.technical_recipe.target_extrema_high_density_mode = "Manual"
+            self.assertEqual(render(), (4, 1, 2))
+            self.frame.technical_recipe.light_ratio = [1.0, 0.9, 0.8]
+            self.assertEqual(render(), (6, 2, 3))
+
+    def test_stage_cache_tracks_source_and_lut_files(self):
+        """源文件或LUT文件改变后不再使用缓存的中间结果。"""
+        load_thumbnail = MagicMock(side_effect=lambda frame, target_size=None:
+                                   setattr(frame, 'thumbnail_data', self.image.copy()))
+        renderer = Renderer(None)
+        calibration = make_test_calibration()
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            renderer.render_preview(self.frame, calibration, (16, 12))
+            renderer.render_preview(self.frame, calibration, (16, 12))
+            self.assertEqual(load_thumbnail.call_count, 1)
+            self.frame.image_path.write_bytes(b"rescanned")
+            renderer.render_preview(self.frame, calibration, (16, 12))
+            self.assertEqual(load_thumbnail.call_count, 2)
+
+        def write_cube(transform, digits):
+            lines = ["LUT_3D_SIZE 2"]
+            for b in (0.0, 1.0):
+                for g in (0.0, 1.0):
+                    for r in (0.0, 1.0):
+                        lines.append(" ".join(f"{transform(v):.{digits}f}" for v in (r, g, b)))
+            (self.temp_dir / "film.cube").write_text("\n".join(lines) + "\n")
+
+        self.frame.creative_recipe.display_mode = "LUT"
+        self.frame.creative_recipe.lut_name = "film.cube"
+        # 烘焙LUT的键包含显示阶段的输入，LUT文件改变后重新烘焙
+        bake = MagicMock(side_effect=BakedChainStage._bake)
+        renderer = Renderer(None, RenderPipeline.default().with_baked_chain())
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail), \
+                patch('engine.pipeline.lut_dir', self.temp_dir), \
+                patch('engine.pipeline._lut_registry', LutRegistry()), \
+                patch.object(BakedChainStage, '_bake', autospec=True, side_effect=bake):
+            write_cube(lambda v: v, 1)
+            identity = renderer.render_preview(self.frame, calibration, (16, 12))
+            renderer.render_preview(self.frame, calibration, (16, 12))
+            self.assertEqual(bake.call_count, 1)
+            write_cube(lambda v: 1.0 - v, 2)
+            inverted = renderer.render_preview(self.frame, calibration, (16, 12))
+            self.assertEqual(bake.call_count, 2)
+            expected = Renderer(None).render_preview(self.frame, calibration, (16, 12))
+        np.testing.assert_allclose(inverted, expected, rtol=0, atol=1e-3)
+        self.assertFalse(np.array_equal(identity, inverted))
+
+    def test_lut_registry_is_created_lazily_in_user_cache(self):
+        """共享的LUT缓存在首次使用时创建，默认写入用户缓存目录，也可由应用配置指定。"""
+        with patch('engine.pipeline._lut_registry', None), \
+                patch('sys.platform', 'linux'), \
+                patch.dict(os.environ, {'XDG_CACHE_HOME': str(self.temp_dir)}):
+            registry = pipeline_module.get_lut_registry()
+            self.assertIs(pipeline_module.get_lut_registry(), registry)
+            self.assertEqual(registry.cache_dir, self.temp_dir / "Revela" / "lut")
+
+            configured = pipeline_module.configure_lut_registry(None)
+            self.assertIs(pipeline_module.get_lut_registry(), configured)
+            self.assertIsNone(configured.cache_dir)
+
+    def test_baked_chain_matches_pipeline_and_rebuilds_lazily(self):
+        """烘焙LUT的结果接近逐阶段执行，只在配方改变时重建。"""
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = self.image.copy()
+
+        baked = RenderPipeline.default().with_baked_chain()
+        self.assertEqual(baked.stage_names[-1], "baked_chain")
+        bake = MagicMock(side_effect=BakedChainStage._bake)
+        renderer = Renderer(None, baked)
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail), \
+             patch.object(BakedChainStage, '_bake', autospec=True, side_effect=bake):
+            for tone_mapping in ("Standard", "Standard", "Enhanced"):
+                self.frame.creative_recipe.tone_mapping = tone_mapping
+                expected = Renderer(None).render_preview(self.frame, make_test_calibration(), (16, 12))
+                image = renderer.render_preview(self.frame, make_test_calibration(), (16, 12))
+                np.testing.assert_allclose(image, expected, rtol=0, atol=1e-3)
+
+        self.assertEqual(bake.call_count, 2)
+
+    def test_baked_chain_reuses_proxy_statistics(self):
+        """输入和配方不变时不再在降采样输入上重跑整段链，LUT以 (键, LUT) 一对发布。"""
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = self.image.copy()
+
+        baked = RenderPipeline.default().with_baked_chain()
+        stage = dict(baked._stages)["baked_chain"]
+        renderer = Renderer(None, baked)
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail), \
+             patch.object(stage.chain, 'run', wraps=stage.chain.run) as chain_run:
+            first = renderer.render_preview(self.frame, make_test_calibration(), (16, 12))
+            self.assertEqual(chain_run.call_count, 2)
+            second = renderer.render_preview(self.frame, make_test_calibration(), (16, 12))
+            self.assertEqual(chain_run.call_count, 2)
+            self.frame.creative_recipe.tone_mapping = "Enhanced"
+            renderer.render_preview(self.frame, make_test_calibration(), (16, 12))
+            self.assertEqual(chain_run.call_count, 4)
+
+        np.testing.assert_array_equal(first, second)
+        _, lut = stage._lut_entry
+        self.assertEqual(lut.shape, (stage.size,) * 3 + (3,))
+
+    def test_baked_chain_handles_flat_channels(self):
+        """恒定通道的定义域宽度为0，烘焙结果仍与逐阶段执行一致而不是NaN。"""
+        flat = self.image.copy()
+        flat[..., 1] = 0.5
+
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = flat.copy()
+
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            expected = Renderer(None).render_preview(self.frame, make_test_calibration(), (16, 12))
+            image = Renderer(None, RenderPipeline.default().with_baked_chain()).render_preview(
+                self.frame, make_test_calibration(), (16, 12))
+
+        self.assertFalse(np.isnan(image).any())
+        np.testing.assert_allclose(image, expected, rtol=0, atol=1e-3)
+
+    def test_ocio_processors_are_built_once_per_renderer(self):
+        """OCIO处理器在帧之间复用，applyRGB收到C连续的float32数组，结果保持输入的dtype。"""
+        applied = []
+        cpu_processor = MagicMock()
+        cpu_processor.applyRGB.side_effect = lambda image: applied.append(image)
+        config = MagicMock()
+        config.getProcessor.return_value.getOptimizedCPUProcessor.return_value = cpu_processor
+
+        renderer = Renderer(config)
+        self.assertIsInstance(renderer.ocio_processors, conversion_proc.OcioProcessorCache)
+        density = self.image.astype(np.float64)
+        with patch('processing.conversion.ocio'):
+            for _ in range(2):
+                linear = conversion_proc.density_to_linear(density, renderer.ocio_processors, "ACEScg")
+                np.testing.assert_allclose(linear, density * 0.8, rtol=1e-6)
+                self.assertEqual(linear.dtype, np.float64)
+
+            # 工作空间本身不需要转换，也不构建处理器
+            conversion_proc.density_to_linear(density, renderer.ocio_processors, "ACES2065-1")
+            buffer = np.zeros_like(self.image, dtype=np.float32)
+            self.assertIs(conversion_proc.apply_cpu_processor(cpu_processor, buffer, out=buffer), buffer)
+
+        config.getProcessor.assert_called_once_with("ACES2065-1", "ACEScg")
+        self.assertEqual(len(applied), 3)
+        self.assertIs(applied[-1], buffer)
+        for image in applied:
+            self.assertEqual(image.dtype, np.float32)
+            self.assertTrue(image.flags.c_contiguous)
+
+    def test_display_transform_is_unchanged(self):
+        """Displays模式的输出与不带OCIO配置时相同，显示转换尚未接入。"""
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = self.image.copy()
+
+        with patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            expected = Renderer(None).render_preview(self.frame, make_test_calibration(), (16, 12))
+            image = Renderer(MagicMock()).render_preview(self.frame, make_test_calibration(), (16, 12))
+        np.testing.assert_array_equal(image, expected)
+
+    def test_tiled_render_matches_full_render(self):
+        """统计量来自全图时，分条带渲染与整图渲染结果一致，包括上下翻转。"""
+        def load_full_quality(frame):
+            frame.full_quality_data = self.image.copy()
+
+        self.frame.creative_recipe.flip_up_and_down = True
+        renderer = Renderer(None)
+        with patch('processing.image_loader.load_full_quality', load_full_quality):
+            full = renderer.render_full_quality(self.frame, make_test_calibration())
+            strips = list(renderer.iter_full_quality_strips(
+                self.frame, make_test_calibration(), strip_rows=5, statistics_size=16
+            ))
+            tiled = renderer.render_full_quality_tiled(
+                self.frame, make_test_calibration(), strip_rows=5, statistics_size=16
+            )
+
+        self.assertEqual(len(strips), 4)
+        self.assertEqual([rows for rows, _ in strips], [slice(0, 5), slice(5, 10), slice(10, 15), slice(15, 16)])
+        self.assertIsNone(self.frame.full_quality_data)
+        np.testing.assert_array_equal(tiled, full)
+
+    def test_tiled_render_with_smaller_statistics_view(self):
+        """统计量取自小于全图的代理或降采样视图时，各条带仍使用同一组统计量，与整图渲染一致。"""
+        def load_full_quality(frame):
+            frame.full_quality_data = self.image.copy()
+
+        def load_thumbnail(frame, target_size=None):
+            frame.thumbnail_data = self.image[::2, ::2].copy()
+
+        calibration = make_test_calibration()
+        with patch('processing.image_loader.load_full_quality', load_full_quality), \
+                patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            renderer = Renderer(None, proxy_statistics_size=(8, 6))
+            proxy_full = renderer.render_full_quality(self.frame, calibration)
+            proxy_strips = list(renderer.iter_full_quality_strips(self.frame, calibration, strip_rows=5))
+            proxy_tiled = renderer.render_full_quality_tiled(self.frame, calibration, strip_rows=5)
+            self.assertFalse(np.array_equal(
+                proxy_full, Renderer(None).render_full_quality(self.frame, calibration)))
+
+            # 无代理时在步长为2的降采样视图上计算统计量；一个条带即整图
+            renderer = Renderer(None)
+            sampled_whole = renderer.render_full_quality_tiled(
+                self.frame, calibration, strip_rows=16, statistics_size=8
+            )
+            sampled_tiled = renderer.render_full_quality_tiled(
+                self.frame, calibration, strip_rows=5, statistics_size=8
+            )
+
+        self.assertEqual(len(proxy_strips), 4)
+        np.testing.assert_array_equal(np.concatenate([strip for _, strip in proxy_strips]), proxy_full)
+        np.testing.assert_array_equal(proxy_tiled, proxy_full)
+        np.testing.assert_array_equal(sampled_tiled, sampled_whole)
+
+    def test_float32_buffers_match_float64_path(self):
+        """float32工作缓冲区渲染与float64路径的差异在容差以内，缓冲区交替使用。"""
+        def load_full_quality(frame):
+            frame.full_quality_data = self.image.copy()
+
+        with patch('processing.image_loader.load_full_quality', load_full_quality):
+            full = Renderer(None).render_full_quality(self.frame, make_test_calibration())
+            full32 = Renderer(None, buffer_dtype=np.float32).render_full_quality(
+                self.frame, make_test_calibration()
+            )
+
+        self.assertEqual(full32.dtype, np.float32)
+        np.testing.assert_allclose(full32, full, rtol=0, atol=FLOAT32_TOLERANCE)
+
+        buffers = RenderBuffers(self.image.shape)
+        first = buffers.output_for(self.image)
+        second = buffers.output_for(first)
+        self.assertFalse(np.may_share_memory(first, second))
+        self.assertTrue(np.may_share_memory(buffers.output_for(second), first))
+        self.assertEqual(buffers.output_for(self.image[:5]).shape, (5, 12, 3))
+
+    def test_align_and_rolloff_write_into_work_buffers(self):
+        """对齐和Rolloff阶段的结果写入另一块工作缓冲区，不修改输入；没有缓冲区时返回新数组。"""
+        pipeline = RenderPipeline.default()
+        threshold = self.frame.technical_recipe.extrema_high_density_threshold
+        buffers = RenderBuffers(self.image.shape, np.float32)
+        source = buffers.output_for(self.image)
+        source[...] = self.image
+        snapshot = source.copy()
+
+        for buffers_ in (buffers, None):
+            for name in ("align", "rolloff"):
+                context = RenderContext(self.frame, make_test_calibration(), None, buffers=buffers_)
+                context.statistics.target_extrema_high_density = threshold + 1.0
+                result = pipeline.stage(name)(source, context)
+                self.assertFalse(np.may_share_memory(result, source))
+                if buffers_ is not None:
+                    self.assertTrue(np.may_share_memory(result, buffers.output_for(source)))
+                np.testing.assert_array_equal(source, snapshot)
+
+    def test_frozen_statistics_are_not_recomputed(self):
+        """冻结后条带使用已有统计量，缺失的统计量报错而不是从条带内计算。"""
+        pipeline = RenderPipeline.default()
+        context = RenderContext(self.frame, make_test_calibration(), None)
+        pipeline.collect_statistics(self.image, context)
+        statistics = dict(vars(context.statistics))
+
+        list(pipeline.run_strips(self.image, context, strip_rows=3))
+        self.assertEqual(vars(context.statistics), statistics)
+
+        context.statistics.sdr_max = None
+        with self.assertRaises(RuntimeError):
+            list(pipeline.run_strips(self.image, context, strip_rows=3))
+
+    def test_proxy_statistics_drive_full_render(self):
+        """代理统计量取自缩略图并复用预览的阶段缓存；缩略图即全图时结果与常规渲染一致。"""
+        def load_full_quality(frame):
+            frame.full_quality_data = self.image.copy()
+
+        load_thumbnail = MagicMock(side_effect=lambda frame, target_size=None:
+                                   setattr(frame, 'thumbnail_data', self.image.copy()))
+        size = (12, 16)
+        with patch('processing.image_loader.load_full_quality', load_full_quality), \
+                patch('processing.image_loader.load_thumbnail', load_thumbnail):
+            full = Renderer(None).render_full_quality(self.frame, make_test_calibration())
+
+            renderer = Renderer(None, proxy_statistics_size=size)
+            renderer.render_preview(self.frame, make_test_calibration(), size)
+            proxy_full = renderer.render_full_quality(self.frame, make_test_calibration())
+            proxy_tiled = renderer.render_full_quality_tiled(
+                self.frame, make_test_calibration(), strip_rows=5
+            )
+
+        self.assertEqual(load_thumbnail.call_count, 1)
+        np.testing.assert_array_equal(proxy_full, full)
+        np.testing.assert_array_equal(proxy_tiled, full)
+
+
+class TestPipelinedExporter(unittest.TestCase):
+
+    def setUp(self):
+        import tifffile
+        self.temp_dir = Path(tempfile.mkdtemp())
+        source_dir = self.temp_dir / "scans"
+        source_dir.mkdir()
+        for i in range(6):
+            tifffile.imwrite(source_dir / f"frame_{i}.tif", np.zeros((16, 12, 3), dtype=np.uint16))
+        self.frames = [Frame(source_dir / f"frame_{i}.tif") for i in range(6)]
+        self.recipe = ExportRecipe(export_format=ExportFormat.TIF_16_BIT)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def load_full_quality(frame):
+        seed = int(frame.image_path.stem.split('_')[-1])
+        frame.full_quality_data = np.random.default_rng(seed).random((16, 12, 3))
+
+    def test_pipelined_export_matches_serial_render(self):
+        """多线程流水线导出的文件与逐帧渲染一致，在途数据不超过上限。"""
+        import tifffile
+        roll = MagicMock(calibration=make_test_calibration())
+        frame_bytes = 16 * 12 * 3 * 8 * 2
+        exporter = Exporter(Renderer(None), readers=2, render_workers=3, writers=2,
+                            max_bytes_in_flight=2 * frame_bytes)
+        with patch('processing.image_loader.load_full_quality', self.load_full_quality):
+            paths = exporter.export_frames(self.frames, roll, self.recipe, self.temp_dir)
+            expected = [Renderer(None).render_full_quality(frame, roll.calibration)
+                        for frame in self.frames]
+
+        self.assertEqual([path.name for path in paths],
+                         [f"frame_{i}_exported.tif" for i in range(6)])
+        for path, image in zip(paths, expected):
+            np.testing.assert_array_equal(tifffile.imread(path),
+                                          image_export.to_uint16(image))
+        self.assertTrue(all(frame.full_quality_data is None for frame in self.frames))
+        self.assertLessEqual(exporter.peak_bytes_in_flight, 2 * frame_bytes)
+
+    def test_reader_reserves_budget_before_decoding(self):
+        """读取阶段先按文件头估计的大小占用预算再解码，并把内存映射读入内存。"""
+        from engine.exporter import ByteBudget
+        events = []
+        acquire = ByteBudget.acquire
+        renderer = Renderer(None)
+        render_targets = renderer.render_full_quality_targets
+
+        def record_acquire(budget, nbytes):
+            events.append(('acquire', nbytes))
+            acquire(budget, nbytes)
+
+        def record_load(frame):
+            events.append(('load', frame.filename))
+            frame.full_quality_data = image_loader_proc.read_image(frame.image_path)
+
+        def record_render(frame, *args):
+            events.append(('render', type(frame.full_quality_data)))
+            return render_targets(frame, *args)
+
+        exporter = Exporter(renderer, readers=1)
+        estimated = exporter._frame_cost(self.frames[0], 1)
+        roll = MagicMock(calibration=make_test_calibration())
+        with patch('processing.image_loader.load_full_quality', record_load), \
+                patch.object(ByteBudget, 'acquire', record_acquire), \
+                patch.object(renderer, 'render_full_quality_targets', record_render):
+            exporter.export_frames(self.frames[:2], roll, self.recipe, self.temp_dir)
+
+        self.assertEqual([event for event in events if event[0] != 'render'], [
+            ('acquire', estimated), ('load', "frame_0.tif"),
+            ('acquire', estimated), ('load', "frame_1.tif"),
+        ])
+        self.assertEqual([event[1] for event in events if event[0] == 'render'], [np.ndarray] * 2)
+
+    def test_error_stops_export_and_is_raised(self):
+        def load_full_quality(frame):
+            if frame.filename == "frame_2.tif":
+                raise OSError("broken scan")
+            self.load_full_quality(frame)
+
+        roll = MagicMock(calibration=make_test_calibration())
+        with patch('processing.image_loader.load_full_quality', load_full_quality):
+            with self.assertRaisesRegex(OSError, "broken scan"):
+                Exporter(Renderer(None)).export_frames(self.frames, roll, self.recipe, self.temp_dir)
+        self.assertTrue(all(frame.full_quality_data is None for frame in self.frames))
+
+    def test_multiple_outputs_share_one_render(self):
+        """每帧只加载、渲染一次，同时写出缩小的JPEG小样和全尺寸16位TIFF。"""
+        import tifffile
+        from PIL import Image
+        roll = MagicMock(calibration=make_test_calibration())
+        recipe = ExportRecipe(outputs=[
+            ExportOutput(ExportFormat.JPG, quality=80, filename_suffix="proof", max_size=8),
+            ExportOutput(ExportFormat.TIF_16_BIT, filename_suffix="master"),
+        ])
+        renderer = Renderer(None)
+        loader = MagicMock(side_effect=self.load_full_quality)
+        with patch('processing.image_loader.load_full_quality', loader), \
+                patch.object(renderer.pipeline, 'run', wraps=renderer.pipeline.run) as run:
+            paths = Exporter(renderer).export_frames(self.frames, roll, recipe, self.temp_dir)
+        self.assertEqual(loader.call_count, len(self.frames))
+        self.assertEqual(run.call_count, len(self.frames))
+
+        self.assertEqual([path.name for path in paths[:2]], ["frame_0_proof.jpg", "frame_0_master.tif"])
+        with patch('processing.image_loader.load_full_quality', self.load_full_quality):
+            expected = Renderer(None).render_full_quality(self.frames[0], roll.calibration)
+        np.testing.assert_array_equal(tifffile.imread(paths[1]),
+                                      image_export.to_uint16(expected))
+        with Image.open(paths[0]) as proof:
+            self.assertEqual(proof.size, (6, 8))
+
+        with self.assertRaises(ValueError):
+            ExportRecipe(outputs=[ExportOutput(), ExportOutput()]).resolved_outputs()
+
+    def test_rerun_resumes_missing_and_stale_frames(self):
+        """中断后重新导出只处理未完成的帧；配方变化或输出损坏的帧重新导出，其余跳过。"""
+        def failing_loader(frame):
+            if frame.filename == "frame_3.tif":
+                raise OSError("interrupted")
+            self.load_full_quality(frame)
+
+        roll = MagicMock(calibration=make_test_calibration())
+        exporter = Exporter(Renderer(None), readers=1, render_workers=1, writers=1)
+        with patch('processing.image_loader.load_full_quality', failing_loader):
+            with self.assertRaises(OSError):
+                exporter.export_frames(self.frames, roll, self.recipe, self.temp_dir)
+        self.assertEqual(list(self.temp_dir.glob(".*.tmp")), [])
+
+        loader = MagicMock(side_effect=self.load_full_quality)
+        with patch('processing.image_loader.load_full_quality', loader):
+            paths = exporter.export_frames(self.frames, roll, self.recipe, self.temp_dir)
+            self.assertEqual(sorted(call.args[0].filename for call in loader.call_args_list),
+                             ["frame_3.tif", "frame_4.tif", "frame_5.tif"])
+            self.assertTrue(all(path.exists() for path in paths))
+
+            loader.reset_mock()
+            exporter.export_frames(self.frames, roll, self.recipe, self.temp_dir)
+            loader.assert_not_called()
+
+            self.frames[1].creative_recipe.tone_mapping = "None"
+            paths[4].write_bytes(b"truncated")
+            exporter.export_frames(self.frames, roll, self.recipe, self.temp_dir)
+            self.assertEqual(sorted(call.args[0].filename for call in loader.call_args_list),
+                             ["frame_1.tif", "frame_4.tif"])
+
+    def test_stage_identity_uses_declared_versions(self):
+        """阶段标识由限定名和声明的版本决定，与字节码无关；版本递增后标识改变。"""
+        self.assertEqual(pipeline_module.stage_identity(pipeline_module.clip_stage),
+                         "engine.pipeline.clip_stage:v1")
+        with patch.dict(pipeline_module.STAGE_VERSIONS, {pipeline_module.clip_stage: 2}):
+            self.assertEqual(pipeline_module.stage_identity(pipeline_module.clip_stage),
+                             "engine.pipeline.clip_stage:v2")
+
+        def custom_stage(image, context):
+            return image
+        custom_stage.stage_version = 3
+        self.assertTrue(pipeline_module.stage_identity(custom_stage).endswith("custom_stage:v3"))
+        self.assertIn(" at 0x", pipeline_module.stage_identity(lambda image, context: image))
+
+    def test_fingerprints_cover_render_parameters_and_full_path(self):
+        """阶段实现、工作精度、代理统计量尺寸和LUT文件改变时指纹改变；不同目录中的同名帧各自记录。"""
+        calibration = make_test_calibration()
+        outputs = self.recipe.resolved_outputs()
+
+        def fingerprints(renderer, frame=self.frames[0]):
+            return Exporter(renderer)._frame_fingerprints(frame, calibration, outputs)['recipe']
+
+        baseline = fingerprints(Renderer(None))
+        self.assertEqual(fingerprints(Renderer(None)), baseline)
+        pipeline = RenderPipeline.default()
+        variants = [
+            Renderer(None, pipeline=pipeline.with_stage("clip", lambda image, context: image)),
+            Renderer(None, pipeline=pipeline.with_baked_chain(size=33)),
+            Renderer(None, pipeline=pipeline.with_baked_chain(size=65)),
+            Renderer(None, buffer_dtype=np.float32),
+            Renderer(None, proxy_statistics_size=(64, 64)),
+        ]
+        values = [fingerprints(renderer) for renderer in variants]
+        self.assertEqual(len(set(values + [baseline])), len(variants) + 1)
+
+        lut_dir = self.temp_dir / "lut"
+        lut_dir.mkdir()
+        (lut_dir / "film.cube").write_text("LUT_3D_SIZE 2\n")
+        self.frames[0].creative_recipe.display_mode = "LUT"
+        self.frames[0].creative_recipe.lut_name = "film.cube"
+        with patch('engine.pipeline.lut_dir', lut_dir):
+            before = fingerprints(Renderer(None))
+            (lut_dir / "film.cube").write_text("LUT_3D_SIZE 33\n")
+            self.assertNotEqual(fingerprints(Renderer(None)), before)
+
+        other_dir = self.temp_dir / "other"
+        other_dir.mkdir()
+        shutil.copy(self.frames[1].image_path, other_dir / "frame_1.tif")
+        frames = [self.frames[1], Frame(other_dir / "frame_1.tif")]
+        roll = MagicMock(calibration=calibration)
+        output_dir = self.temp_dir / "out"
+        with patch('processing.image_loader.load_full_quality', self.load_full_quality):
+            for frame in frames:
+                Exporter(Renderer(None)).export_frames([frame], roll, self.recipe, output_dir)
+        self.assertEqual(sorted(ExportManifest(output_dir).frames),
+                         sorted(str(frame.image_path.resolve()) for frame in frames))
+
+    def test_memory_optimized_export_streams_tif_master(self):
+        """单个TIFF母版分条带流式写入，结果与整幅渲染一致。"""
+        import tifffile
+        roll = MagicMock(calibration=make_test_calibration(), frames=self.frames[:2])
+        roll.get_total_memory_usage.return_value = {'total': 0.0}
+        exporter = Exporter(Renderer(None))
+        with patch('processing.image_loader.load_full_quality', self.load_full_quality), \
+                patch('processing.image_export.write_tif_strips',
+                      wraps=image_export.write_tif_strips) as stream:
+            exporter.export_roll_with_memory_optimization(roll, self.recipe, self.temp_dir)
+            expected = Renderer(None).render_full_quality(self.frames[1], roll.calibration)
+
+        self.assertEqual(stream.call_count, 2)
+        np.testing.assert_array_equal(
+            tifffile.imread(self.temp_dir / "frame_1_exported.tif"),
+            image_export.to_uint16(expected)
+        )
+        with tifffile.TiffFile(self.temp_dir / "frame_1_exported.tif") as tif:
+            self.assertEqual(tif.pages[0].compression, 1)
+
+        # 压缩由导出配方选择
+        self.recipe.compression = 'zlib'
+        with patch('processing.image_loader.load_full_quality', self.load_full_quality):
+            exporter.export_roll_with_memory_optimization(roll, self.recipe, self.temp_dir)
+        with tifffile.TiffFile(self.temp_dir / "frame_1_exported.tif") as tif:
+            self.assertEqual(tif.pages[0].compression, 8)
+            np.testing.assert_array_equal(tif.asarray(), image_export.to_uint16(expected))
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
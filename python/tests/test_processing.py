@@ -27,8 +27,12 @@ For more information, please refer to the project documentation.
 """
 
 
+import os
 import sys
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 from pathlib import Path
 
 import numpy as np
@@ -40,6 +44,17 @@ if str(python_dir) not in sys.path:
     sys.path.insert(0, str(python_dir))
 
 from processing.density import t_to_d # 导入您想测试的函数
+from processing import density
+from processing.histogram import HistogramSketch
+from processing import histogram
+from processing import cache_utils
+from processing import conversion
+from processing import image_loader
+from processing import image_export
+from processing.lut_cache import LutRegistry
+from processing.pyramid_cache import ThumbnailPyramid
+from core.calibration import RollCalibrationProfile
+from core.recipe import TechnicalRecipe
 
 
 class TestProcessingDensity(unittest.TestCase):
@@ -61,3 +76,512 @@ class TestProcessingDensity(unittest.TestCase):
         # 期望一个非常大的数，而不是程序崩溃
         density = t_to_d(transmittance)
         self.assertTrue(np.all(density > 9)) # 1e-10的对数是10
+
+
+class TestDensityLut(unittest.TestCase):
+
+    def test_uint16_lookup_matches_direct_conversion(self):
+        """16位输入查表的结果与逐像素计算完全一致，查找表按参数缓存。"""
+        image = np.random.default_rng(0).integers(0, 65536, (37, 29, 3), dtype=np.uint16)
+        direct = density._dn_to_density_direct(image, b"icc", [1.0, 0.9, 0.8], 10)
+
+        density.density_lut.cache_clear()
+        np.testing.assert_array_equal(
+            density.dn_to_density(image, b"icc", [1.0, 0.9, 0.8]), direct
+        )
+        out = np.empty(image.shape, dtype=np.float32)
+        density.dn_to_density(image, b"icc", [1.0, 0.9, 0.8], out=out)
+        np.testing.assert_array_equal(out, direct.astype(np.float32))
+        self.assertEqual(density.density_lut.cache_info().misses, 1)
+
+
+class TestHistogramSketch(unittest.TestCase):
+    """测试可合并的直方图。"""
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.uniform(-0.5, 3.0, size=(64, 48, 3))
+        self.value_range = (-0.1, 2.6)
+
+    def test_add_matches_numpy_histogram(self):
+        """分通道和合计的计数应与np.histogram完全一致。"""
+        sketch = HistogramSketch(256, self.value_range, channels=3).add(self.values)
+
+        expected, edges = np.histogram(self.values, bins=256, range=self.value_range)
+        np.testing.assert_array_equal(sketch.channel_counts(), expected)
+        np.testing.assert_array_equal(sketch.bin_edges, edges)
+        for c in range(3):
+            expected_c, _ = np.histogram(self.values[..., c], bins=256, range=self.value_range)
+            np.testing.assert_array_equal(sketch.channel_counts(c), expected_c)
+
+    def test_merge_equals_single_add(self):
+        """分块统计后合并的结果应与一次性统计相同。"""
+        merged = HistogramSketch(256, self.value_range, channels=3)
+        for part in np.array_split(self.values, 5):
+            merged.merge(HistogramSketch(256, self.value_range, channels=3).add(part))
+
+        whole = HistogramSketch(256, self.value_range, channels=3).add(self.values)
+        np.testing.assert_array_equal(merged.counts, whole.counts)
+
+    def test_weighted_add_equals_repeated_values(self):
+        """带计数权重计入与把每个值重复计数次的结果相同。"""
+        values = self.values.reshape(-1, 3)[:500]
+        weights = np.random.default_rng(1).integers(0, 5, size=values.shape)
+        weighted = HistogramSketch(256, self.value_range, channels=3).add(values, weights=weights)
+        for c in range(3):
+            expected, _ = np.histogram(np.repeat(values[:, c], weights[:, c]),
+                                       bins=256, range=self.value_range)
+            np.testing.assert_array_equal(weighted.channel_counts(c), expected)
+
+    def test_merge_rejects_different_bins(self):
+        """bin划分不同的直方图不能合并。"""
+        sketch = HistogramSketch(256, self.value_range, channels=3)
+        with self.assertRaises(ValueError):
+            sketch.merge(HistogramSketch(128, self.value_range, channels=3))
+
+
+class TestPercentiles(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.lognormal(0.0, 0.7, (120, 80, 3))
+        self.percentiles = [0.0, 1.0, 50.0, 98.0, 99.999, 100.0]
+
+    def test_exact_matches_numpy(self):
+        np.testing.assert_array_equal(
+            histogram.percentiles(self.values, self.percentiles, method="exact"),
+            np.percentile(self.values, self.percentiles)
+        )
+        np.testing.assert_array_equal(
+            histogram.percentiles(self.values, self.percentiles, method="exact", per_channel=True),
+            np.percentile(self.values.reshape(-1, 3), self.percentiles, axis=0)
+        )
+
+    def test_extrema_density_uses_percentile_engine(self):
+        for percent in (0.01, 99.99):
+            np.testing.assert_array_equal(
+                density.get_extrema_density(self.values, percent=percent),
+                np.percentile(self.values.reshape(-1, 3), percent, axis=0)
+            )
+
+    def test_histogram_error_is_within_one_bin(self):
+        """直方图百分位与精确值的差不超过一个bin宽加上相邻样本间距。"""
+        bin_width = (self.values.max() - self.values.min()) / 1024
+        for per_channel in (False, True):
+            approximate = histogram.percentiles(
+                self.values, self.percentiles, bins_number=1024, per_channel=per_channel
+            )
+            exact = histogram.percentiles(
+                self.values, self.percentiles, method="exact", per_channel=per_channel
+            )
+            self.assertEqual(approximate.shape, exact.shape)
+
+            ordered = np.sort(self.values.reshape(-1, 3) if per_channel else self.values.reshape(-1), axis=0)
+            positions = np.asarray(self.percentiles) / 100 * (ordered.shape[0] - 1)
+            lower = np.clip(np.floor(positions).astype(int) - 1, 0, ordered.shape[0] - 1)
+            upper = np.clip(np.floor(positions).astype(int) + 2, 0, ordered.shape[0] - 1)
+            spacing = ordered[upper] - ordered[lower]
+            self.assertTrue(np.all(np.abs(approximate - exact) <= bin_width + spacing))
+
+
+class TestLutInterpolation(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.lut = rng.random((9, 9, 9, 3))
+        self.image = rng.uniform(-0.1, 1.1, (40, 30, 3))
+
+    def test_trilinear_matches_regular_grid_interpolator(self):
+        """三线性插值与scipy的RegularGridInterpolator一致，超出定义域按边界处理。"""
+        from scipy.interpolate import RegularGridInterpolator
+        grid = np.linspace(0.0, 1.0, 9)
+        reference = RegularGridInterpolator((grid, grid, grid), self.lut)(
+            np.clip(self.image, 0.0, 1.0).reshape(-1, 3)
+        ).reshape(self.image.shape)
+
+        result = conversion.apply_lut(self.image, self.lut, max_data=1.0, method="trilinear")
+        np.testing.assert_allclose(result, reference, rtol=0, atol=1e-12)
+
+    def test_tetrahedral_is_exact_on_lattice_and_for_linear_luts(self):
+        """四面体插值在格点上取LUT原值，对线性LUT（恒等）精确。"""
+        grid = np.linspace(0.0, 1.0, 9)
+        identity = np.stack(np.meshgrid(grid, grid, grid, indexing="ij"), axis=-1)
+        inside = np.clip(self.image, 0.0, 1.0)
+        result = conversion.apply_lut(inside, identity, max_data=1.0)
+        np.testing.assert_allclose(result, inside, rtol=0, atol=1e-12)
+
+        on_lattice = identity[2:5, 3:7, 1:4].copy()
+        result = conversion.apply_lut(on_lattice, self.lut, max_data=1.0)
+        np.testing.assert_allclose(result, self.lut[2:5, 3:7, 1:4], rtol=0, atol=1e-12)
+
+    def test_threaded_chunks_write_into_output(self):
+        """多线程分块执行写入预分配的输出，结果与单线程相同。"""
+        serial = conversion.apply_lut(self.image, self.lut, max_data=1.0)
+        out = np.empty(self.image.shape, dtype=np.float32)
+        result = conversion.apply_lut(self.image, self.lut, max_data=1.0,
+                                      out=out, workers=4, batch_size=97)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, serial, rtol=1e-6, atol=1e-6)
+
+    def test_zero_width_domain_maps_to_first_lattice_point(self):
+        """定义域宽度为0的通道（恒定通道、max_data为0）映射到格点0，不产生NaN。"""
+        for method in ("tetrahedral", "trilinear"):
+            result = conversion.apply_lut(np.zeros((4, 5, 3)), self.lut, max_data=0.0, method=method)
+            np.testing.assert_allclose(result, np.broadcast_to(self.lut[0, 0, 0], result.shape))
+
+        grid = np.linspace(0.0, 1.0, 9)
+        identity = np.stack(np.meshgrid(grid, grid, grid, indexing="ij"), axis=-1)
+        image = np.clip(self.image, 0.0, 1.0)
+        image[..., 1] = 0.5
+        result = conversion.apply_lut(image, identity, [0.0, 0.5, 0.0], [1.0, 0.5, 1.0], max_data=1.0)
+        self.assertFalse(np.isnan(result).any())
+        np.testing.assert_allclose(result[..., [0, 2]], image[..., [0, 2]], rtol=0, atol=1e-12)
+
+
+class TestLutRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cube_path = self.temp_dir / "test.cube"
+        # 2x2x2 LUT，输出为 (r, g, b) 格点坐标加上通道偏移，红色变化最快
+        lines = ["TITLE \"test\"", "LUT_3D_SIZE 2", "DOMAIN_MIN 0 0 0", "DOMAIN_MAX 1 1 2"]
+        for b in (0, 1):
+            for g in (0, 1):
+                for r in (0, 1):
+                    lines.append(f"{r} {g + 0.25} {b + 0.5}")
+        self.cube_path.write_text("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parse_orders_lut_as_rgb(self):
+        lut, domain_min, domain_max = conversion.load_lut_cube(self.cube_path)
+        self.assertEqual(lut.shape, (2, 2, 2, 3))
+        np.testing.assert_array_equal(lut[1, 0, 1], [1, 0.25, 1.5])
+        self.assertEqual(domain_max, [1.0, 1.0, 2.0])
+
+    def test_parses_once_then_memory_maps_sidecar(self):
+        """同一文件只解析一次，新的注册表直接映射旁路文件，文件修改后重新解析。"""
+        cache_dir = self.temp_dir / "cache"
+        with patch('processing.lut_cache.load_lut_cube', wraps=conversion.load_lut_cube) as parse:
+            registry = LutRegistry(cache_dir)
+            lut, _, domain_max = registry.get(self.cube_path)
+            self.assertIs(registry.get(self.cube_path)[0], lut)
+            self.assertEqual(parse.call_count, 1)
+
+            reloaded, _, _ = LutRegistry(cache_dir).get(self.cube_path)
+            self.assertEqual(parse.call_count, 1)
+            self.assertIsInstance(reloaded.base, np.memmap)
+            np.testing.assert_array_equal(reloaded, lut)
+            np.testing.assert_array_equal(domain_max, [1.0, 1.0, 2.0])
+
+            stat = self.cube_path.stat()
+            os.utime(self.cube_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            registry.get(self.cube_path)
+            self.assertEqual(parse.call_count, 2)
+
+    def test_lru_bound(self):
+        registry = LutRegistry(max_entries=1)
+        other = self.temp_dir / "other.cube"
+        shutil.copy(self.cube_path, other)
+        first = registry.get(self.cube_path)[0]
+        registry.get(other)
+        self.assertIsNot(registry.get(self.cube_path)[0], first)
+
+
+class TestTiffLoading(unittest.TestCase):
+
+    def setUp(self):
+        import tifffile
+        self.temp_dir = Path(tempfile.mkdtemp())
+        rng = np.random.default_rng(3)
+        self.image = rng.integers(0, 65536, (300, 200, 3), dtype=np.uint16)
+        self.paths = {
+            'strips': self.temp_dir / "strips.tif",
+            'zlib': self.temp_dir / "zlib.tif",
+            'tiles': self.temp_dir / "tiles.tif",
+            'pyramid': self.temp_dir / "pyramid.tif",
+        }
+        tifffile.imwrite(self.paths['strips'], self.image, rowsperstrip=32)
+        tifffile.imwrite(self.paths['zlib'], self.image, compression='zlib', rowsperstrip=32)
+        tifffile.imwrite(self.paths['tiles'], self.image, compression='zlib', tile=(64, 64))
+        with tifffile.TiffWriter(self.paths['pyramid']) as tif:
+            tif.write(self.image, subifds=1)
+            # 降分辨率层故意与全图内容不同，以确认读取的是该层
+            tif.write(np.full((150, 100, 3), 7, dtype=np.uint16), subfiletype=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_full_quality_memory_maps_uncompressed(self):
+        image = image_loader.read_image(self.paths['strips'])
+        self.assertIsInstance(image, np.memmap)
+        np.testing.assert_array_equal(image, self.image)
+        np.testing.assert_array_equal(image_loader.read_image(self.paths['tiles']), self.image)
+        for path in self.paths.values():
+            self.assertEqual(image_loader.read_image_info(path), (self.image.shape, np.dtype(np.uint16)))
+
+    def test_decimated_decode_matches_strided_full_decode(self):
+        """逐条带/逐块抽取的结果与完整解码后按步长取样一致。"""
+        for name in ('strips', 'zlib', 'tiles'):
+            thumbnail = image_loader.read_thumbnail(self.paths[name], (100, 100))
+            self.assertEqual(thumbnail.shape, (100, 67, 3))
+            self.assertEqual(thumbnail.dtype, np.uint16)
+            expected = image_loader.resize_to_fit(self.image[::2, ::2], (100, 67))
+            np.testing.assert_array_equal(thumbnail, expected)
+
+    def test_reduced_resolution_level_is_used(self):
+        thumbnail = image_loader.read_thumbnail(self.paths['pyramid'], (120, 120))
+        self.assertEqual(thumbnail.shape, (120, 80, 3))
+        self.assertTrue(np.all(thumbnail == 7))
+        # 目标大于降分辨率层时回到全分辨率
+        thumbnail = image_loader.read_thumbnail(self.paths['pyramid'], (400, 400))
+        np.testing.assert_array_equal(thumbnail, self.image)
+
+    def test_planar_separate_files(self):
+        """平面分离存储（未压缩可内存映射、压缩逐条带解码）按 (高, 宽, 通道) 返回。"""
+        import tifffile
+        image = np.random.default_rng(4).integers(0, 65536, (301, 203, 3), dtype=np.uint16)
+        for compression in (None, 'zlib'):
+            path = self.temp_dir / f"planar_{compression}.tif"
+            tifffile.imwrite(path, np.moveaxis(image, -1, 0), planarconfig='separate',
+                             photometric='rgb', compression=compression, rowsperstrip=32)
+
+            np.testing.assert_array_equal(image_loader.read_image(path), image)
+            self.assertEqual(image_loader.read_image_info(path), (image.shape, np.dtype(np.uint16)))
+            thumbnail = image_loader.read_thumbnail(path, (100, 100))
+            self.assertEqual(thumbnail.shape, (100, 67, 3))
+            expected = image_loader.resize_to_fit(image[::3, ::3], (100, 67))
+            np.testing.assert_array_equal(thumbnail, expected)
+
+
+class TestThumbnailPyramid(unittest.TestCase):
+
+    def setUp(self):
+        import tifffile
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.image_path = self.temp_dir / "frame_0.tif"
+        rng = np.random.default_rng(5)
+        self.image = rng.integers(0, 65536, (400, 300, 3), dtype=np.uint16)
+        tifffile.imwrite(self.image_path, self.image, compression='zlib')
+        self.pyramid = ThumbnailPyramid.for_roll(self.temp_dir, levels=(256, 128, 64))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_levels_are_built_once_and_memory_mapped(self):
+        with patch('processing.image_loader.read_thumbnail',
+                   wraps=image_loader.read_thumbnail) as read:
+            level = self.pyramid.get(self.image_path, (128, 128))
+            self.pyramid.get(self.image_path, (64, 100))
+            self.assertEqual(read.call_count, 1)
+
+        self.assertIsInstance(level, np.memmap)
+        self.assertEqual(level.shape, (128, 96, 3))
+        self.assertEqual(level.dtype, np.uint16)
+        paths = self.pyramid.ensure(self.image_path)
+        self.assertEqual([np.load(paths[l], mmap_mode='r').shape[0] for l in (256, 128, 64)],
+                         [256, 128, 64])
+        # 中间尺寸由上一级缩放得到，与read_thumbnail的尺寸语义一致
+        self.assertEqual(self.pyramid.get(self.image_path, (100, 100)).shape, (100, 75, 3))
+
+    def test_modified_source_is_rebuilt(self):
+        import tifffile
+        first = np.array(self.pyramid.get(self.image_path, (64, 64)))
+        tifffile.imwrite(self.image_path, np.zeros_like(self.image))
+        stat = self.image_path.stat()
+        os.utime(self.image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        rebuilt = self.pyramid.get(self.image_path, (64, 64))
+        self.assertTrue(first.any())
+        self.assertFalse(np.asarray(rebuilt).any())
+
+    def test_target_larger_than_pyramid_reads_source(self):
+        np.testing.assert_array_equal(self.pyramid.get(self.image_path, (400, 400)), self.image)
+        self.assertFalse(self.pyramid.cache_dir.exists())
+
+    def test_writable_checks_nearest_existing_directory(self):
+        self.assertTrue(self.pyramid.is_writable())
+        self.assertFalse(ThumbnailPyramid.for_roll(self.image_path).is_writable())
+        with patch('os.access', return_value=False):
+            self.assertFalse(self.pyramid.is_writable())
+
+
+class TestQuantization(unittest.TestCase):
+
+    def test_rounds_clips_and_writes_into_out(self):
+        image = np.array([[[-0.2, 0.0, 0.499 / 255]], [[0.501 / 255, 254.6 / 255, 1.3]]])
+        out = np.empty(image.shape, dtype=np.uint8)
+        result = image_export.to_uint8(image, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(result.reshape(-1), [0, 0, 0, 1, 255, 255])
+
+        image = np.random.default_rng(3).random((37, 23, 3))
+        np.testing.assert_array_equal(
+            image_export.to_uint16(image),
+            np.round(np.clip(image * 65535, 0, 65535)).astype(np.uint16)
+        )
+        with self.assertRaises(ValueError):
+            image_export.to_uint8(image, out=np.empty(image.shape, dtype=np.uint16))
+
+    def test_threaded_blocks_match_serial(self):
+        image = np.random.default_rng(4).random((1100, 400, 3))
+        np.testing.assert_array_equal(
+            image_export.quantize(image, 8, dither="blue_noise", workers=4),
+            image_export.to_uint8(image, dither="blue_noise")
+        )
+
+    def test_dither_preserves_mean_of_flat_areas(self):
+        # 介于两个码值之间的平坦区域：不抖动时全部舍入为同一值，抖动后均值保持不变
+        image = np.full((64, 64, 3), 100.25 / 255)
+        self.assertTrue(np.all(image_export.to_uint8(image) == 100))
+        for dither in image_export.DITHER_METHODS:
+            dithered = image_export.to_uint8(image, dither=dither)
+            self.assertEqual(set(np.unique(dithered)), {100, 101})
+            self.assertAlmostEqual(dithered.mean(), 100.25, places=6)
+
+        with self.assertRaises(ValueError):
+            image_export.to_uint8(image, dither="floyd")
+
+    def test_dithered_strips_continue_the_pattern(self):
+        import tifffile
+        image = np.random.default_rng(5).random((90, 40, 3))
+        temp_dir = Path(tempfile.mkdtemp())
+        try:
+            bounds = [0, 5, 33, 90]
+            image_export.write_tif_strips(
+                (image[start:stop] for start, stop in zip(bounds, bounds[1:])),
+                temp_dir / "proof.tif", image.shape, 8, None, tile=(32, 16), dither="ordered"
+            )
+            np.testing.assert_array_equal(tifffile.imread(temp_dir / "proof.tif"),
+                                          image_export.to_uint8(image, dither="ordered"))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestStreamingTiffWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.image = np.random.default_rng(7).random((70, 45, 3))
+        self.icc = b"icc-profile-bytes" * 8
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_uneven_strips_round_trip_with_icc(self):
+        import tifffile
+        path = self.temp_dir / "master.tif"
+        bounds = [0, 7, 20, 21, 64, 70]
+        strips = (self.image[start:stop] for start, stop in zip(bounds, bounds[1:]))
+        image_export.write_tif_strips(strips, path, self.image.shape, 16, self.icc,
+                                      compression='zlib', tile=(32, 16), maxworkers=2)
+
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            np.testing.assert_array_equal(page.asarray(), image_export.to_uint16(self.image))
+            self.assertEqual(page.tags['InterColorProfile'].value, self.icc)
+            self.assertEqual((page.tilelength, page.tilewidth), (32, 16))
+            self.assertEqual(page.predictor, 2)
+            self.assertFalse(tif.is_bigtiff)
+
+    def test_save_as_jpg_round_trips_icc(self):
+        from PIL import Image
+        path = self.temp_dir / "proof.jpg"
+        image_export.save_as_jpg(self.image, path, 90, self.icc)
+        with Image.open(path) as jpg:
+            self.assertEqual(jpg.info['icc_profile'], self.icc)
+            self.assertEqual(jpg.size, (45, 70))
+
+        image_export.save_as_jpg(self.image, path, 90, None)
+        with Image.open(path) as jpg:
+            self.assertNotIn('icc_profile', jpg.info)
+
+    def test_save_as_tif_honours_compression_and_bigtiff(self):
+        import tifffile
+        path = self.temp_dir / "proof.tif"
+        for compression in (None, 'none'):
+            image_export.save_as_tif(self.image, path, 8, self.icc, compression=compression)
+            with tifffile.TiffFile(path) as tif:
+                self.assertEqual(tif.pages[0].compression, 1)
+                self.assertFalse(tif.pages[0].is_tiled)
+                np.testing.assert_array_equal(tif.asarray(), image_export.to_uint8(self.image))
+
+        bounds = [0, 7, 20, 70]
+        strips = (self.image[start:stop] for start, stop in zip(bounds, bounds[1:]))
+        image_export.write_tif_strips(strips, path, self.image.shape, 16, None, compression='zlib')
+        with tifffile.TiffFile(path) as tif:
+            self.assertEqual(tif.pages[0].compression, 8)
+            self.assertFalse(tif.pages[0].is_tiled)
+            np.testing.assert_array_equal(tif.asarray(), image_export.to_uint16(self.image))
+
+        image_export.write_tif_strips([self.image], path, self.image.shape, 16, None, bigtiff=True)
+        with tifffile.TiffFile(path) as tif:
+            self.assertTrue(tif.is_bigtiff)
+
+    def test_missing_rows_are_rejected(self):
+        with self.assertRaises(ValueError):
+            image_export.write_tif_strips([self.image[:50]], self.temp_dir / "short.tif",
+                                          self.image.shape, 16, None)
+
+
+class TestProfileCache(unittest.TestCase):
+    """测试校准配置文件的二进制缓存格式。"""
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.file_path = self.temp_dir / "test.profile.npz"
+        rng = np.random.default_rng(0)
+        self.profile = RollCalibrationProfile(
+            d_min=rng.random(3),
+            d_max=rng.random(3) + 1.0,
+            hist_bins=np.linspace(-0.1, 2.9, 1024),
+            hist_values=rng.random(1024) * 1e4,
+            k_values=rng.random(3),
+            extrema_high_density_net=float(rng.random()),
+            clip_threshold=float(rng.random()),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip_is_exact(self):
+        """保存后再加载应得到逐位相同的配置文件。"""
+        cache_utils.save_profile(self.profile, self.file_path)
+        loaded = cache_utils.load_profile(self.file_path)
+
+        for name in ('d_min', 'd_max', 'hist_bins', 'hist_values', 'k_values'):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(self.profile, name))
+        self.assertEqual(loaded.extrema_high_density_net, self.profile.extrema_high_density_net)
+        self.assertEqual(loaded.clip_threshold, self.profile.clip_threshold)
+        self.assertEqual(list(self.temp_dir.iterdir()), [self.file_path])
+
+    def test_version_mismatch_is_a_miss(self):
+        """格式版本不同或文件不存在时视为缓存未命中。"""
+        self.assertIsNone(cache_utils.load_profile(self.file_path))
+        with patch.object(cache_utils, 'PROFILE_FORMAT_VERSION', 0):
+            cache_utils.save_profile(self.profile, self.file_path)
+        self.assertIsNone(cache_utils.load_profile(self.file_path))
+
+
+class TestRecipeKey(unittest.TestCase):
+    """测试规范化的配方指纹。"""
+    def test_key_ignores_fields_irrelevant_to_analysis(self):
+        """只用于渲染的字段改变时，分析缓存键不变。"""
+        recipe = TechnicalRecipe()
+        key = cache_utils.generate_recipe_key(recipe)
+
+        recipe.manual_d_min = np.array([0.2, 0.5, 0.9])
+        recipe.threshold_percentile = 95.0
+        self.assertEqual(cache_utils.generate_recipe_key(recipe), key)
+
+        with np.printoptions(precision=2, threshold=1):
+            self.assertEqual(cache_utils.generate_recipe_key(TechnicalRecipe()), key)
+
+    def test_key_uses_exact_float_bytes(self):
+        """分析相关字段的最小变化也会改变缓存键。"""
+        recipe = TechnicalRecipe()
+        key = cache_utils.generate_recipe_key(recipe)
+
+        recipe.dmin_percentile = np.nextafter(recipe.dmin_percentile, np.inf)
+        self.assertNotEqual(cache_utils.generate_recipe_key(recipe), key)
+
+        recipe = TechnicalRecipe(light_ratio=[1.0, 1.0, 1.0 + 1e-15])
+        self.assertNotEqual(cache_utils.generate_recipe_key(recipe), key)